@@ -120,6 +120,8 @@ fi
 
 
 # --- MAIN PROGRAM ---
+export HDF5_CHROM_JOBS="${SLURM_CPUS_PER_TASK:-1}" # chromosomes of a file read concurrently
+export HDF5_MEMORY_CACHE="8G" # background and explain hdf5s are often the same files
 set +e
 
 # usage: compute_shaps.py [-h] -m {NN,LGBM} --background_hdf5 background-hdf5 --explain_hdf5 explain-hdf5 --chromsize CHROMSIZE [-l LOGDIR] [-o --output-name]
@@ -78,6 +78,12 @@ list_name="${basename}" # IMPORTANT
 export LAYER_SIZE="3000" # IMPORTANT
 export NB_LAYER="1"
 
+export HDF5_LOADER_JOBS="${SLURM_CPUS_PER_TASK:-1}" # number of hdf5 files loaded in parallel
+# export HDF5_CACHE_DIR="${HOME}/scratch/signal_cache" # reuse loaded signals between jobs
+# export HDF5_LOADER_DTYPE="float16" # or "int8", reduced precision signals (see epi_ml/utils/quantization_report.py)
+# export HDF5_STAGE_DIR="${SLURM_TMPDIR}/hdf5s" # copy hdf5s to local scratch in the background while loading
+# export HDF5_MEMORY_POLICY="fail" # fail before loading if signals do not fit in SLURM_MEM_PER_NODE, instead of memory-mapping them
+
 log="${output_path}/${release}/${assembly}_${basename}/${category}_${NB_LAYER}l_${LAYER_SIZE}n" # IMPORTANT# IMPORTANT# IMPORTANT# IMPORTANT
 log="${log}/10fold-oversampling"
 
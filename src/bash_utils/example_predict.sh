@@ -74,6 +74,8 @@ printf '%s\n' "python ${program_path}/utils/check_dir.py --exists ${model}"
 python ${program_path}/utils/check_dir.py --exists ${model}
 
 
+export HDF5_CHROM_JOBS="${SLURM_CPUS_PER_TASK:-1}" # chromosomes of a file read concurrently
+
 # --- launch ---
 printf '\n%s\n' "Launching following command"
 printf '%s\n' "python ${program_path}/predict.py ${hdf5_list} ${chromsizes} ${log} --model ${model} > ${out1} 2> ${out2}"
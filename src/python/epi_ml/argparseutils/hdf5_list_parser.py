@@ -0,0 +1,25 @@
+"""Argument parser shared by the scripts processing an hdf5 list by batches of files."""
+from pathlib import Path
+
+from epi_ml.argparseutils.DefaultHelpParser import DefaultHelpParser as ArgumentParser
+
+
+def hdf5_list_parser(output_help: str) -> ArgumentParser:
+    """Return a parser with the hdf5 list, chromsize and output positional arguments,
+    and the --batch-size option. Scripts add their own arguments to it.
+    """
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument(
+        "hdf5_list", type=Path, help="A file with hdf5 filenames. Use absolute path!"
+    )
+    arg_parser.add_argument(
+        "chromsize", type=Path, help="A file with chrom sizes, defines the chromosomes."
+    )
+    arg_parser.add_argument("output", type=Path, help=output_help)
+    arg_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=256,
+        help="Number of files loaded in memory at once.",
+    )
+    return arg_parser
@@ -74,29 +74,18 @@ def compute_shap(
         output_name (str): Output name for the SHAP values.
         background_required (bool, optional): Whether the background dataset is required. Defaults to False.
     """
-    signals = {}
     hdf5_loader = Hdf5Loader(chrom_file=cli.chromsize, normalization=True)
 
-    hdf5_loader.load_hdf5s(cli.background_hdf5, strict=True)
-    signals["background"] = hdf5_loader.signals
-
-    hdf5_loader.load_hdf5s(cli.explain_hdf5, strict=True)
-    signals["explain"] = hdf5_loader.signals
-
-    background_set = UnknownData(
-        list(signals["background"].keys()),
-        list(signals["background"].values()),
-        None,
-        None,
+    background_signals, background_md5s = hdf5_loader.load_hdf5s_matrix(
+        cli.background_hdf5, strict=True
     )
-
-    explain_set = UnknownData(
-        list(signals["explain"].keys()),
-        list(signals["explain"].values()),
-        None,
-        None,
+    explain_signals, explain_md5s = hdf5_loader.load_hdf5s_matrix(
+        cli.explain_hdf5, strict=True
     )
 
+    background_set = UnknownData(background_md5s, background_signals, None, None)
+    explain_set = UnknownData(explain_md5s, explain_signals, None, None)
+
     shap_computer.compute_shaps(
         background_dset=background_set,
         evaluation_dset=explain_set,
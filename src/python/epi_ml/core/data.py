@@ -4,7 +4,6 @@ from __future__ import annotations
 
 import abc
 import collections
-import copy
 import math
 from typing import Dict, List, Tuple
 
@@ -12,24 +11,46 @@ import numpy as np
 import torch
 from imblearn.over_sampling import RandomOverSampler
 from sklearn import preprocessing
-from torch.utils.data import DataLoader, TensorDataset
+from torch.utils.data import DataLoader, Dataset, TensorDataset
 
 from .data_source import EpiDataSource
 from .hdf5_loader import Hdf5Loader
 from .metadata import Metadata
+from .quantization import QuantizedSignals, to_float32
+from .signal_store import SignalStore
+from .signal_view import SignalView
 
 
 class Data(abc.ABC):
     """Generalized object to deal with numerical data.
 
     Does not have metadata.
+
+    If x is already a float32 array (e.g. from Hdf5Loader.load_hdf5s_matrix),
+    it is used as is and not copied.
+
+    Subsamples are index views over the signals of their parent (see SignalView),
+    shuffling also only reorders row indexes, so the signals matrix is shared
+    and never moved. A contiguous copy is only made when signals are accessed
+    as a whole (signals property). Batches are gathered from the shared matrix (signal_rows).
+
+    If x is a SignalStore, signals are only read when first accessed,
+    and subsamples stay lazy.
+
+    Reduced precision signals (float16 array or QuantizedSignals) are also kept as is,
+    and only widened to float32 by batch (see create_torch_datasets).
     """
 
     # TODO: actually make a data class without any true labels which is supported within analysis.
     def __init__(self, ids, x, y, y_str):
         self._ids = ids
         self._num_examples = len(x)
-        self._signals = np.array(x, dtype=np.float32)
+        if isinstance(x, (SignalStore, QuantizedSignals, SignalView)):
+            self._signals = x
+        else:
+            self._signals = np.asanyarray(x)  # keeps SharedMatrix
+            if self._signals.dtype != np.float16:
+                self._signals = self._signals.astype(np.float32, copy=False)
         self._labels = np.array(y)
         self._labels_str = y_str
         self._shuffle_order = np.arange(
@@ -51,12 +72,50 @@ class Data(abc.ABC):
 
     @property
     def signals(self) -> np.ndarray:
-        """Return signals in current order."""
+        """Return signals in current order, as a contiguous matrix.
+
+        Lazy signals are read, and index views are copied, once.
+        """
+        if isinstance(self._signals, (SignalStore, SignalView)):
+            self._signals = self._signals.materialize()
         return self._signals
 
+    @property
+    def signal_rows(self) -> np.ndarray | QuantizedSignals | SignalView:
+        """Return signals in current order, without copying index views.
+
+        Indexing rows (e.g. a batch) of the returned matrix gathers them from the shared matrix.
+        Lazy signals are read, repeated rows are not copied (see SignalStore.load_rows).
+        """
+        if isinstance(self._signals, SignalStore):
+            self._signals = self._signals.load_rows()
+        return self._signals
+
+    def weighted_signals(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        """Return (signals, encoded labels, sample weights) with repeated examples
+        (e.g. oversampled) kept once, and weighted by their number of repetitions.
+
+        Only the distinct rows of index views are copied. Weights are None if no
+        example is repeated, the signals are then the same as the signals property.
+        """
+        signals = self.signal_rows
+        if isinstance(signals, SignalView):
+            _, first, counts = np.unique(
+                signals.rows, return_index=True, return_counts=True
+            )
+            if len(first) < len(signals):
+                order = np.argsort(first)  # keep current order
+                first = first[order]
+                return (
+                    np.take(signals, first, axis=0).materialize(),
+                    self._labels[first],
+                    counts[order].astype(np.float64),
+                )
+        return self.signals, self._labels, None
+
     def get_signal(self, index: int):
         """Return current signal at given position. (signals can be shuffled)"""
-        return self._signals[index]  # type: ignore
+        return self.signal_rows[index]  # type: ignore
 
     @property
     def encoded_labels(self) -> np.ndarray:
@@ -97,7 +156,7 @@ class Data(abc.ABC):
 
     def preprocess(self, f):
         """Apply a preprocessing function on signals."""
-        self._signals = np.apply_along_axis(f, 1, self._signals)
+        self._signals = np.apply_along_axis(f, 1, self.signals)
 
     def next_batch(self, batch_size, shuffle=True):
         """Return next (signals, targets) batch"""
@@ -110,15 +169,21 @@ class Data(abc.ABC):
         start = self._index
         self._index += batch_size
         end = self._index
-        return self._signals[start:end], self._labels[start:end]
+        return self.signal_rows[start:end], self._labels[start:end]
 
     def _shuffle(self, seed=False):
         """Shuffle signals and labels together"""
         if seed:
             np.random.seed(42)
 
+        # Shuffle row indexes, the signals can be shared with other subsamples.
+        signals = self.signal_rows
+        if not isinstance(signals, SignalView):
+            signals = self._signals = SignalView(signals, np.arange(len(signals)))
+        signal_arrays = [signals.rows]
+
         rng_state = np.random.get_state()
-        for array in [self._shuffle_order, self._signals, self._labels]:
+        for array in [self._shuffle_order, *signal_arrays, self._labels]:
             np.random.shuffle(array)
             np.random.set_state(rng_state)
 
@@ -126,6 +191,14 @@ class Data(abc.ABC):
         """Shuffle signals and labels together"""
         self._shuffle(seed)
 
+    def _subsample_signals(self, idxs: List[int]) -> SignalStore | SignalView:
+        """Return the signals at given positions, as a view of the current signals
+        (lazy signals stay lazy), without copying them.
+        """
+        if isinstance(self._signals, SignalStore):
+            return np.take(self._signals, idxs, axis=0)  # type: ignore
+        return SignalView.of(self._signals, idxs)
+
     @abc.abstractmethod
     def subsample(self, idxs: List[int]):
         raise NotImplementedError("This is an abstract method. Use child class.")
@@ -180,15 +253,11 @@ class KnownData(Data):
         """
         try:
             new_ids = np.take(self.ids, idxs, axis=0)
-            new_signals = np.take(self.signals, idxs, axis=0)
+            new_signals = self._subsample_signals(idxs)
             new_targets = np.take(self.encoded_labels, idxs, axis=0)
             new_str_targets = np.take(self.original_labels, idxs, axis=0)
 
-            new_meta = copy.deepcopy(self.metadata)
-            ok_md5 = set(new_ids)
-            for md5 in list(new_meta.md5s):
-                if md5 not in ok_md5:
-                    del new_meta[md5]
+            new_meta = self.metadata.copy(md5s=new_ids)
         except IndexError as e:
             if len(self) == 0:
                 print("Empty Data object, cannot subsample.")
@@ -228,7 +297,7 @@ class UnknownData(Data):
         """
         try:
             new_ids = np.take(self.ids, idxs, axis=0)
-            new_signals = np.take(self.signals, idxs, axis=0)
+            new_signals = self._subsample_signals(idxs)
             new_targets = np.take(self.encoded_labels, idxs, axis=0)
             new_str_targets = np.take(self.original_labels, idxs, axis=0)
         except IndexError as e:
@@ -404,9 +473,17 @@ class EpiData(object):
         self._keep_meta_overlap()
         self._metadata.remove_small_classes(min_class_size, self._label_category)
 
+        # The split sets copy all signals, oversampled training signals are index views.
+        copies = 1.0
+
         self._hdf5s = (
             Hdf5Loader(datasource.chromsize_file, normalization)
-            .load_hdf5s(datasource.hdf5_file, md5s=self._files.keys(), strict=True)
+            .load_hdf5s(
+                datasource.hdf5_file,
+                md5s=self._files.keys(),
+                strict=True,
+                copies=copies,
+            )
             .signals
         )
 
@@ -556,12 +633,6 @@ class EpiData(object):
         ]
         test_labels = [self._metadata[md5][self._label_category] for md5 in test_md5s]
 
-        if self._oversample:
-            train_signals, train_labels, idxs = EpiData.oversample_data(
-                train_signals, train_labels
-            )
-            train_md5s = np.take(train_md5s, idxs, axis=0)
-
         encoded_labels = [
             encoder(labels) for labels in [train_labels, validation_labels, test_labels]
         ]
@@ -569,6 +640,17 @@ class EpiData(object):
         self._train = KnownData(
             train_md5s, train_signals, encoded_labels[0], train_labels, self._metadata
         )
+        if self._oversample:
+            # index view, oversampled signals are not copied
+            idxs = EpiData.oversample_idxs(train_labels)
+            train_labels = np.take(train_labels, idxs, axis=0)
+            self._train = KnownData(
+                np.take(train_md5s, idxs, axis=0),
+                SignalView.of(self._train.signal_rows, idxs),
+                np.take(encoded_labels[0], idxs, axis=0),
+                train_labels,
+                self._metadata,
+            )
         self._validation = KnownData(
             validation_md5s,
             validation_signals,
@@ -591,18 +673,56 @@ class EpiData(object):
         X_resampled, y_resampled = ros.fit_resample(X, y)  # type: ignore
         return X_resampled, y_resampled, ros.sample_indices_
 
+    @staticmethod
+    def oversample_idxs(y) -> np.ndarray:
+        """Return the sampled indexes of oversampled data, without resampling signals. y=targets."""
+        ros = RandomOverSampler(random_state=42)
+        ros.fit_resample(np.empty((len(y), 1)), y)
+        return ros.sample_indices_
+
+
+class SignalDataset(Dataset):
+    """Torch dataset of reduced precision signals or index views (see Data), gathered
+    and widened to float32 one batch at a time, so the whole float32 matrix is never created.
+    """
+
+    def __init__(
+        self, signals: np.ndarray | QuantizedSignals | SignalView, labels: np.ndarray
+    ):
+        self._signals = signals
+        self._labels = torch.from_numpy(labels)
+
+    def __len__(self) -> int:
+        return len(self._signals)
+
+    def __getitem__(self, index: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        return torch.from_numpy(to_float32(self._signals[index])), self._labels[index]
+
+    def __getitems__(self, indexes: List[int]) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+        """Return a batch of examples, widened together."""
+        signals = torch.from_numpy(to_float32(self._signals[indexes]))
+        return list(zip(signals, self._labels[indexes]))
+
 
 def create_torch_datasets(
     data: DataSet, bs: int
-) -> Dict[str, Tuple[TensorDataset, DataLoader]]:
-    """Return (dataset, DataLoader) pairs for non empty sets."""
+) -> Dict[str, Tuple[TensorDataset | SignalDataset, DataLoader]]:
+    """Return (dataset, DataLoader) pairs for non empty sets.
+
+    Reduced precision signals and index views (e.g. fold subsamples) give SignalDatasets,
+    gathered and widened to float32 by batch.
+    """
     torch_dsets = []
     for data_split in [data.train, data.validation, data.test]:
         try:
-            dset = TensorDataset(
-                torch.from_numpy(data_split.signals).float(),
-                torch.from_numpy(data_split.encoded_labels),
-            )
+            signals = data_split.signal_rows
+            if isinstance(signals, np.ndarray) and signals.dtype == np.float32:
+                dset = TensorDataset(
+                    torch.from_numpy(signals).float(),
+                    torch.from_numpy(data_split.encoded_labels),
+                )
+            else:
+                dset = SignalDataset(signals, data_split.encoded_labels)
             torch_dsets.append(dset)
         except AttributeError:
             torch_dsets.append(None)
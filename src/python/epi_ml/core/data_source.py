@@ -8,6 +8,8 @@ from typing import List, Tuple
 
 import h5py
 
+from epi_ml.core.hdf5_bundle import Hdf5Bundle
+
 HDF5_RESOLUTION = {"1kb": 1000, "10kb": 10000, "100kb": 100000, "1mb": 1000000}
 
 
@@ -51,6 +53,8 @@ class EpiDataSource:
 
     def hdf5_resolution(self) -> int:
         """Return resolution as an integer."""
+        if Hdf5Bundle.is_bundle(self.hdf5_file):
+            return Hdf5Bundle(self.hdf5_file).resolution
         with open(self.hdf5_file, "r", encoding="utf-8") as my_file:
             first_path = Path(next(my_file).rstrip())
             try:
@@ -3,9 +3,10 @@
 # TODO: Proper Data vs TestData typing
 from __future__ import annotations
 
-import copy
+import contextlib
 import itertools
-from typing import Any, Dict, Generator, List, Tuple
+from pathlib import Path
+from typing import Any, Dict, Generator, Iterator, List, Tuple
 
 import numpy as np
 import numpy.typing as npt
@@ -14,8 +15,12 @@ from sklearn.model_selection import StratifiedGroupKFold, StratifiedKFold
 
 from epi_ml.core import data
 from epi_ml.core.data_source import EpiDataSource
+from epi_ml.core.fold_manifest import Fold, FoldManifest
 from epi_ml.core.hdf5_loader import Hdf5Loader
 from epi_ml.core.metadata import UUIDMetadata
+from epi_ml.core.shared_signals import share_signals
+from epi_ml.core.signal_store import SignalStore
+from epi_ml.core.signal_view import SignalView
 
 TRACKS_MAPPING = {
     "raw": ["pval", "fc"],
@@ -28,6 +33,8 @@ ACCEPTED_TRACKS = list(TRACKS_MAPPING.keys()) + list(
     itertools.chain.from_iterable(TRACKS_MAPPING.values())
 )
 
+RANDOM_STATE = 42  # of fold splits and oversampling
+
 LEADER_TRACKS = frozenset(["raw", "Unique_plusRaw", "gembs_pos"])
 OTHER_TRACKS = frozenset(ACCEPTED_TRACKS) - LEADER_TRACKS
 
@@ -36,6 +43,37 @@ NDArrayInt = npt.NDArray[np.int_]
 NDArrayBool = npt.NDArray[np.bool_]
 
 
+class UUIDGroups:
+    """Sample indexes grouped by uuid, sorted once (argsort + group offsets),
+    to map uuid indexes back to sample indexes without scanning all samples per uuid.
+
+    uuids_inverse: uuid index of each sample, e.g. from np.unique(..., return_inverse=True).
+    """
+
+    def __init__(self, uuids_inverse: NDArrayInt):
+        uuids_inverse = np.asarray(uuids_inverse, dtype=np.int64).reshape(-1)
+        self._order = np.argsort(uuids_inverse, kind="stable")
+        self._counts = np.bincount(uuids_inverse)
+        self._starts = np.cumsum(self._counts) - self._counts
+
+    def first_samples(self) -> NDArrayInt:
+        """Return the first sample index of each uuid."""
+        return self._order[self._starts]
+
+    def samples(self, uuid_idxs) -> NDArrayInt:
+        """Return the sample indexes of given uuid indexes, in the given uuid order.
+
+        Same as concatenating np.where(uuids_inverse == idx)[0] for each idx.
+        """
+        uuid_idxs = np.asarray(uuid_idxs, dtype=np.int64).reshape(-1)
+        counts = self._counts[uuid_idxs]
+        group_ends = np.cumsum(counts)
+        positions = np.arange(group_ends[-1] if len(group_ends) else 0) + np.repeat(
+            self._starts[uuid_idxs] - (group_ends - counts), counts
+        )
+        return self._order[positions]
+
+
 class EpiAtlasDataset:
     """Class that handles how epiatlas data signals are linked together.
 
@@ -56,6 +94,17 @@ class EpiAtlasDataset:
         If True, will filter the metadata even if md5_list is given. If False, will not filter the metadata if md5_list.
     metadata : UUIDMetadata, optional
         If given, will use this metadata instead of loading it from the datasource.
+    lazy_signals : bool, optional
+        If True, signals are only read when a subsample of the dataset needs them,
+        e.g. the training set of one split. See SignalStore.
+    shared_memory : bool, optional
+        If True, signals are loaded into shared memory files (see shared_matrix), so
+        that EpiAtlasFoldFactory.shared_signals does not copy them. Not with lazy_signals.
+
+    Raises
+    ------
+    ValueError
+        If both lazy_signals and shared_memory are True.
     """
 
     def __init__(
@@ -67,10 +116,16 @@ class EpiAtlasDataset:
         md5_list: List[str] | None = None,
         force_filter: bool = True,
         metadata: UUIDMetadata | None = None,
+        lazy_signals: bool = False,
+        shared_memory: bool = False,
     ):
+        if lazy_signals and shared_memory:
+            raise ValueError("Lazy signals cannot be loaded into shared memory.")
         self._datasource = datasource
         self._label_category = label_category
         self._label_list = label_list
+        self._lazy_signals = lazy_signals
+        self._shared_memory = shared_memory
 
         # Load metadata
         meta = metadata
@@ -96,14 +151,14 @@ class EpiAtlasDataset:
         self._uuid_mapping = self._metadata.uuid_to_md5()
 
         # Load signals and create proper dataset
-        self._signals = self._load_signals()
+        md5s, signal_matrix = self._load_signals()
+        self._signals = None
 
-        md5s = list(self._signals.keys())
         labels = [self._metadata[md5][self._label_category] for md5 in md5s]
 
         self._dataset: data.KnownData = data.KnownData(
             ids=md5s,
-            x=list(self._signals.values()),
+            x=signal_matrix,
             y_str=labels,
             y=[self._classes_mapping[label] for label in labels],
             metadata=self._metadata,
@@ -131,12 +186,14 @@ class EpiAtlasDataset:
 
     @property
     def metadata(self) -> UUIDMetadata:
-        """Return a copy of current metadata held"""
-        return copy.deepcopy(self._metadata)
+        """Return a copy of current metadata held (copy-on-write)"""
+        return self._metadata.copy()
 
     @property
     def signals(self) -> Dict[str, np.ndarray]:
-        """Return loaded signals."""
+        """Return loaded signals. Reads them if the signals are lazy."""
+        if self._signals is None:
+            self._signals = dict(zip(self._dataset.ids, self._dataset.signals))
         return self._signals
 
     @property
@@ -144,16 +201,33 @@ class EpiAtlasDataset:
         """Return dataset."""
         return self._dataset
 
-    def _load_signals(self) -> Dict[str, np.ndarray]:
-        """Load signals from given datasource."""
+    def _load_signals(self) -> Tuple[List[str], np.ndarray | SignalStore]:
+        """Load signals from given datasource.
+
+        Return the md5s and the (n_md5s, n_bins) signal matrix, in the same order.
+        The matrix is a SignalStore if signals are lazy.
+
+        The memory check of the loader counts one copy of the matrix, made by the
+        distinct training and validation signals of a split (see Data.weighted_signals).
+        """
         loader = Hdf5Loader(chrom_file=self.datasource.chromsize_file, normalization=True)
-        loader = loader.load_hdf5s(
+        if self._lazy_signals:
+            signal_store = loader.lazy_load_hdf5s(
+                data_file=self.datasource.hdf5_file,
+                md5s=list(self._metadata.md5s),
+                verbose=True,
+            )
+            return signal_store.md5s, signal_store
+
+        signal_matrix, md5s = loader.load_hdf5s_matrix(
             data_file=self.datasource.hdf5_file,
-            md5s=self.metadata.md5s,
+            md5s=list(self._metadata.md5s),
             strict=True,
             verbose=True,
+            copies=1,
+            shared=self._shared_memory,
         )
-        return loader.signals
+        return md5s, signal_matrix
 
     def _filter_metadata(
         self, min_class_size: int, metadata: UUIDMetadata, verbose: bool
@@ -195,9 +269,10 @@ class EpiAtlasMetadata(EpiAtlasDataset):
         If given, will use this metadata instead of loading it from the datasource.
     """
 
-    def _load_signals(self) -> Dict[str, np.ndarray]:
+    def _load_signals(self) -> Tuple[List[str], np.ndarray]:
         """Load empty signals as no signals are needed for metadata."""
-        return {md5: np.ndarray(0) for md5 in self._metadata.md5s}
+        md5s = list(self._metadata.md5s)
+        return md5s, np.empty(shape=(len(md5s), 0), dtype=np.float32)
 
 
 class EpiAtlasFoldFactory:
@@ -235,6 +310,8 @@ class EpiAtlasFoldFactory:
         if len(self._train_val) == 0:
             raise ValueError("No data in training and validation.")
 
+        self._folds: Dict[bool, List[Fold]] = {}  # per oversample value
+
     @classmethod
     def from_datasource(
         cls,
@@ -247,6 +324,8 @@ class EpiAtlasFoldFactory:
         md5_list: List[str] | None = None,
         force_filter: bool = True,
         metadata: UUIDMetadata | None = None,
+        lazy_signals: bool = False,
+        shared_memory: bool = False,
     ):
         """Create EpiAtlasFoldFactory from a given EpiDataSource,
         directly create the intermediary EpiAtlasDataset. See
@@ -260,6 +339,8 @@ class EpiAtlasFoldFactory:
             md5_list,
             force_filter,
             metadata,
+            lazy_signals,
+            shared_memory,
         )
         return cls(epiatlas_dataset, n_fold, test_ratio)
 
@@ -288,6 +369,26 @@ class EpiAtlasFoldFactory:
         """Returns test dataset, not used in cross-validation."""
         return self._test
 
+    def signal_bytes(self) -> int:
+        """Returns the size of the training and validation signals, e.g. in shared memory.
+
+        Only the distinct rows of an index view are counted, as in share_signals.
+        """
+        signals = self._train_val.signal_rows
+        if isinstance(signals, SignalView):
+            matrix = signals.matrix
+            return matrix.nbytes * len(np.unique(signals.rows)) // max(len(matrix), 1)
+        return signals.nbytes
+
+    def fold_bytes(self) -> Tuple[int, int]:
+        """Returns the estimated size of the training and validation signals of one split,
+        as contiguous float32 matrices. Repeated (oversampled) rows are counted once.
+        """
+        n_signals, n_bins = self._train_val.signal_rows.shape
+        n_valid = -(-n_signals // self.k)
+        row_bytes = n_bins * np.dtype(np.float32).itemsize
+        return (n_signals - n_signals // self.k) * row_bytes, n_valid * row_bytes
+
     @staticmethod
     def _label_uuid(dset: data.KnownData) -> Tuple[NDArray, NDArray, NDArrayInt]:
         """Return uuids, unique uuids and uuid to int mapping (for stratified group k-fold)
@@ -322,80 +423,163 @@ class EpiAtlasFoldFactory:
         self, dset: data.KnownData, n_splits: int
     ) -> Generator[Tuple[data.KnownData, data.KnownData], None, None]:
         """Split dataset by track_type. Oversampling not implemented."""
+        for train_idxs, valid_idxs in self._split_by_track_type_idxs(dset, n_splits):
+            yield dset.subsample(list(train_idxs)), dset.subsample(list(valid_idxs))
+
+    def _split_by_track_type_idxs(
+        self, dset: data.KnownData, n_splits: int
+    ) -> Generator[Fold, None, None]:
+        """Yield (train, valid) sample indexes of dataset split by track_type."""
         _, _, uuids_inverse = self._label_uuid(dset)
 
         # forcing track type as the class label
         labels = [dset.metadata[md5]["track_type"] for md5 in dset.ids]
 
-        skf = StratifiedGroupKFold(n_splits=n_splits, shuffle=True, random_state=42)
+        skf = StratifiedGroupKFold(
+            n_splits=n_splits, shuffle=True, random_state=RANDOM_STATE
+        )
         for train_idxs, valid_idxs in skf.split(
-            X=dset.signals, y=labels, groups=uuids_inverse
+            X=np.empty(shape=(len(dset), 0)), y=labels, groups=uuids_inverse
         ):
-            train_set = dset.subsample(list(train_idxs))
-            valid_set = dset.subsample(list(valid_idxs))
-
-            yield train_set, valid_set
+            yield train_idxs, valid_idxs
 
     def _split_dataset(
         self, dset: data.KnownData, n_splits: int, oversample: bool = False
     ) -> Generator[Tuple[data.KnownData, data.KnownData], None, None]:
+        for train_idxs, valid_idxs in self._split_dataset_idxs(
+            dset, n_splits, oversample
+        ):
+            yield dset.subsample(list(train_idxs)), dset.subsample(list(valid_idxs))
+
+    def _split_dataset_idxs(
+        self, dset: data.KnownData, n_splits: int, oversample: bool = False
+    ) -> Generator[Fold, None, None]:
+        """Yield (train, valid) sample indexes of dataset split by uuid,
+        the training indexes oversampled by uuid if asked.
+        """
         # Convert the labels and groups (uuids) into numpy arrays
-        uuids, uuids_unique, uuids_inverse = self._label_uuid(dset)
-        labels_unique = [
-            dset.encoded_labels[uuids == uuid][0] for uuid in uuids_unique
+        _, uuids_unique, uuids_inverse = self._label_uuid(dset)
+        uuid_groups = UUIDGroups(uuids_inverse)
+        labels_unique = dset.encoded_labels[
+            uuid_groups.first_samples()
         ]  # assuming all samples from the same UUID share the same label --> not true for track_type
 
-        skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+        skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=RANDOM_STATE)
         for train_idxs_unique, valid_idxs_unique in skf.split(
-            X=np.empty(shape=(len(uuids_unique), dset.signals.shape[1])),
+            X=np.empty(shape=(len(uuids_unique), 0)),
             y=labels_unique,
         ):
-            train_idxs: NDArrayInt = np.concatenate(
-                [np.where(uuids_inverse == idx)[0] for idx in train_idxs_unique]
-            )
-            valid_idxs: NDArrayInt = np.concatenate(
-                [np.where(uuids_inverse == idx)[0] for idx in valid_idxs_unique]
-            )
+            train_idxs: NDArrayInt = uuid_groups.samples(train_idxs_unique)
+            valid_idxs: NDArrayInt = uuid_groups.samples(valid_idxs_unique)
 
             if oversample:
                 # Oversample in the UUID space, not the sample space
-                ros = RandomOverSampler(random_state=42)
-                train_uuids_resampled, _ = ros.fit_resample(  # type: ignore
-                    np.array(uuids_unique[train_idxs_unique]).reshape(-1, 1),
-                    np.array(labels_unique)[train_idxs_unique],
+                # (resampled rows only depend on labels, so uuid indexes are resampled)
+                ros = RandomOverSampler(random_state=RANDOM_STATE)
+                train_idxs_resampled, _ = ros.fit_resample(  # type: ignore
+                    train_idxs_unique.reshape(-1, 1),
+                    labels_unique[train_idxs_unique],
                 )
                 # map back to the sample space
-                train_idxs: NDArrayInt = np.concatenate(
-                    [
-                        np.where(uuids == uuid)[0]
-                        for uuid in train_uuids_resampled.flatten()  # type: ignore
-                    ]
-                )
+                train_idxs: NDArrayInt = uuid_groups.samples(train_idxs_resampled)
 
-            train_set = dset.subsample(list(train_idxs))
-            valid_set = dset.subsample(list(valid_idxs))
+            yield train_idxs, valid_idxs
 
-            yield train_set, valid_set
+    def _fold_idxs(self, oversample: bool) -> Generator[Fold, None, None]:
+        """Yield (train, valid) sample indexes of each cross-validation split."""
+        if self.epiatlas_dataset.target_category == "track_type":
+            return self._split_by_track_type_idxs(self._train_val, self.k)
+        return self._split_dataset_idxs(self._train_val, self.k, oversample=oversample)
+
+    def _make_split(self, fold: Fold) -> data.DataSet:
+        """Return the train and valid datasets of given (train, valid) sample indexes."""
+        train_idxs, valid_idxs = fold
+        return data.DataSet(
+            training=self._train_val.subsample(list(train_idxs)),
+            validation=self._train_val.subsample(list(valid_idxs)),
+            test=data.KnownData.empty_collection(),
+            sorted_classes=self.classes,
+        )
 
     def yield_split(self, oversample: bool = True) -> Generator[data.DataSet, None, None]:
         """Yield train and valid tensor datasets for one split.
 
         Depends on given init parameters.
         """
-        dset = self._train_val
+        for fold in self._fold_idxs(oversample):
+            yield self._make_split(fold)
 
-        if self.epiatlas_dataset.target_category == "track_type":
-            generator = self._split_by_track_type(dset, self.k)
-        else:
-            generator = self._split_dataset(dset, self.k, oversample=oversample)
-
-        for train_set, valid_set in generator:
-            yield data.DataSet(
-                training=train_set,
-                validation=valid_set,
-                test=data.KnownData.empty_collection(),
-                sorted_classes=self.classes,
+    @contextlib.contextmanager
+    def shared_signals(self) -> Iterator[None]:
+        """Context in which splits (e.g. of yield_split) index the training
+        and validation signals in shared memory files (see share_signals).
+
+        Pickled splits then hold their sample indexes, labels and metadata, but
+        not their signals: worker processes map the same shared signals.
+
+        Signals loaded into shared memory (see EpiAtlasDataset shared_memory) are not
+        copied, else only the training and validation rows are copied, until exit.
+        """
+        train_val = self._train_val
+        with share_signals(train_val.signal_rows) as signals:
+            self._train_val = data.KnownData(
+                ids=train_val.ids,
+                x=signals,
+                y=train_val.encoded_labels,
+                y_str=train_val.original_labels,
+                metadata=train_val.metadata,
             )
+            try:
+                yield
+            finally:
+                self._train_val = train_val
+
+    def get_split(
+        self, split_nb: int, oversample: bool = True, manifest: Path | str | None = None
+    ) -> data.DataSet:
+        """Return train and valid datasets of one split, the same as the
+        split_nb-th split of yield_split, without making the other splits.
+
+        The sample indexes of all folds are computed once. If a manifest path is given
+        (see FoldManifest), they are read from it if it was made from the same data and
+        parameters, else written to it, so other jobs do not compute them again.
+
+        Raises:
+            IndexError: if split_nb is not a valid split number.
+        """
+        if oversample not in self._folds:
+            self._folds[oversample] = self._load_folds(oversample, manifest)
+
+        folds = self._folds[oversample]
+        if not 0 <= split_nb < len(folds):
+            raise IndexError(
+                f"Split {split_nb} does not exist. There are {len(folds)} splits."
+            )
+        return self._make_split(folds[split_nb])
+
+    def _load_folds(self, oversample: bool, manifest: Path | str | None) -> List[Fold]:
+        """Return the sample indexes of each fold, read from the manifest if valid."""
+        if manifest is None:
+            return list(self._fold_idxs(oversample))
+
+        fold_manifest = FoldManifest(manifest)
+        uuids, _, _ = self._label_uuid(self._train_val)
+        params = {
+            "n_fold": self.k,
+            "oversample": oversample,
+            "random_state": RANDOM_STATE,
+            "target_category": self.epiatlas_dataset.target_category,
+            "test_ratio": self.test_ratio,
+        }
+        key = FoldManifest.make_key(
+            self._train_val.ids, self._train_val.original_labels, uuids, **params
+        )
+
+        folds = fold_manifest.load(key)
+        if folds is None:
+            folds = list(self._fold_idxs(oversample))
+            fold_manifest.save(key, self._train_val.ids, folds, params)
+        return folds
 
     def create_total_data(self, oversample: bool = True) -> data.KnownData:
         """Create a single dataset from the training and validation data.
@@ -407,24 +591,22 @@ class EpiAtlasFoldFactory:
         train_set = self._train_val
 
         # Convert the labels and groups (uuids) into numpy arrays
-        uuids, uuids_unique, uuids_inverse = self._label_uuid(train_set)
-        labels_unique = [
-            train_set.encoded_labels[uuids == uuid][0] for uuid in uuids_unique
+        _, uuids_unique, uuids_inverse = self._label_uuid(train_set)
+        uuid_groups = UUIDGroups(uuids_inverse)
+        labels_unique = train_set.encoded_labels[
+            uuid_groups.first_samples()
         ]  # assuming all samples from the same UUID share the same label --> not true for track_type
 
         if oversample:
             # Oversample in the UUID space, not the sample space
-            ros = RandomOverSampler(random_state=42)
+            ros = RandomOverSampler(random_state=RANDOM_STATE)
             resampled_uuid_idxs, _ = ros.fit_resample(  # type: ignore
                 np.array(range(len(uuids_unique))).reshape(-1, 1),
-                np.array(labels_unique),
+                labels_unique,
             )
-            resampled_uuid_idxs = resampled_uuid_idxs.flatten()  # type: ignore
 
             # Map back to the sample space
-            train_idxs = np.concatenate(
-                [np.where(uuids_inverse == idx)[0] for idx in resampled_uuid_idxs]
-            )
+            train_idxs = uuid_groups.samples(resampled_uuid_idxs)
 
             train_set = train_set.subsample(list(train_idxs))
 
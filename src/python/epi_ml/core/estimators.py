@@ -11,12 +11,13 @@ import sys
 from functools import partial
 from inspect import signature
 from pathlib import Path
-from typing import Collection
+from typing import Collection, Dict
 
 import numpy as np
 import pandas as pd
 import sklearn.metrics
 from lightgbm import LGBMClassifier
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import make_scorer, matthews_corrcoef
@@ -30,6 +31,8 @@ from tabulate import tabulate
 from epi_ml.core.analysis import write_pred_table
 from epi_ml.core.data import DataSet
 from epi_ml.core.epiatlas_treatment import EpiAtlasFoldFactory
+from epi_ml.core.memory_planner import max_workers, memory_budget
+from epi_ml.core.thread_budget import ThreadBudget
 from epi_ml.utils.check_dir import create_dirs
 from epi_ml.utils.my_logging import log_dset_composition
 from epi_ml.utils.time import time_now
@@ -378,10 +381,37 @@ def log_tune_results(logdir: Path, name: str, opt: BayesSearchCV):
         json.dump(obj=opt.best_params_, fp=f, sort_keys=True, indent=4)  # type: ignore
 
 
-def init_lock(l):
-    """Define a global lock"""
+def init_worker(l, budget: ThreadBudget):
+    """Define a global lock, and limit the threads of the worker process."""
     global lock  # pylint: disable=global-variable-undefined
     lock = l
+    budget.apply()
+
+
+def n_jobs_params(estimator, n_jobs: int) -> Dict:
+    """Return the parameters setting the number of threads of the estimator,
+    or of each Pipeline step supporting it.
+    """
+    return {
+        param: n_jobs
+        for param in estimator.get_params(deep=True)
+        if param.split("__")[-1] in ("n_jobs", "num_threads")
+    }
+
+
+def sample_weight_params(estimator, sample_weight: np.ndarray | None) -> Dict:
+    """Return the fit parameters giving sample weights to the estimator,
+    or to each step of a Pipeline accepting them.
+    """
+    if sample_weight is None:
+        return {}
+    if not isinstance(estimator, Pipeline):
+        return {"sample_weight": sample_weight}
+    return {
+        f"{name}__sample_weight": sample_weight
+        for name, step in estimator.steps
+        if hasattr(step, "fit") and "sample_weight" in signature(step.fit).parameters
+    }
 
 
 def run_predictions(
@@ -389,7 +419,14 @@ def run_predictions(
 ):
     """
     It will fit and run a prediction for each of the k-folds in the EpiAtlasFoldFactory
-    object, using the estimator provided. Will use all available cpus.
+    object, using the estimator provided. Will use all available cpus
+    (see ThreadBudget), split between concurrent folds and their threads.
+
+    The signals are shared with the worker processes (see
+    EpiAtlasFoldFactory.shared_signals), each worker only receives the
+    indexes of its split. Estimators are still fitted on a contiguous copy
+    of the training rows of their fold, so there are only as many concurrent
+    folds as there are copies fitting in the memory budget (see memory_budget).
 
     Args:
       ea_handler (EpiAtlasFoldFactory): Dataset splits creator.
@@ -397,17 +434,30 @@ def run_predictions(
       name (str): The name of the model.
       logdir (Path): The directory where the results will be saved.
     """
-    nb_workers = ea_handler.k
-    available_cpus = len(os.sched_getaffinity(0))
-    if available_cpus < nb_workers:
-        nb_workers = available_cpus
+    # each worker copies its training rows, scaled into another copy, and its validation rows
+    train_bytes, valid_bytes = ea_handler.fold_bytes()
+    max_folds = max_workers(
+        worker_bytes=2 * train_bytes + valid_bytes,
+        shared_bytes=ea_handler.signal_bytes(),
+        budget=memory_budget(),
+    )
+    budget = ThreadBudget(n_tasks=ea_handler.k, max_workers=max_folds)
+    print(
+        f"Fitting {budget.n_workers} splits at a time, {budget.n_threads} threads each."
+    )
+    # the caller's estimator (e.g. of model_mapping) keeps its parameters
+    estimator = clone(estimator)
+    estimator.set_params(**n_jobs_params(estimator, budget.n_threads))
 
     func = partial(run_prediction, estimator=estimator, name=name, logdir=logdir)
-    items = enumerate(ea_handler.yield_split())
 
     l = mp.Lock()
-    with mp.Pool(initializer=init_lock, initargs=(l,), processes=nb_workers) as pool:
-        pool.starmap(func, items)
+    with ea_handler.shared_signals():
+        items = enumerate(ea_handler.yield_split())
+        with mp.Pool(
+            initializer=init_worker, initargs=(l, budget), processes=budget.n_workers
+        ) as pool:
+            pool.starmap(func, items)
 
 
 def run_prediction(
@@ -433,7 +483,8 @@ def run_prediction(
     """
     log_dset_composition(my_data, logdir=logdir, logger=None, split_nb=i)
 
-    estimator.fit(X=my_data.train.signals, y=my_data.train.encoded_labels)
+    X, y, sample_weight = my_data.train.weighted_signals()
+    estimator.fit(X=X, y=y, **sample_weight_params(estimator, sample_weight))
 
     analyzer = EstimatorAnalyzer(my_data.classes, estimator)
 
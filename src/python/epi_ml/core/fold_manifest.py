@@ -0,0 +1,114 @@
+"""Module for the saved cross-validation folds of EpiAtlasFoldFactory."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "folds_manifest.json"
+
+Fold = Tuple[np.ndarray, np.ndarray]  # (train, valid) sample indexes
+
+
+class FoldManifest:
+    """Json file of the train/valid folds of a cross-validation dataset, so that
+    jobs training one split can skip computing the other ones.
+
+    The manifest holds the md5 of each dataset sample, and for each fold:
+    train: md5s of the training samples, before oversampling
+    valid: md5s of the validation samples
+    train_idxs: sample indexes of the training set, oversampled (repeated indexes) or not
+    valid_idxs: sample indexes of the validation set
+
+    A key (see make_key) identifies the dataset and split parameters the folds were made with.
+
+    path: Manifest json file.
+    """
+
+    def __init__(self, path: Path | str):
+        self._path = Path(path)
+
+    @property
+    def path(self) -> Path:
+        """Return the manifest path."""
+        return self._path
+
+    @staticmethod
+    def make_key(ids, labels, uuids, **params) -> str:
+        """Return a hash of the dataset samples (ids, labels and uuids in order)
+        and of given json serializable split parameters.
+        """
+        content = json.dumps(
+            [list(map(str, ids)), list(map(str, labels)), list(map(str, uuids)), params],
+            sort_keys=True,
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def load(self, key: str) -> List[Fold] | None:
+        """Return the (train_idxs, valid_idxs) of each fold, or None if there is
+        no valid manifest for this key.
+        """
+        try:
+            with open(self._path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("key") != key:
+            return None
+        return [
+            (
+                np.array(fold["train_idxs"], dtype=np.int64),
+                np.array(fold["valid_idxs"], dtype=np.int64),
+            )
+            for fold in manifest["folds"]
+        ]
+
+    def save(self, key: str, ids, folds: List[Fold], params: Dict) -> None:
+        """Write the folds of the dataset samples ids, with their key and split parameters.
+
+        Errors are printed, not raised: folds can always be computed again.
+        """
+        ids = np.asarray(ids)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "key": key,
+            "params": params,
+            "md5s": ids.tolist(),
+            "folds": [],
+        }
+        for train_idxs, valid_idxs in folds:
+            _, first = np.unique(train_idxs, return_index=True)
+            manifest["folds"].append(
+                {
+                    "train": ids[train_idxs[np.sort(first)]].tolist(),
+                    "valid": ids[valid_idxs].tolist(),
+                    "train_idxs": train_idxs.tolist(),
+                    "valid_idxs": valid_idxs.tolist(),
+                }
+            )
+
+        tmp_path = None
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                mode="w",
+                encoding="utf-8",
+                dir=self._path.parent,
+                suffix=".tmp",
+                delete=False,
+            ) as file:
+                tmp_path = file.name
+                json.dump(manifest, file)
+            os.replace(tmp_path, self._path)
+        except OSError as err:
+            print(f"Could not write fold manifest {self._path}: {err}", file=sys.stderr)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,145 @@
+"""Module for hdf5 bundles, the signals of many hdf5 files consolidated in one file."""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import h5py
+import numpy as np
+
+BUNDLE_FORMAT = "epi_ml_hdf5_bundle"
+BUNDLE_VERSION = 1
+CHUNK_BINS = 2**16
+COMPRESSION = "lzf"  # fast decode, always available in h5py
+
+
+class Hdf5Bundle:
+    """Reader of an hdf5 bundle: one hdf5 file holding the signals of many
+    hdf5 files, as a chunked (n_samples, n_bins) float32 "signals" dataset.
+
+    Chunks hold one sample and up to CHUNK_BINS bins, compressed with COMPRESSION.
+    Datasets of per-sample attributes, in signals rows order:
+        md5s, files (original file names), resolution (bin size),
+        mean and std (float64 statistics of the raw signal).
+    Chromosomes are described by the "chroms" and "chrom_lengths" (in bins)
+    datasets, concatenated in that order in each signal.
+
+    Bundles are written by utils/make_hdf5_bundle.py, and can be given to
+    Hdf5Loader and EpiDataSource instead of an hdf5 list file.
+
+    path: Bundle file path.
+    """
+
+    def __init__(self, path: Path | str):
+        self._path = Path(path)
+        with h5py.File(self._path, "r") as file:
+            if file.attrs.get("format") != BUNDLE_FORMAT:
+                raise OSError(f"{self._path} is not an hdf5 bundle.")
+            self._md5s: List[str] = file["md5s"].asstr()[...].tolist()  # type: ignore
+            self._chroms: List[str] = file["chroms"].asstr()[...].tolist()  # type: ignore
+            self._chrom_lengths: List[int] = file["chrom_lengths"][...].tolist()  # type: ignore
+            self._resolutions: np.ndarray = file["resolution"][...]  # type: ignore
+        self._rows = {md5: i for i, md5 in enumerate(self._md5s)}
+
+    @staticmethod
+    def is_bundle(path: Path | str) -> bool:
+        """Return True if path is an hdf5 bundle file."""
+        try:
+            if not h5py.is_hdf5(path):
+                return False
+            with h5py.File(path, "r") as file:
+                return file.attrs.get("format") == BUNDLE_FORMAT
+        except OSError:
+            return False
+
+    @property
+    def path(self) -> Path:
+        """Return the bundle file path."""
+        return self._path
+
+    @property
+    def md5s(self) -> List[str]:
+        """Return the md5 of each sample, in signals rows order."""
+        return self._md5s
+
+    @property
+    def chroms(self) -> Dict[str, int]:
+        """Return a {chrom:length} dict, with lengths in bins."""
+        return dict(zip(self._chroms, self._chrom_lengths))
+
+    @property
+    def resolution(self) -> int:
+        """Return the resolution (bin size) of the first sample."""
+        return int(self._resolutions[0])
+
+    def stats(self, md5: str) -> Tuple[float, float]:
+        """Return (mean, std) of the raw signal of a sample."""
+        with h5py.File(self._path, "r") as file:
+            row = self._rows[md5]
+            return float(file["mean"][row]), float(file["std"][row])  # type: ignore
+
+    def open_sample(self, md5: str) -> BundleSample:
+        """Return a BundleSample of one sample, to be used as a context manager.
+
+        Raises:
+            OSError: if the md5 is not in the bundle.
+        """
+        if md5 not in self._rows:
+            raise OSError(f"{md5} is not in hdf5 bundle {self._path}.")
+        row = self._rows[md5]
+        return BundleSample(self._path, row, int(self._resolutions[row]), self.chroms)
+
+
+class BundleSample:
+    """Open sample of an hdf5 bundle. Mimics an open hdf5 file of the sample, where
+    self[chrom] gives a chromosome dataset, and attrs["bin"] the resolution.
+    """
+
+    def __init__(self, path: Path, row: int, resolution: int, chroms: Dict[str, int]):
+        self._file = h5py.File(path, "r")
+        self._signals: h5py.Dataset = self._file["signals"]  # type: ignore
+        self._row = row
+        self.filename = str(path)
+        self.attrs = {"bin": [resolution]}
+
+        self._chroms = {}
+        start = 0
+        for chrom, length in chroms.items():
+            self._chroms[chrom] = (start, length)
+            start += length
+
+    def __enter__(self) -> BundleSample:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the bundle file."""
+        self._file.close()
+
+    def __getitem__(self, chrom: str) -> BundleChrom:
+        start, length = self._chroms[chrom]
+        return BundleChrom(self._signals, self._row, start, length)
+
+
+class BundleChrom:
+    """One chromosome of a bundle sample. Supports the reads Hdf5Loader does on
+    chromosome datasets: shape, [...], increasing indexes arrays and read_direct.
+    """
+
+    def __init__(self, signals: h5py.Dataset, row: int, start: int, length: int):
+        self._signals = signals
+        self._row = row
+        self._start = start
+        self.shape = (length,)
+
+    def __getitem__(self, key) -> np.ndarray:
+        if key is Ellipsis:
+            return self._signals[self._row, self._start : self._start + self.shape[0]]
+        return self._signals[self._row, self._start + np.asarray(key)]
+
+    def read_direct(self, dest: np.ndarray, dest_sel=None) -> None:
+        """Read the chromosome signal into dest[dest_sel]."""
+        source_sel = np.s_[self._row, self._start : self._start + self.shape[0]]
+        self._signals.read_direct(dest, source_sel=source_sel, dest_sel=dest_sel)
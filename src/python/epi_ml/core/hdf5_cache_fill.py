@@ -0,0 +1,143 @@
+"""Module for building and updating the signal cache of an hdf5 list."""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from epi_ml.core.hdf5_file_pool import handle_error
+from epi_ml.core.memory_planner import new_matrix
+from epi_ml.core.quantization import QuantizedSignals, first_rows
+from epi_ml.core.signal_cache import SignalCache
+
+
+class CacheFiller:
+    """Loads signals from the signal cache of a complete hdf5 list, building or updating
+    it first if needed. Only new and modified files are read when updating.
+
+    cache: Signal cache of the list, for the loader settings (see SignalCache.make_key).
+    files: {md5:path} of all listed files.
+    dtype: Storage dtype of the cached matrix.
+    fill: fill(files, matrix, strict) loads files into matrix rows, in files order,
+        and returns the md5 of each loaded row (see Hdf5Loader._fill_matrix).
+    count_bins: count_bins(files) returns the signal length of files.
+    """
+
+    def __init__(
+        self,
+        cache: SignalCache,
+        files: Dict[str, Path],
+        dtype: str,
+        fill: Callable[..., List[str]],
+        count_bins: Callable[[Dict[str, Path]], int],
+    ):
+        self._cache = cache
+        self._files = files
+        self._dtype = dtype
+        self._fill = fill
+        self._count_bins = count_bins
+
+    def load(
+        self, files: Dict[str, Path], verbose: bool, strict: bool
+    ) -> Tuple[np.ndarray | QuantizedSignals, List[str]]:
+        """Return (matrix, md5s) of selected files, from the cache of the complete list.
+
+        The cache is updated or (re)built from all listed files if needed.
+        """
+        cache = self._cache
+        fingerprints = SignalCache.fingerprint(self._files)
+
+        cached = cache.load(fingerprints)
+        if cached is not None:
+            if verbose:
+                print(f"Using signal cache {cache.directory}")
+        else:
+            manifest = cache.read_manifest()
+            if manifest is not None:
+                cached = self._update(manifest, fingerprints, verbose)
+
+        if cached is None:
+            if verbose:
+                print(f"Building signal cache {cache.directory}")
+            shape = (len(self._files), self._count_bins(self._files))
+            matrix = new_matrix(shape, self._dtype, cache=cache)
+            md5s = self._fill(self._files, matrix, strict=False)
+            cached = cache.save(matrix, md5s, fingerprints), md5s
+
+        cached_matrix, cached_md5s = cached
+        rows = {md5: i for i, md5 in enumerate(cached_md5s)}
+
+        for md5, file in files.items():
+            if md5 not in rows:
+                err = OSError("File could not be loaded when the signal cache was built.")
+                handle_error(md5, file, err, strict)
+
+        md5_index = [md5 for md5 in files if md5 in rows]
+        if md5_index == cached_md5s:
+            return cached_matrix, md5_index
+        return np.take(cached_matrix, [rows[md5] for md5 in md5_index], axis=0), md5_index
+
+    def _update(
+        self, manifest: Dict, fingerprints: Dict[str, List], verbose: bool
+    ) -> Tuple[np.ndarray | QuantizedSignals, List[str]] | None:
+        """Update a cache built from another version of the hdf5 list.
+
+        Only new and modified files (different size or mtime) are read. Rows are
+        appended in place if no file was removed or modified and the new files
+        are at the end of the list, else the cache matrix is rewritten without
+        reading the unchanged files again.
+
+        Return (matrix, md5s) like SignalCache.load, or None if the previous
+        matrix cannot be reused.
+        """
+        cache = self._cache
+        previous_matrix = cache.open_matrix(manifest, mode="r")
+        if previous_matrix is None or previous_matrix.shape[1] == 0:
+            return None
+
+        previous_files = manifest["files"]
+        changed_files = {
+            md5: path
+            for md5, path in self._files.items()
+            if previous_files.get(md5) != fingerprints[md5]
+        }
+        previous_rows = {
+            md5: i
+            for i, md5 in enumerate(manifest["md5s"])
+            if md5 in fingerprints and md5 not in changed_files
+        }
+        if verbose:
+            n_removed = len(set(previous_files) - set(fingerprints))
+            print(
+                f"Updating signal cache {cache.directory}: "
+                f"{len(changed_files)} new or modified files, {n_removed} removed files."
+            )
+
+        new_signals = new_matrix(
+            (len(changed_files), previous_matrix.shape[1]), self._dtype
+        )
+        new_md5s = self._fill(changed_files, new_signals, strict=False)
+        new_signals = first_rows(new_signals, len(new_md5s))
+        new_rows = {md5: i for i, md5 in enumerate(new_md5s)}
+
+        md5s = [md5 for md5 in self._files if md5 in previous_rows or md5 in new_rows]
+        if md5s == manifest["md5s"] + new_md5s:
+            del previous_matrix
+            if cache.append(new_signals, md5s, fingerprints):
+                return cache.load(fingerprints)
+            previous_matrix = cache.open_matrix(manifest, mode="r")
+            if previous_matrix is None:
+                return None
+
+        matrix = new_matrix(
+            (len(md5s), previous_matrix.shape[1]), self._dtype, cache=cache
+        )
+        for i, md5 in enumerate(md5s):
+            if md5 in new_rows:
+                matrix[i] = new_signals[new_rows[md5]]
+            else:
+                matrix[i] = previous_matrix[previous_rows[md5]]
+        del previous_matrix
+
+        return cache.save(matrix, md5s, fingerprints), md5s
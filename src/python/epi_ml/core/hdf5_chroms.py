@@ -0,0 +1,99 @@
+"""Module for reading the chromosome datasets of an hdf5 file into a concatenated signal."""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import h5py
+import numpy as np
+
+DOWNSAMPLINGS = frozenset(["mean", "sum", "max"])
+
+
+def downsampled_length(length: int, factor: int) -> int:
+    """Return the number of blocks of factor bins in a chromosome of given length."""
+    return -(-length // factor)
+
+
+def read_chrom(dataset: h5py.Dataset, factor: int, downsampling: str) -> np.ndarray:
+    """Read and return a chromosome signal, with each block of factor bins
+    reduced to one bin (see DOWNSAMPLINGS). The last block can be partial.
+    """
+    signal = dataset[...]
+    if factor == 1 or signal.size == 0:
+        return signal
+
+    starts = np.arange(0, signal.shape[0], factor)
+    if downsampling == "max":
+        return np.maximum.reduceat(signal, starts)
+    sums = np.add.reduceat(signal, starts, dtype=np.float64)
+    if downsampling == "sum":
+        return sums
+    return sums / np.minimum(factor, signal.shape[0] - starts)
+
+
+def read_chroms(
+    datasets: List[h5py.Dataset],
+    factor: int,
+    lengths: List[int],
+    signal: np.ndarray,
+    *,
+    chrom_jobs: int = 1,
+    downsampling: str = "mean",
+) -> None:
+    """Read chromosome datasets (of given downsampled lengths) into their place
+    in the concatenated signal, chrom_jobs datasets at a time.
+
+    Concurrent reads of whole datasets bypass the h5py lock, see read_direct.
+    """
+    offsets = np.cumsum([0] + lengths)
+    concurrent = chrom_jobs > 1 and len(datasets) > 1
+
+    def read(i: int) -> None:
+        chrom_signal = signal[offsets[i] : offsets[i + 1]]
+        if factor != 1:
+            chrom_signal[:] = read_chrom(datasets[i], factor, downsampling)
+        elif concurrent:
+            read_direct(datasets[i], chrom_signal)
+        else:
+            datasets[i].read_direct(chrom_signal)
+
+    if not concurrent:
+        for i in range(len(datasets)):
+            read(i)
+        return
+
+    with ThreadPoolExecutor(max_workers=chrom_jobs) as executor:
+        for _ in executor.map(read, range(len(datasets))):
+            pass
+
+
+def read_direct(dataset: h5py.Dataset, chrom_signal: np.ndarray) -> None:
+    """Read a whole chromosome dataset into chrom_signal.
+
+    Uncompressed contiguous datasets are read from their offset in the file,
+    without holding the h5py lock (which serializes all h5py calls of a process).
+
+    Raises:
+        OSError: if the file ends before the dataset.
+    """
+    offset = None
+    if isinstance(dataset, h5py.Dataset) and dataset.chunks is None:
+        offset = dataset.id.get_offset()
+    if offset is None or dataset.dtype.kind != "f":
+        dataset.read_direct(chrom_signal)
+        return
+
+    if dataset.dtype == chrom_signal.dtype:
+        buffer = chrom_signal
+    else:
+        buffer = np.empty(chrom_signal.shape, dtype=dataset.dtype)
+    with open(dataset.file.filename, "rb") as file:
+        file.seek(offset)
+        n_bytes = file.readinto(memoryview(buffer).cast("B"))
+    if n_bytes != buffer.nbytes:
+        raise OSError(
+            f"Read {n_bytes} bytes of {dataset.name}, expected {buffer.nbytes} bytes."
+        )
+    if buffer is not chrom_signal:
+        chrom_signal[:] = buffer
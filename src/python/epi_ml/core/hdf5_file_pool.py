@@ -0,0 +1,181 @@
+"""Module for reading hdf5 files serially or with a pool of workers, while they are staged."""
+from __future__ import annotations
+
+import collections
+import sys
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Generator, Tuple
+
+import numpy as np
+
+from epi_ml.core.hdf5_bundle import Hdf5Bundle
+from epi_ml.core.hdf5_staging import Hdf5Stager
+
+if TYPE_CHECKING:
+    from epi_ml.core.hdf5_loader import Hdf5Loader
+    from epi_ml.core.hdf5_loader_config import Hdf5LoaderConfig
+
+_worker_loader: Hdf5Loader | None = None  # loader of a worker process, see _init_worker
+
+
+def _init_worker(loader: Hdf5Loader) -> None:
+    """Keep the loader of this worker process, sent once when the pool starts."""
+    global _worker_loader  # pylint: disable=global-statement
+    _worker_loader = loader
+
+
+def _worker_read(method: str, md5: str, file: Path, bundle: bool) -> Any:
+    """Call a file reading method of the loader of this worker process (see _init_worker)."""
+    # the worker loader is a private copy of the loader that submitted the file
+    # pylint: disable-next=protected-access
+    return _worker_loader._read_file(method, md5, file, bundle)  # type: ignore
+
+
+def handle_error(md5: str, file: Path, err: Exception, strict: bool) -> None:
+    """Report a file loading error. Raise it again if strict."""
+    print(f"Error occured with {md5}: {file}. {err}", file=sys.stderr)
+    if strict:
+        print(
+            "Strict hdf5 loading policy true, raising original error.",
+            file=sys.stderr,
+        )
+        raise err from None
+
+
+class Hdf5FilePool:
+    """Calls a file reading method of a loader on each file, serially if the loader config
+    has n_jobs == 1, else with a pool of n_jobs threads or processes (see Hdf5LoaderConfig).
+
+    Process workers receive the loader once, when the pool starts, then only the
+    arguments of each file. They call the method of the same name on their copy.
+
+    If the config has a staging directory, the method gets the staged file, and
+    files are read as soon as they are staged, while the next ones are copied.
+
+    loader: Loader whose method is called, sent to worker processes.
+    config: Loader config, giving the workers and staging.
+    bundles: {path:bundle} of the hdf5 bundles read, staged bundles are added to it.
+    """
+
+    def __init__(
+        self,
+        loader: Hdf5Loader,
+        config: Hdf5LoaderConfig,
+        bundles: Dict[Path, Hdf5Bundle],
+    ):
+        self._loader = loader
+        self._config = config
+        self._bundles = bundles
+
+    def map(
+        self,
+        func: Callable[..., Any],
+        files: Dict[str, Path],
+        strict: bool,
+        rows: np.ndarray | None = None,
+    ) -> Generator[Tuple[int, str, Any], None, None]:
+        """Yield (position, md5, func(md5, file)) for each file, in files order.
+
+        If rows are given, func(md5, file, rows[position]) is called instead.
+        Files that cannot be loaded are skipped, or their original error is raised if strict.
+        """
+        if self._config.stage_dir is None:
+            yield from self._map_staged(func, files, strict, rows)
+            return
+
+        with Hdf5Stager(
+            self._config.stage_dir, archive=self._config.stage_archive
+        ) as stager:
+            staged = stager.stage(files)
+            yield from self._map_staged(func, files, strict, rows, staged)
+
+    def _map_staged(
+        self,
+        func: Callable[..., Any],
+        files: Dict[str, Path],
+        strict: bool,
+        rows: np.ndarray | None = None,
+        staged: Dict[str, Future] | None = None,
+    ) -> Generator[Tuple[int, str, Any], None, None]:
+        """See map. staged gives the {md5:future of local path} of staged files."""
+
+        def args(i: int, md5: str, file: Path) -> tuple:
+            if staged is not None:
+                file = self._wait_staged(file, staged[md5])
+            if rows is None:
+                return (md5, file)
+            return (md5, file, rows[i])
+
+        if self._config.n_jobs == 1 or len(files) <= 1:
+            for i, (md5, file) in enumerate(files.items()):
+                try:
+                    result = func(*args(i, md5, file))
+                except (OSError, FloatingPointError) as err:
+                    handle_error(md5, file, err, strict)
+                    continue
+                yield i, md5, result
+            return
+
+        submit, executor = self._executor(func)
+        with executor:
+            # Bounded number of files in flight, so finished signals do not pile up.
+            pending: Deque[Tuple[int, str, Path, Future]] = collections.deque()
+            files_iter = enumerate(files.items())
+            max_pending = self._config.n_jobs * 4
+            try:
+                while True:
+                    for i, (md5, file) in files_iter:
+                        try:
+                            future = submit(*args(i, md5, file))
+                        except OSError as err:
+                            handle_error(md5, file, err, strict)
+                            continue
+                        pending.append((i, md5, file, future))
+                        if len(pending) >= max_pending:
+                            break
+                    if not pending:
+                        break
+
+                    i, md5, file, future = pending.popleft()
+                    try:
+                        result = future.result()
+                    except (OSError, FloatingPointError) as err:
+                        handle_error(md5, file, err, strict)
+                        continue
+                    yield i, md5, result
+            finally:
+                for _, _, _, future in pending:
+                    future.cancel()
+
+    def _executor(
+        self, func: Callable[..., Any]
+    ) -> Tuple[Callable[..., Future], Executor]:
+        """Return (submit(md5, file, *row) -> future of func result, executor) for the config pool."""
+        if self._config.pool == "thread":
+            executor = ThreadPoolExecutor(max_workers=self._config.n_jobs)
+            return lambda *args: executor.submit(func, *args), executor
+
+        # workers receive the loader once, then only the arguments of each file
+        executor = ProcessPoolExecutor(
+            max_workers=self._config.n_jobs,
+            initializer=_init_worker,
+            initargs=(self._loader,),
+        )
+
+        def submit(md5: str, file: Path, *_) -> Future:
+            bundle = file in self._bundles
+            return executor.submit(_worker_read, func.__name__, md5, file, bundle)
+
+        return submit, executor
+
+    def _wait_staged(self, file: Path, staged_file: Future) -> Path:
+        """Return the local path of a staged file, once it is staged.
+
+        Raises:
+            OSError: if the file could not be staged.
+        """
+        local_file = staged_file.result()
+        if file in self._bundles and local_file not in self._bundles:
+            self._bundles[local_file] = Hdf5Bundle(local_file)
+        return local_file
@@ -3,29 +3,177 @@
 # pylint: disable=unexpected-keyword-arg
 from __future__ import annotations
 
+import collections
+import hashlib
 import os
 import sys
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Callable, Dict, Generator, List, Tuple
 
 import h5py
 import numpy as np
 
+from epi_ml.core import hdf5_chroms
+from epi_ml.core.data_source import EpiDataSource
+from epi_ml.core.hdf5_bundle import BundleSample, Hdf5Bundle
+from epi_ml.core.hdf5_cache_fill import CacheFiller
+from epi_ml.core.hdf5_chroms import DOWNSAMPLINGS, downsampled_length
+from epi_ml.core.hdf5_file_pool import Hdf5FilePool, handle_error
+from epi_ml.core.hdf5_loader_config import Hdf5LoaderConfig
+from epi_ml.core.memory_planner import MemoryPlan, new_matrix
+from epi_ml.core.quantization import QuantizedSignals, first_rows
+from epi_ml.core.signal_cache import SignalCache
+from epi_ml.core.signal_memory_cache import (
+    SignalMemoryCache,
+    merge_rows,
+    shared_memory_cache,
+)
+from epi_ml.core.signal_store import SignalStore
+
+NORMALIZATIONS = frozenset(["zscore", "log1p_zscore", "robust"])
+MASK_MODES = frozenset(["zero", "drop"])
+MAD_TO_STD = 1.4826  # scale of the median absolute deviation for normal data
+STATS_CHUNK_SIZE = 2**16
 
-class Hdf5Loader:
-    """Handles loading/creating signals from hdf5 files"""
 
-    def __init__(self, chrom_file: Path | str, normalization: bool):
+class Hdf5Loader:
+    """Handles loading/creating signals from hdf5 files
+
+    chrom_file: Chromosome sizes file, defines which chromosomes are concatenated (sorted).
+    normalization: How each signal is normalized, None/False for raw signals.
+        "zscore" (or True): (x - mean) / std
+        "log1p_zscore": z-score of log(1 + x)
+        "robust": (x - median) / (1.4826 * median absolute deviation)
+    bin_indexes: Global bin indexes (positions in the concatenated signal) to keep,
+        in this order. Only those values are read from the hdf5s. If normalization
+        is set, it still uses the mean and std of the whole signal.
+    mask: Blacklisted bins, masked before normalization. Either a BED file of regions,
+        converted to bins at the resolution of each hdf5 like utils/clean_hdf5.py does,
+        or a boolean array (or .npy file) over the concatenated signal, True for masked bins.
+    mask_mode: "zero" sets masked bins to 0, "drop" removes them from the signal.
+        Bins cannot be selected with bin_indexes when dropping masked bins.
+    resolution: Bin size of the loaded signals, to load files of a finer resolution
+        (which must divide it). Each chromosome is reduced by blocks of bins, the last block
+        of a chromosome can be partial. Masks and bin_indexes apply to the reduced signal.
+        Defaults to the resolution of the files.
+    downsampling: "mean", "sum" or "max", how the bins of a block are reduced.
+        The mean of a partial block is over its bins only.
+    memory_cache: LRU cache of loaded signals used by load_hdf5s and load_hdf5s_matrix, so files loaded again
+        in the same process are not read again. Defaults to the process-wide cache
+        (see shared_memory_cache), disabled unless $HDF5_MEMORY_CACHE sets its size.
+    config: How signals are read, stored and cached: workers, signal cache directory,
+        storage dtype, staging, chrom_jobs and memory budget (see Hdf5LoaderConfig).
+    options: Options of Hdf5LoaderConfig (e.g. n_jobs=4, dtype="float16"), used to create
+        the config when it is not given. Options not given default to environment variables.
+    """
+
+    def __init__(
+        self,
+        chrom_file: Path | str,
+        normalization: bool | str | None,
+        *,
+        bin_indexes: List[int] | None = None,
+        mask: Path | str | np.ndarray | None = None,
+        mask_mode: str = "zero",
+        resolution: int | None = None,
+        downsampling: str = "mean",
+        memory_cache: SignalMemoryCache | None = None,
+        config: Hdf5LoaderConfig | None = None,
+        **options,
+    ):
+        if normalization is True:
+            normalization = "zscore"
+        elif normalization is False:
+            normalization = None
+        if normalization is not None and normalization not in NORMALIZATIONS:
+            raise ValueError(
+                f"normalization must be one of {sorted(NORMALIZATIONS)}. Got {normalization}."
+            )
         self._normalization = normalization
         self._chroms = Hdf5Loader.load_chroms(chrom_file)
         self._files = {}
         self._signals = {}
+        self._bundles: Dict[Path, Hdf5Bundle] = {}
+
+        if config is None:
+            config = Hdf5LoaderConfig(**options)
+        elif options:
+            raise ValueError(f"Options {sorted(options)} cannot be given with a config.")
+        self._config = config
+
+        self._bin_indexes = None
+        if bin_indexes is not None:
+            self._bin_indexes = np.asarray(bin_indexes, dtype=np.int64)
+            if self._bin_indexes.ndim != 1 or np.any(self._bin_indexes < 0):
+                raise ValueError("bin_indexes must be a list of positive integers.")
+
+        self._mask_mode = mask_mode
+        self._mask_array = None
+        self._mask_regions = None
+        self._set_mask(mask)
+        self._masks: Dict[Tuple[int, Tuple[int, ...]], np.ndarray] = {}
+
+        if resolution is not None and resolution < 1:
+            raise ValueError(f"resolution must be >= 1. Got {resolution}.")
+        if downsampling not in DOWNSAMPLINGS:
+            raise ValueError(
+                f"downsampling must be one of {sorted(DOWNSAMPLINGS)}. Got {downsampling}."
+            )
+        self._resolution = resolution
+        self._downsampling = downsampling
+
+        if memory_cache is None:
+            memory_cache = shared_memory_cache()
+        self._memory_cache = memory_cache
+
+    def _set_mask(self, mask: Path | str | np.ndarray | None) -> None:
+        """Set the mask array or regions of mask, see the class description."""
+        if self._mask_mode not in MASK_MODES:
+            raise ValueError(
+                f"mask_mode must be one of {sorted(MASK_MODES)}. Got {self._mask_mode}."
+            )
+        if (
+            mask is not None
+            and self._mask_mode == "drop"
+            and self._bin_indexes is not None
+        ):
+            raise ValueError("bin_indexes cannot be used when dropping masked bins.")
+        if isinstance(mask, np.ndarray) or (
+            mask is not None and Path(mask).suffix == ".npy"
+        ):
+            mask_array = np.load(mask) if not isinstance(mask, np.ndarray) else mask
+            self._mask_array = np.asarray(mask_array, dtype=bool)
+            if self._mask_array.ndim != 1:
+                raise ValueError("mask array must be one-dimensional.")
+        elif mask is not None:
+            self._mask_regions = Hdf5Loader.load_bed_regions(mask)
+
+    def __getstate__(self):
+        """Do not send last loaded files/signals or the memory cache to worker processes.
+
+        Process pools receive the loader once per worker (see Hdf5FilePool).
+        """
+        state = self.__dict__.copy()
+        state["_files"] = {}
+        state["_signals"] = {}
+        state["_memory_cache"] = None
+        return state
 
     @property
     def loaded_files(self) -> Dict[str, Path]:
         """Return a {md5:path} dict with last loaded files."""
         return self._files
 
+    @property
+    def config(self) -> Hdf5LoaderConfig:
+        """Return the options of how signals are read, stored and cached."""
+        return self._config
+
+    @property
+    def dtype(self) -> str:
+        """Return the storage dtype of signal matrices."""
+        return self._config.dtype
+
     @property
     def signals(self) -> Dict[str, np.ndarray]:
         """Return a {md5:signal} dict with the last loaded signals,
@@ -47,16 +195,64 @@ class Hdf5Loader:
 
     @staticmethod
     def read_list(data_file: Path, adapt: bool = False) -> Dict[str, Path]:
-        """Return {md5:file} dict from file of paths list."""
-        with open(data_file, "r", encoding="utf-8") as file_of_paths:
-            files = {}
-            for path in file_of_paths:
-                path = Path(path.rstrip())
-                files[Hdf5Loader.extract_md5(path)] = path
+        """Return {md5:file} dict from file of paths list.
+
+        If data_file is an hdf5 bundle (see Hdf5Bundle), all md5s give the bundle path.
+        """
+        if Hdf5Bundle.is_bundle(data_file):
+            files = {md5: Path(data_file) for md5 in Hdf5Bundle(data_file).md5s}
+        else:
+            with open(data_file, "r", encoding="utf-8") as file_of_paths:
+                files = {}
+                for path in file_of_paths:
+                    path = Path(path.rstrip())
+                    files[Hdf5Loader.extract_md5(path)] = path
         if adapt:
             files = Hdf5Loader.adapt_to_environment(files)
         return files
 
+    @staticmethod
+    def load_bed_regions(bed_file: Path | str) -> Dict[str, np.ndarray]:
+        """Return {chrom:regions} dict from BED file, where regions is a (n, 2) array
+        of [start, end) positions. Other columns, headers and comments are ignored.
+        """
+        regions = collections.defaultdict(list)
+        with open(bed_file, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.strip() or line.startswith(("#", "track", "browser")):
+                    continue
+                chrom, start, end = line.split()[:3]
+                regions[chrom].append((int(start), int(end)))
+        return {
+            chrom: np.array(chrom_regions, dtype=np.int64).reshape(-1, 2)
+            for chrom, chrom_regions in regions.items()
+        }
+
+    @staticmethod
+    def bed_bin_mask(
+        regions: Dict[str, np.ndarray],
+        chroms: List[str],
+        lengths: List[int],
+        resolution: int,
+    ) -> np.ndarray:
+        """Return the boolean mask of bins overlapped by regions (see load_bed_regions),
+        for given chromosomes of given lengths (in bins), concatenated in that order.
+
+        The mask can be saved (np.save) and given to the loader, to skip reading the BED file.
+        """
+        masks = []
+        for chrom, length in zip(chroms, lengths):
+            chrom_regions = regions.get(chrom, np.empty((0, 2), dtype=np.int64))
+            chrom_regions = chrom_regions[chrom_regions[:, 1] > chrom_regions[:, 0]]
+            # Count regions opening and closing at each bin, covered bins have a positive sum.
+            starts = np.minimum(chrom_regions[:, 0] // resolution, length)
+            ends = np.minimum((chrom_regions[:, 1] - 1) // resolution + 1, length)
+            bounds = np.bincount(starts, minlength=length + 1) - np.bincount(
+                ends, minlength=length + 1
+            )
+            masks.append(np.cumsum(bounds[:length]) > 0)
+        return np.concatenate(masks) if masks else np.empty(0, dtype=bool)
+
     def load_hdf5s(
         self,
         data_file: Path,
@@ -64,6 +260,7 @@ class Hdf5Loader:
         verbose=True,
         strict=False,
         hdf5_dir: Path | None = None,
+        copies: float = 0,
     ) -> Hdf5Loader:
         """Load hdf5s from path list file, into self.signals
         If a list of md5s is given, load only the corresponding files.
@@ -73,18 +270,271 @@ class Hdf5Loader:
 
         hdf5_dir is a directory in which to look for hdf5s, which will override data_file complete paths.
 
+        data_file can also be an hdf5 bundle, holding the signals of all files (see Hdf5Bundle).
+
         If strict, will raise OSError if an hdf5 cannot be opened.
 
-        Loads them as float32.
+        Loads them as float32. Files are loaded concurrently if the loader
+        was created with n_jobs > 1, the returned signals keep the list order.
+
+        If the loader has a cache directory, signals are rows of the cached matrix,
+        see load_hdf5s_matrix. Float16 and int8 rows are then widened to float32.
+
+        Otherwise, if the memory cache is enabled, signals already in it are not read
+        again, and loaded signals are added to it. Signals are then read-only.
+        A file is read again if its size or mtime changed.
+
+        copies is the number of in-memory copies of all signals the caller will make
+        (can be fractional), for the memory check (see memory_budget). If the signals do not
+        fit in memory, they are loaded like load_hdf5s_matrix, into a memory-mapped matrix.
+        """
+        if self._config.cache_dir is not None:
+            matrix, md5_index = self.load_hdf5s_matrix(
+                data_file, md5s, verbose, strict, hdf5_dir, copies
+            )
+            if isinstance(matrix, QuantizedSignals) or matrix.dtype != np.float32:
+                # reduced precision rows are widened
+                self._signals = {
+                    md5: np.asarray(row).astype(np.float32, copy=False)
+                    for md5, row in zip(md5_index, matrix)
+                }
+            return self
+
+        files = self._select_files(data_file, md5s, verbose, hdf5_dir)
+
+        if self._needs_mapping(files, copies, dtype="float32"):
+            matrix = self._allocate_matrix(files, mapped=True, dtype="float32")
+            md5_index = self._fill_matrix(files, matrix, strict)
+            self._signals = dict(zip(md5_index, first_rows(matrix, len(md5_index))))
+            return self
+
+        signals, memory_keys = self._memory_lookup(files, verbose)
+
+        # Load hdf5s and concatenate chroms into signals
+        missing_files = {md5: file for md5, file in files.items() if md5 not in signals}
+        for _, md5, signal in self._map_files(self._load_file, missing_files, strict):
+            if memory_keys.get(md5) is not None:
+                signal = self._memory_cache.put(memory_keys[md5], signal)  # type: ignore
+            signals[md5] = signal
+
+        self._signals = {md5: signals[md5] for md5 in files if md5 in signals}
+
+        return self
+
+    def load_hdf5s_matrix(
+        self,
+        data_file: Path,
+        md5s: List[str] | None = None,
+        verbose=True,
+        strict=False,
+        hdf5_dir: Path | None = None,
+        copies: float = 0,
+        shared: bool = False,
+    ) -> Tuple[np.ndarray | QuantizedSignals, List[str]]:
+        """Load hdf5s from path list file into one preallocated (n_files, n_bins) float32 matrix.
+
+        Same file selection and error handling as load_hdf5s. The matrix is sized from
+        the first file, and each file is read directly into its row, so no intermediate
+        copy of the signals is made.
+
+        Returns the matrix and the md5 of each row. self.signals then holds row views,
+        except for int8 signals (not set).
+
+        With a reduced precision dtype, the matrix is float16, or a QuantizedSignals for int8.
+        Each signal is then read in float32 and reduced when copied into its row.
+
+        If strict, will raise OSError if an hdf5 cannot be opened or does not have the expected size.
+
+        Otherwise, if the memory cache is enabled, rows of signals already in it are copied
+        from it, and loaded signals are added to it (as float32 copies of their rows).
+
+        If the loader has a cache directory, the signals of all files of data_file
+        are saved there once, and memory-mapped by later calls instead of reading
+        the hdf5s again. The cache is rebuilt when the list, an hdf5 file (size or mtime),
+        the chromosomes or the normalization changes. The returned matrix is then
+        a copy-on-write memory map if all cached rows are selected.
+
+        copies is the number of in-memory copies of the matrix the caller will make
+        (e.g. subsamples, can be fractional), for the memory check done before loading
+        (see memory_budget). If the matrix does not fit in memory, it is memory-mapped.
+
+        If shared, the matrix is allocated in shared memory files (see shared_matrix),
+        in spill_dir if memory-mapped, so worker processes map it instead of receiving
+        a copy. Not used with a cache directory, the cached matrix is already a file.
+        """
+        files = self._select_files(data_file, md5s, verbose, hdf5_dir)
+
+        dtype = self._config.dtype
+        if self._config.cache_dir is not None:
+            self._needs_mapping(files, copies, dtype, mapped=True)
+            filler = CacheFiller(
+                self._get_cache(data_file),
+                self._files,
+                dtype,
+                self._fill_matrix,
+                self._count_bins,
+            )
+            matrix, md5_index = filler.load(files, verbose, strict)
+        else:
+            mapped = self._needs_mapping(files, copies, dtype)
+            matrix = self._allocate_matrix(files, mapped, shared=shared)
+            md5_index = self._fill_matrix_from_memory(files, matrix, strict, verbose)
+            matrix = first_rows(matrix, len(md5_index))
+
+        self._signals = {}
+        if not isinstance(matrix, QuantizedSignals):
+            self._signals = dict(zip(md5_index, matrix))
+
+        return matrix, md5_index
+
+    def lazy_load_hdf5s(
+        self,
+        data_file: Path,
+        md5s: List[str] | None = None,
+        verbose=True,
+        hdf5_dir: Path | None = None,
+    ) -> SignalStore:
+        """Return a SignalStore of the hdf5s from path list file, read only when needed.
+
+        Same file selection as load_hdf5s. Only the first file is opened, for the signal length.
+        Files that cannot be loaded will raise OSError when the signals are read.
+        """
+        files = self._select_files(data_file, md5s, verbose, hdf5_dir)
+        return SignalStore(
+            self, data_file, list(files), self._count_bins(files), hdf5_dir=hdf5_dir
+        )
+
+    def _memory_lookup(
+        self, files: Dict[str, Path], verbose: bool
+    ) -> Tuple[Dict[str, np.ndarray], Dict[str, Tuple | None]]:
+        """Return ({md5:signal} of files found in the memory cache, {md5:memory key} of all files).
+
+        Both are empty if the memory cache is disabled.
+        """
+        memory_cache = self._memory_cache
+        if memory_cache is None or not memory_cache.enabled:
+            return {}, {}
+
+        # float32 signals are cached, the same for every matrix dtype
+        params = self._signal_params()
+        del params["dtype"]
+        signals, memory_keys = memory_cache.lookup(files, SignalCache.make_key(**params))
+        if verbose and signals:
+            print(f"{len(signals)}/{len(files)} signals found in memory cache.")
+        return signals, memory_keys
+
+    def _fill_matrix_from_memory(
+        self,
+        files: Dict[str, Path],
+        matrix: np.ndarray | QuantizedSignals,
+        strict: bool,
+        verbose: bool,
+    ) -> List[str]:
+        """Like _fill_matrix, with rows of signals in the memory cache copied from it,
+        and loaded signals added to it.
+        """
+        signals, memory_keys = self._memory_lookup(files, verbose)
+        if not memory_keys:
+            return self._fill_matrix(files, matrix, strict)
+
+        missing_files = {md5: file for md5, file in files.items() if md5 not in signals}
+        loaded_md5s = set(self._fill_matrix(missing_files, matrix, strict, memory_keys))
+        md5_index = [md5 for md5 in files if md5 in signals or md5 in loaded_md5s]
+        merge_rows(matrix, md5_index, loaded_md5s, signals)
+        return md5_index
+
+    def _fill_matrix(
+        self,
+        files: Dict[str, Path],
+        matrix: np.ndarray | QuantizedSignals,
+        strict: bool,
+        memory_keys: Dict[str, Tuple | None] | None = None,
+    ) -> List[str]:
+        """Load files into matrix rows, in files order.
+
+        Rows of files that could not be loaded are overwritten by the next ones.
+        Return the md5 of each loaded row, only the first len(md5s) rows are valid.
+
+        Loaded float32 signals are put in the memory cache, for files with a memory key.
         """
+        # Worker processes cannot write into the matrix, their rows are copied.
+        # Reduced precision rows are copied from float32 signals.
+        copy_rows = (self._config.n_jobs > 1 and self._config.pool == "process") or not (
+            isinstance(matrix, np.ndarray) and matrix.dtype == np.float32
+        )
+        if copy_rows:
+            results = self._map_files(self._load_file, files, strict)
+        else:
+            results = self._map_files(self._read_into, files, strict, rows=matrix)
+
+        loaded_rows = []
+        for i, md5, signal in results:
+            if copy_rows:
+                if signal.shape != matrix.shape[1:]:
+                    err = OSError(
+                        f"Signal of size {signal.shape[0]}, expected {matrix.shape[1]} bins."
+                    )
+                    handle_error(md5, files[md5], err, strict)
+                    continue
+                matrix[i] = signal
+            if memory_keys and memory_keys.get(md5) is not None:
+                if not copy_rows:
+                    signal = np.array(matrix[i])
+                self._memory_cache.put(memory_keys[md5], signal)  # type: ignore
+            loaded_rows.append((i, md5))
+
+        # Move loaded rows up, over rows of files that could not be loaded.
+        for new_i, (i, _) in enumerate(loaded_rows):
+            if new_i != i:
+                matrix[new_i] = matrix[i]
+
+        return [md5 for _, md5 in loaded_rows]
+
+    def _signal_params(self) -> Dict[str, Any]:
+        """Return the json serializable loader settings that define the loaded signals."""
+        params = {
+            "chroms": self._chroms,
+            "normalization": self._normalization,
+            "dtype": np.dtype(self._config.dtype).str,
+            "bin_indexes": None
+            if self._bin_indexes is None
+            else self._bin_indexes.tolist(),
+        }
+        if self._mask_array is not None or self._mask_regions is not None:
+            params.update(mask=self._mask_hash(), mask_mode=self._mask_mode)
+        if self._resolution is not None:
+            params.update(resolution=self._resolution, downsampling=self._downsampling)
+        return params
+
+    def _get_cache(self, data_file: Path) -> SignalCache:
+        """Return the signal cache of given hdf5 list, for the loader settings."""
+        key = SignalCache.make_key(
+            data_file=Path(data_file).resolve(), **self._signal_params()
+        )
+        return SignalCache(self._config.cache_dir, name=Path(data_file).stem, key=key)  # type: ignore
+
+    def _select_files(
+        self,
+        data_file: Path,
+        md5s: List[str] | None,
+        verbose: bool,
+        hdf5_dir: Path | None,
+    ) -> Dict[str, Path]:
+        """Return {md5:path} dict of files to load. See load_hdf5s."""
         files = self.read_list(data_file)
 
-        files = Hdf5Loader.adapt_to_environment(files)
+        if (
+            self._config.stage_dir is None
+        ):  # staged files are always copied from their source
+            files = Hdf5Loader.adapt_to_environment(files)
 
         if hdf5_dir is not None:
             files = {md5: hdf5_dir / path.name for md5, path in files.items()}
 
         self._files = files
+        self._bundles = {}
+        if Hdf5Bundle.is_bundle(data_file):
+            self._bundles = {path: Hdf5Bundle(path) for path in set(files.values())}
 
         # Remove undesired files
         if md5s is not None:
@@ -100,53 +550,391 @@ class Hdf5Loader:
                 print("Following given md5s are absent of hdf5 list")
                 for md5 in absent_md5s:
                     print(md5)
+        return files
 
-        # Load hdf5s and concatenate chroms into signals
-        signals = {}
+    def _needs_mapping(
+        self, files: Dict[str, Path], copies: float, dtype: str, mapped: bool = False
+    ) -> bool:
+        """Return True if the signals of files must be loaded into a memory-mapped matrix
+        to fit in the memory budget, with given copies. See MemoryPlan.
+
+        If mapped, the matrix is already memory-mapped (e.g. cached) and only copies are checked.
+
+        Raises:
+            MemoryError: if the signals do not fit, even memory-mapped if the policy allows it.
+        """
+        budget = self._config.memory_budget
+        if budget is None:
+            return False
+        plan = MemoryPlan(len(files), self._count_bins(files), dtype, copies, budget)
+        return plan.needs_mapping(self._config.memory_policy, mapped)
+
+    def _allocate_matrix(
+        self,
+        files: Dict[str, Path],
+        mapped: bool = False,
+        dtype: str | None = None,
+        shared: bool = False,
+    ) -> np.ndarray | QuantizedSignals:
+        """Return an empty (n_files, n_bins) matrix of the loader dtype (or given dtype).
+        See _count_bins and memory_planner.new_matrix.
+        """
+        shape = (len(files), self._count_bins(files))
+        dtype = dtype or self._config.dtype
+        return new_matrix(shape, dtype, mapped=mapped, shared=shared)
+
+    def _count_bins(self, files: Dict[str, Path]) -> int:
+        """Return the total chromosomes length of the first file that can be opened,
+        without dropped masked bins, or the number of selected bins.
+        """
+        if self._bin_indexes is not None:
+            return len(self._bin_indexes)
         for md5, file in files.items():
-            # Trying to open hdf5 file.
             try:
-                with h5py.File(file, "r") as f:
-                    signals[md5] = self._normalize(self._read_hdf5(f, md5))
-            except (OSError, FloatingPointError) as err:
-                print(f"Error occured with {md5}: {file}. {err}", file=sys.stderr)
-                if strict:
-                    print(
-                        "Strict hdf5 loading policy true, raising original error.",
-                        file=sys.stderr,
+                with self._open(md5, file) as f:
+                    hdf5_data = self._get_header_group(f, md5)
+                    factor = self._downsampling_factor(f)
+                    lengths = [
+                        downsampled_length(hdf5_data[chrom].shape[0], factor)  # type: ignore
+                        for chrom in self._chroms
+                    ]
+                    n_bins = sum(lengths)
+                    if self._mask_mode == "drop":
+                        mask = self._get_mask(f, lengths)
+                        if mask is not None:
+                            n_bins -= int(np.count_nonzero(mask))
+                    return n_bins
+            except (OSError, KeyError):
+                continue  # reported when the file is read
+        return 0
+
+    def _map_files(
+        self,
+        func: Callable[..., Any],
+        files: Dict[str, Path],
+        strict: bool,
+        rows: np.ndarray | None = None,
+    ) -> Generator[Tuple[int, str, Any], None, None]:
+        """Yield (position, md5, func(md5, file)) for each file, in files order,
+        with the workers and staging of the loader config. See Hdf5FilePool.map.
+        """
+        pool = Hdf5FilePool(self, self._config, self._bundles)
+        yield from pool.map(func, files, strict, rows)
+
+    def _read_file(self, method: str, md5: str, file: Path, bundle: bool) -> Any:
+        """Return method(md5, file). file is opened as an hdf5 bundle if bundle,
+        e.g. a bundle staged after this loader was sent to a worker process.
+        """
+        if bundle and file not in self._bundles:
+            self._bundles[file] = Hdf5Bundle(file)
+        return getattr(self, method)(md5, file)
+
+    def _load_file(self, md5: str, file: Path) -> np.ndarray:
+        """Return the concatenated (and normalized if set so) signal of one hdf5 file."""
+        with self._open(md5, file) as f:
+            if self._bin_indexes is not None:
+                return self._read_bins(f, md5)
+            return self._normalize(self._read_hdf5(f, md5))
+
+    def _read_into(self, md5: str, file: Path, row: np.ndarray) -> None:
+        """Read the concatenated genome signal of one hdf5 file directly into row,
+        and normalize it in place if set so. Masked bins are zeroed in place, or dropped
+        from a temporary signal.
+
+        Raises:
+            OSError: if the file cannot be read or its chromosomes do not fit in row.
+        """
+        if self._bin_indexes is not None:
+            with self._open(md5, file) as f:
+                row[:] = self._read_bins(f, md5)
+            return
+
+        if self._mask_mode == "drop" and (
+            self._mask_array is not None or self._mask_regions is not None
+        ):
+            with self._open(md5, file) as f:
+                signal = self._read_hdf5(f, md5)
+            if signal.shape != row.shape:
+                raise OSError(
+                    f"Signal of size {signal.shape[0]}, expected {row.shape[0]} bins."
+                )
+            row[:] = signal
+            self._normalize(row)
+            return
+
+        with self._open(md5, file) as f:
+            datasets = [self._get_header_group(f, md5)[chrom] for chrom in self._chroms]
+            factor = self._downsampling_factor(f)
+            lengths = [
+                downsampled_length(dataset.shape[0], factor) for dataset in datasets
+            ]
+            if sum(lengths) != row.shape[0]:
+                raise OSError(
+                    f"Signal of size {sum(lengths)}, expected {row.shape[0]} bins."
+                )
+            self._read_chroms(datasets, factor, lengths, row)
+
+            mask = self._get_mask(f, lengths)
+            if mask is not None:
+                row[mask] = 0
+
+        self._normalize(row)
+
+    def _read_bins(self, file: h5py.File, md5: str) -> np.ndarray:
+        """Read and return the selected bins of the genome signal for open hdf5 file.
+
+        Each chromosome only reads its selected elements, unless the whole signal
+        is needed for normalization. Chromosomes are then read one at a time.
+
+        Raises:
+            OSError: if a bin index is outside of the signal.
+            FloatingPointError: if normalization fails.
+        """
+        hdf5_data = self._get_header_group(file, md5)
+        datasets: List[h5py.Dataset] = [hdf5_data[chrom] for chrom in self._chroms]  # type: ignore
+
+        factor = self._downsampling_factor(file)
+        lengths = [downsampled_length(dataset.shape[0], factor) for dataset in datasets]
+        offsets = np.cumsum([0] + lengths)
+        mask = self._get_mask(file, lengths)
+        unique_bins, inverse = np.unique(self._bin_indexes, return_inverse=True)  # type: ignore
+        if unique_bins.size and unique_bins[-1] >= offsets[-1]:
+            raise OSError(
+                f"Bin index {unique_bins[-1]} outside of signal of size {offsets[-1]}."
+            )
+
+        if self._normalization == "robust":
+            # Medians need the whole signal at once.
+            signal = self._normalize(self._read_hdf5(file, md5))
+            return signal[self._bin_indexes]
+
+        values = np.empty(shape=unique_bins.shape, dtype=np.float32)
+        bounds = np.searchsorted(unique_bins, offsets)
+        stats = (0, 0.0, 0.0)
+        shift = None
+        for i, dataset in enumerate(datasets):
+            start, end = bounds[i], bounds[i + 1]
+            local_bins = unique_bins[start:end] - offsets[i]
+            chrom_mask = None if mask is None else mask[offsets[i] : offsets[i + 1]]
+            if self._normalization is not None:
+                chrom_signal = hdf5_chroms.read_chrom(dataset, factor, self._downsampling)
+                chrom_signal = chrom_signal.astype(np.float64)
+                if chrom_mask is not None:
+                    chrom_signal[chrom_mask] = 0
+                if self._normalization == "log1p_zscore":
+                    with np.errstate(all="raise"):
+                        np.log1p(chrom_signal, out=chrom_signal)
+                values[start:end] = chrom_signal[local_bins]
+                if shift is None and chrom_signal.size:
+                    shift = float(chrom_signal[0])
+                chrom_signal -= shift
+                stats = Hdf5Loader._combine_stats(stats, chrom_signal)
+            elif end > start:
+                if factor == 1:
+                    values[start:end] = dataset[local_bins]
+                else:
+                    chrom_signal = hdf5_chroms.read_chrom(
+                        dataset, factor, self._downsampling
                     )
-                    raise err from None
-                continue
+                    values[start:end] = chrom_signal[local_bins]
+                if chrom_mask is not None:
+                    values[start:end][chrom_mask[local_bins]] = 0
 
-        self._signals = signals
+        if self._normalization is not None:
+            count, mean, m2 = stats
+            with np.errstate(all="raise"):
+                values -= (shift or 0.0) + mean
+                values /= np.sqrt(np.float64(m2) / count)
 
-        return self
+        return values[inverse]
 
-    def _read_hdf5(self, file: h5py.File, md5: str) -> np.ndarray:
-        """Read and return concatenated genome signal for open hdf5 file."""
+    @staticmethod
+    def _combine_stats(
+        stats: Tuple[int, float, float], array: np.ndarray
+    ) -> Tuple[int, float, float]:
+        """Return (count, mean, sum of squared deviations) of previous values and array.
+
+        Uses Chan et al. pairwise update, so values can be processed in chunks.
+        Values should be shifted by a value close to their mean (e.g. the first one),
+        so that constant signals have exactly zero variance.
+        """
+        count, mean, m2 = stats
+        array_count = array.size
+        if array_count == 0:
+            return stats
+        array_mean = float(array.mean())
+        array_m2 = float(np.square(array - array_mean).sum())
+
+        total = count + array_count
+        delta = array_mean - mean
+        mean = mean + delta * array_count / total
+        m2 = m2 + array_m2 + delta**2 * count * array_count / total
+        return total, mean, m2
+
+    def _open(self, md5: str, file: Path) -> h5py.File | BundleSample:
+        """Return the open hdf5 file of md5, or its sample if file is an hdf5 bundle."""
+        bundle = self._bundles.get(file)
+        if bundle is not None:
+            return bundle.open_sample(md5)
+        return h5py.File(file, "r")
+
+    @staticmethod
+    def _get_header_group(file: h5py.File | BundleSample, md5: str) -> h5py.Group:
+        """Return the group containing the chromosome datasets of an open hdf5 file."""
+        if isinstance(file, BundleSample):
+            return file  # type: ignore
         try:
             header = list(file.keys())[0]
         except IndexError as e:
             raise OSError(f"Header not found in {md5}") from e
+        return file[header]  # type: ignore
+
+    def _read_hdf5(self, file: h5py.File, md5: str) -> np.ndarray:
+        """Read and return concatenated genome signal for open hdf5 file, masked if set so."""
+        datasets = [self._get_header_group(file, md5)[chrom] for chrom in self._chroms]
+
+        factor = self._downsampling_factor(file)
+        lengths = [downsampled_length(dataset.shape[0], factor) for dataset in datasets]
+        signal = np.empty(sum(lengths), dtype=np.float32)
+        self._read_chroms(datasets, factor, lengths, signal)
+
+        mask = self._get_mask(file, lengths)
+        if mask is None:
+            return signal
+        if self._mask_mode == "drop":
+            return signal[~mask]
+        signal[mask] = 0
+        return signal
+
+    def _read_chroms(
+        self,
+        datasets: List[h5py.Dataset],
+        factor: int,
+        lengths: List[int],
+        signal: np.ndarray,
+    ) -> None:
+        """Read chromosome datasets into the concatenated signal, chrom_jobs at a time.
+        See hdf5_chroms.read_chroms.
+        """
+        hdf5_chroms.read_chroms(
+            datasets,
+            factor,
+            lengths,
+            signal,
+            chrom_jobs=self._config.chrom_jobs,
+            downsampling=self._downsampling,
+        )
+
+    def _get_mask(self, file: h5py.File, lengths: List[int]) -> np.ndarray | None:
+        """Return the mask of the concatenated signal of open hdf5 file, with chromosomes
+        of given lengths, or None if there is no mask.
 
-        hdf5_data = file[header]
+        Masks from a BED file are computed once per resolution and chromosome lengths.
 
-        chrom_signals = [hdf5_data[chrom][...] for chrom in self._chroms]  # type: ignore
-        return np.concatenate(chrom_signals, dtype=np.float32)  # type: ignore
+        Raises:
+            OSError: if a mask array does not match the signal size, or the resolution is unknown.
+        """
+        if self._mask_array is not None:
+            if self._mask_array.size != sum(lengths):
+                raise OSError(
+                    f"Mask of size {self._mask_array.size}, signal of size {sum(lengths)}."
+                )
+            return self._mask_array
+        if self._mask_regions is None:
+            return None
+
+        resolution = self._resolution or Hdf5Loader._get_resolution(file)
+        key = (resolution, tuple(lengths))
+        if key not in self._masks:
+            self._masks[key] = Hdf5Loader.bed_bin_mask(
+                self._mask_regions, self._chroms, lengths, resolution
+            )
+        return self._masks[key]
+
+    @staticmethod
+    def _get_resolution(file: h5py.File) -> int:
+        """Return the bin size of open hdf5 file, from its 'bin' attribute or its name."""
+        try:
+            return int(file.attrs["bin"][0])  # type: ignore
+        except KeyError:
+            pass
+        try:
+            return EpiDataSource.get_resolution_from_filename(Path(file.filename))
+        except (IndexError, KeyError) as err:
+            raise OSError(f"Resolution not found for {file.filename}.") from err
+
+    def _downsampling_factor(self, file: h5py.File) -> int:
+        """Return the number of bins of open hdf5 file reduced into one loaded bin.
+
+        Raises:
+            OSError: if the file resolution does not divide the loader resolution.
+        """
+        if self._resolution is None:
+            return 1
+        file_resolution = Hdf5Loader._get_resolution(file)
+        if self._resolution % file_resolution:
+            raise OSError(
+                f"Cannot load resolution {self._resolution} from resolution {file_resolution}."
+            )
+        return self._resolution // file_resolution
+
+    def _mask_hash(self) -> str:
+        """Return a hash of the mask content."""
+        hasher = hashlib.sha256()
+        if self._mask_array is not None:
+            hasher.update(str(self._mask_array.size).encode("utf-8"))
+            hasher.update(np.packbits(self._mask_array).tobytes())
+        elif self._mask_regions is not None:
+            for chrom in sorted(self._mask_regions):
+                hasher.update(chrom.encode("utf-8"))
+                hasher.update(self._mask_regions[chrom].tobytes())
+        return hasher.hexdigest()
 
     def _normalize(self, array: np.ndarray) -> np.ndarray:
-        """Normalize array if internal flag set so.
+        """Normalize float array in place if internal flag set so, and return it.
+
+        Statistics are accumulated in float64, by chunks, so the only full size
+        temporary is the copy needed by the medians of robust normalization.
 
         If normalization is not set, return array as is.
 
         Raises:
-            FloatingPointError: if operation fails
+            FloatingPointError: if operation fails (e.g. zero variance)
         """
-        if self._normalization:
-            with np.errstate(all="raise"):
-                return (array - array.mean()) / array.std()
+        if self._normalization is None:
+            return array
+
+        with np.errstate(all="raise"):
+            if self._normalization == "log1p_zscore":
+                np.log1p(array, out=array)
+
+            if self._normalization == "robust":
+                center, scale = Hdf5Loader._robust_stats(array)
+            else:
+                shift = float(array[0]) if array.size else 0.0
+                stats = (0, 0.0, 0.0)
+                for start in range(0, array.size, STATS_CHUNK_SIZE):
+                    chunk = array[start : start + STATS_CHUNK_SIZE].astype(np.float64)
+                    chunk -= shift
+                    stats = Hdf5Loader._combine_stats(stats, chunk)
+                count, mean, m2 = stats
+                center = shift + mean
+                scale = np.sqrt(np.float64(m2) / count)
+
+            array -= center
+            array /= scale
         return array
 
+    @staticmethod
+    def _robust_stats(array: np.ndarray) -> Tuple[float, float]:
+        """Return median and scaled median absolute deviation of array."""
+        buffer = array.copy()
+        median = np.median(buffer, overwrite_input=True)
+        np.subtract(array, median, out=buffer)
+        np.abs(buffer, out=buffer)
+        mad = np.median(buffer, overwrite_input=True)
+        return float(median), MAD_TO_STD * np.float64(mad)
+
     @staticmethod
     def extract_md5(file_name: Path, verbose: bool = False) -> str:
         """Extract the md5 string from file path with specific naming convention.
@@ -0,0 +1,115 @@
+"""Module for the Hdf5Loader options that default to environment variables."""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Any
+
+from epi_ml.core import memory_planner
+from epi_ml.core.memory_planner import MEMORY_POLICIES
+from epi_ml.core.quantization import SIGNAL_DTYPES
+from epi_ml.core.signal_memory_cache import parse_size
+
+POOL_TYPES = frozenset(["thread", "process"])
+
+# option: (environment variable, default if unset)
+ENV_OPTIONS = {
+    "n_jobs": ("HDF5_LOADER_JOBS", "1"),
+    "pool": ("HDF5_LOADER_POOL", "process"),
+    "cache_dir": ("HDF5_CACHE_DIR", None),
+    "dtype": ("HDF5_LOADER_DTYPE", "float32"),
+    "stage_dir": ("HDF5_STAGE_DIR", None),
+    "stage_archive": ("HDF5_STAGE_ARCHIVE", None),
+    "chrom_jobs": ("HDF5_CHROM_JOBS", "1"),
+    "memory_policy": ("HDF5_MEMORY_POLICY", "mmap"),
+}
+
+
+def _env_default(option: str, value: Any) -> Any:
+    """Return value, or the environment default of option if value is None (see ENV_OPTIONS)."""
+    if value is not None:
+        return value
+    variable, default = ENV_OPTIONS[option]
+    return os.getenv(variable, default)
+
+
+class Hdf5LoaderConfig:
+    """How an Hdf5Loader reads, stores and caches signals, independently of the signals themselves.
+
+    Options that are not given are read from their environment variable (see ENV_OPTIONS).
+
+    n_jobs: Number of files loaded concurrently. Defaults to $HDF5_LOADER_JOBS, or 1 (serial loading).
+    pool: "process" or "thread", kind of worker pool used when n_jobs > 1.
+        Defaults to $HDF5_LOADER_POOL, or "process". h5py serializes calls
+        within a process, so threads only overlap normalization and file system latency.
+    cache_dir: Directory of consolidated signal caches (see Hdf5Loader.load_hdf5s_matrix).
+        Defaults to $HDF5_CACHE_DIR, or no cache. An empty string disables the cache.
+    dtype: Storage of signal matrices (see Hdf5Loader.load_hdf5s_matrix), "float32", "float16",
+        or "int8" (QuantizedSignals, int8 values scaled per signal). Signals are normalized
+        in float32 before their precision is reduced. Defaults to $HDF5_LOADER_DTYPE, or "float32".
+    stage_dir: Node-local directory where files are copied in the background before
+        being read (see Hdf5Stager), each file is loaded as soon as it is staged.
+        Defaults to $HDF5_STAGE_DIR, or no staging.
+    stage_archive: Tar file holding the hdf5s, extracted to stage_dir instead of copying
+        the listed files. Defaults to $HDF5_STAGE_ARCHIVE.
+    chrom_jobs: Number of chromosome datasets of one file read concurrently, each into its
+        place in the signal. Defaults to $HDF5_CHROM_JOBS, or 1. Useful for few large files
+        (e.g. 1kb resolution), where loading files concurrently does not help.
+        Uncompressed contiguous datasets are read outside of h5py, so reads really overlap.
+    memory_budget: Memory available for signals, in bytes or like "48G". Before loading,
+        the peak memory of the signals is estimated (see MemoryPlan), and compared to it.
+        Defaults to memory_planner.memory_budget (from $HDF5_MEMORY_BUDGET or SLURM), no check if unknown.
+    memory_policy: What to do when the estimate is over the budget. "mmap" loads the signals
+        into a disk-backed memory-mapped matrix (see memory_planner.spill_matrix), if its copies fit,
+        "fail" raises MemoryError with the estimate. Defaults to $HDF5_MEMORY_POLICY, or "mmap".
+    """
+
+    def __init__(
+        self,
+        *,
+        n_jobs: int | None = None,
+        pool: str | None = None,
+        cache_dir: Path | str | None = None,
+        dtype: str | None = None,
+        stage_dir: Path | str | None = None,
+        stage_archive: Path | str | None = None,
+        chrom_jobs: int | None = None,
+        memory_budget: int | str | None = None,
+        memory_policy: str | None = None,
+    ):
+        self.n_jobs = int(_env_default("n_jobs", n_jobs))
+        if self.n_jobs < 1:
+            raise ValueError(f"n_jobs must be >= 1. Got {self.n_jobs}.")
+
+        self.pool = _env_default("pool", pool)
+        if self.pool not in POOL_TYPES:
+            raise ValueError(
+                f"pool must be one of {sorted(POOL_TYPES)}. Got {self.pool}."
+            )
+
+        cache_dir = _env_default("cache_dir", cache_dir)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+
+        self.dtype = _env_default("dtype", dtype)
+        if self.dtype not in SIGNAL_DTYPES:
+            raise ValueError(
+                f"dtype must be one of {sorted(SIGNAL_DTYPES)}. Got {self.dtype}."
+            )
+
+        stage_dir = _env_default("stage_dir", stage_dir)
+        self.stage_dir = Path(stage_dir) if stage_dir else None
+        stage_archive = _env_default("stage_archive", stage_archive)
+        self.stage_archive = Path(stage_archive) if stage_archive else None
+
+        self.chrom_jobs = int(_env_default("chrom_jobs", chrom_jobs))
+        if self.chrom_jobs < 1:
+            raise ValueError(f"chrom_jobs must be >= 1. Got {self.chrom_jobs}.")
+
+        if memory_budget is None:
+            memory_budget = memory_planner.memory_budget()
+        self.memory_budget = None if memory_budget is None else parse_size(memory_budget)
+        self.memory_policy = _env_default("memory_policy", memory_policy)
+        if self.memory_policy not in MEMORY_POLICIES:
+            raise ValueError(
+                f"memory_policy must be one of {sorted(MEMORY_POLICIES)}. Got {self.memory_policy}."
+            )
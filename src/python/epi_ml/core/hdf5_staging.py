@@ -0,0 +1,235 @@
+"""Module for staging hdf5 files to node-local scratch, in the background."""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sys
+import tarfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+COPY_BUFFER_SIZE = 2**24
+
+
+class Hdf5Stager:
+    """Copies files to a local directory with a pool of threads, while they are being used.
+
+    Each file gets a future of its local path, done when the file is staged.
+    Files are staged in the given order. Copies get the modification time of their
+    source, a file already in the local directory with the same size and modification
+    time as its source is not copied again. Copies are written to a temporary name
+    then renamed, so the local directory only holds complete files, usable later by
+    Hdf5Loader.adapt_to_environment.
+
+    If an archive (tar file, can be compressed) is given, files are extracted from it
+    instead, by a single thread reading the archive once. Members are matched by file name.
+    Extracted files are recorded in a manifest next to them, with the archive path, size
+    and modification time. They are not extracted again while the archive is unchanged.
+
+    Use as a context manager, leaving it cancels staging that has not started.
+
+    stage_dir: Local directory, created if needed.
+    n_jobs: Number of concurrent copies. Defaults to $HDF5_STAGE_JOBS, or 4.
+    archive: Tar file holding the files.
+    """
+
+    def __init__(
+        self,
+        stage_dir: Path | str,
+        n_jobs: int | None = None,
+        archive: Path | str | None = None,
+    ):
+        self._stage_dir = Path(stage_dir)
+        if n_jobs is None:
+            n_jobs = int(os.getenv("HDF5_STAGE_JOBS", "4"))
+        if n_jobs < 1:
+            raise ValueError(f"n_jobs must be >= 1. Got {n_jobs}.")
+        self._n_jobs = n_jobs
+        self._archive = Path(archive) if archive else None
+        self._executor = None
+        self._futures = []
+        self._stop = threading.Event()
+
+    def __enter__(self) -> Hdf5Stager:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Cancel pending copies, and wait for running ones."""
+        self._stop.set()
+        for future in self._futures:
+            future.cancel()
+        self._futures = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stage(self, files: Dict[str, Path]) -> Dict[str, Future]:
+        """Start staging given {md5:path} files. Return {md5:future of local path}.
+
+        Futures raise OSError if a file cannot be staged or its staged size is wrong.
+        Files with the same path are staged once.
+        """
+        self._stage_dir.mkdir(parents=True, exist_ok=True)
+        self._stop.clear()
+        if self._executor is None:
+            max_workers = 1 if self._archive is not None else self._n_jobs
+            self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        path_futures: Dict[Path, Future] = {}
+        if self._archive is not None:
+            wanted = {}
+            for path in files.values():
+                if path not in path_futures:
+                    path_futures[path] = wanted[path.name] = Future()
+            self._futures.append(self._executor.submit(self._extract, wanted))
+        else:
+            for path in files.values():
+                if path not in path_futures:
+                    path_futures[path] = self._executor.submit(self._copy, path)
+                    self._futures.append(path_futures[path])
+
+        return {md5: path_futures[path] for md5, path in files.items()}
+
+    def _copy(self, source: Path) -> Path:
+        """Copy source to the local directory if needed, and return the local path.
+
+        Raises:
+            OSError: if source cannot be read or the copy does not have the source size.
+        """
+        destination = self._stage_dir / source.name
+        stat = source.stat()
+        if destination.is_file():
+            staged = destination.stat()
+            if (staged.st_size, staged.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                return destination
+
+        tmp_destination = destination.with_name(f".{destination.name}.{os.getpid()}.tmp")
+        try:
+            with open(source, "rb") as src, open(tmp_destination, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+            Hdf5Stager._check_size(tmp_destination, stat.st_size, source)
+            os.utime(tmp_destination, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.replace(tmp_destination, destination)
+        finally:
+            tmp_destination.unlink(missing_ok=True)
+        return destination
+
+    def _extract(self, wanted: Dict[str, Future]) -> None:
+        """Extract wanted {file name:future} files from the archive, in archive order,
+        and set their futures. Files already extracted from the same archive
+        (see _read_manifest) are not extracted again.
+        """
+        try:
+            archive_stamp = self._archive_stamp()
+        except OSError:
+            archive_stamp = None
+        extracted = self._read_manifest(archive_stamp)
+
+        pending = {}
+        for name, future in wanted.items():
+            destination = self._stage_dir / name
+            if destination.is_file() and destination.stat().st_size == extracted.get(
+                name
+            ):
+                future.set_result(destination)
+            else:
+                pending[name] = future
+
+        try:
+            with tarfile.open(self._archive, "r:*") as archive:  # type: ignore
+                for member in archive:
+                    if not pending or self._stop.is_set():
+                        break
+                    name = Path(member.name).name
+                    if not member.isfile() or name not in pending:
+                        continue
+                    future = pending.pop(name)
+                    try:
+                        destination = self._extract_member(archive, member)
+                    except OSError as err:
+                        future.set_exception(err)
+                        continue
+                    extracted[name] = member.size
+                    future.set_result(destination)
+        except (OSError, tarfile.TarError) as err:
+            for future in pending.values():
+                future.set_exception(
+                    OSError(f"Cannot extract from {self._archive}: {err}")
+                )
+            return
+        finally:
+            if archive_stamp is not None:
+                self._write_manifest(archive_stamp, extracted)
+
+        for name, future in pending.items():
+            if self._stop.is_set():
+                future.set_exception(OSError("Staging stopped."))
+            else:
+                future.set_exception(OSError(f"{name} not found in {self._archive}."))
+
+    def _archive_stamp(self) -> List:
+        """Return [path, size, modification time] of the archive."""
+        stat = self._archive.stat()  # type: ignore
+        return [str(self._archive.resolve()), stat.st_size, stat.st_mtime_ns]  # type: ignore
+
+    def _manifest_path(self) -> Path:
+        """Return the manifest of the files extracted from the archive."""
+        return self._stage_dir / f".{self._archive.name}.staged.json"  # type: ignore
+
+    def _read_manifest(self, archive_stamp: List | None) -> Dict[str, int]:
+        """Return {file name:size} of files extracted from the archive of archive_stamp.
+
+        Empty if the manifest is missing, or was written for another archive or version.
+        """
+        try:
+            with open(self._manifest_path(), "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if archive_stamp is None or manifest.get("archive") != archive_stamp:
+            return {}
+        return manifest.get("files", {})
+
+    def _write_manifest(self, archive_stamp: List, extracted: Dict[str, int]) -> None:
+        """Write the manifest of files extracted from the archive of archive_stamp."""
+        path = self._manifest_path()
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump({"archive": archive_stamp, "files": extracted}, file)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            print(f"Could not write staging manifest {path}: {err}", file=sys.stderr)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def _extract_member(self, archive: tarfile.TarFile, member: tarfile.TarInfo) -> Path:
+        """Extract one archive member to the local directory, and return its local path."""
+        destination = self._stage_dir / Path(member.name).name
+        tmp_destination = destination.with_name(f".{destination.name}.{os.getpid()}.tmp")
+        try:
+            src = archive.extractfile(member)
+            if src is None:
+                raise OSError(f"Cannot extract {member.name} from {self._archive}.")
+            with src, open(tmp_destination, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+            Hdf5Stager._check_size(tmp_destination, member.size, Path(member.name))
+            os.replace(tmp_destination, destination)
+        finally:
+            tmp_destination.unlink(missing_ok=True)
+        return destination
+
+    @staticmethod
+    def _check_size(path: Path, size: int, source: Path) -> None:
+        """Raise OSError if path does not have the expected size."""
+        staged_size = path.stat().st_size
+        if staged_size != size:
+            raise OSError(
+                f"Staged {source.name} has {staged_size} bytes, expected {size} bytes."
+            )
@@ -9,6 +9,8 @@ import pandas as pd
 from lightgbm import log_evaluation
 
 from epi_ml.core.epiatlas_treatment import EpiAtlasFoldFactory
+from epi_ml.core.quantization import to_float32
+from epi_ml.core.thread_budget import available_cpus
 
 # TODO: Permit native saving/loading. # https://stackoverflow.com/questions/55208734/save-lgbmregressor-model-from-python-lightgbm-package-to-disc
 
@@ -43,22 +45,27 @@ def tune_lgbm(ea_handler: EpiAtlasFoldFactory, logdir: Path):
         "seed": 42,
         "force_col_wise": True,
         "device_type": "cpu",
-        "num_threads": 9,
+        "num_threads": available_cpus(),
     }
 
     # Using first fold to tune hyperparams
     dsets = next(ea_handler.yield_split())
 
+    # oversampled signals are weighted instead of repeated
+    train_signals, train_labels, train_weights = dsets.train.weighted_signals()
     dtrain = lgb.Dataset(  # type: ignore
-        dsets.train.signals, label=dsets.train.encoded_labels, free_raw_data=True
+        to_float32(train_signals),
+        label=train_labels,
+        weight=train_weights,
+        free_raw_data=True,
     )
     dvalid = lgb.Dataset(  # type: ignore
-        dsets.validation.signals,
+        to_float32(dsets.validation.signals),
         label=dsets.validation.encoded_labels,
         free_raw_data=True,
     )
-    dsets = None
-    del dsets
+    dsets = train_signals = None
+    del dsets, train_signals
 
     # Create tuner
     max_iter = 100  # boosting rounds per trial
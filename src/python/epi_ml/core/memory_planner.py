@@ -0,0 +1,195 @@
+"""Module to check that signal matrices fit in the job memory before loading them."""
+from __future__ import annotations
+
+import collections
+import os
+import sys
+import tempfile
+from typing import TYPE_CHECKING, Iterable, Tuple
+
+import numpy as np
+
+from epi_ml.core.quantization import QuantizedSignals
+from epi_ml.core.shared_signals import shared_matrix
+from epi_ml.core.signal_memory_cache import parse_size
+
+if TYPE_CHECKING:
+    from epi_ml.core.signal_cache import SignalCache
+
+MEMORY_POLICIES = frozenset(["mmap", "fail"])
+MEMORY_FRACTION = 0.8  # of the job memory, the rest is left to models and python objects
+SLURM_MEMORY_UNIT = 2**20  # SLURM memory variables are in MB
+
+
+def memory_budget() -> int | None:
+    """Return the memory available for signals, in bytes, or None if unknown.
+
+    $HDF5_MEMORY_BUDGET (e.g. "48G") if set, else 80% of the job memory given by SLURM:
+    $SLURM_MEM_PER_NODE, or $SLURM_MEM_PER_CPU times $SLURM_CPUS_ON_NODE.
+    """
+    budget = os.getenv("HDF5_MEMORY_BUDGET")
+    if budget:
+        return parse_size(budget)
+
+    job_memory = _slurm_size(os.getenv("SLURM_MEM_PER_NODE"))
+    if job_memory is None:
+        cpu_memory = _slurm_size(os.getenv("SLURM_MEM_PER_CPU"))
+        n_cpus = int(os.getenv("SLURM_CPUS_ON_NODE", "1"))
+        if cpu_memory is not None:
+            job_memory = cpu_memory * n_cpus
+    if job_memory is None:
+        return None
+    return int(job_memory * MEMORY_FRACTION)
+
+
+def _slurm_size(value: str | None) -> int | None:
+    """Return the bytes of a SLURM memory value (MB without unit), None if unset or 0 (all memory)."""
+    if not value:
+        return None
+    n_bytes = int(value) * SLURM_MEMORY_UNIT if value.isdigit() else parse_size(value)
+    return n_bytes or None
+
+
+def oversampling_ratio(labels: Iterable) -> float:
+    """Return the size ratio of a dataset oversampled to balance given labels (see RandomOverSampler)."""
+    counts = collections.Counter(labels)
+    if not counts:
+        return 1.0
+    return len(counts) * max(counts.values()) / sum(counts.values())
+
+
+def max_workers(
+    worker_bytes: int, shared_bytes: int = 0, budget: int | None = None
+) -> int | None:
+    """Return how many concurrent workers fit in the budget, each using worker_bytes
+    on top of shared_bytes used by all of them (e.g. shared signals).
+
+    At least one worker, None if the budget is unknown (no limit).
+    """
+    if budget is None:
+        return None
+    return max(1, (budget - shared_bytes) // max(worker_bytes, 1))
+
+
+def spill_dir() -> str:
+    """Return the directory of disk-backed matrices: $HDF5_SPILL_DIR, else $SLURM_TMPDIR,
+    else the system temporary directory.
+    """
+    return (
+        os.getenv("HDF5_SPILL_DIR") or os.getenv("SLURM_TMPDIR") or tempfile.gettempdir()
+    )
+
+
+def spill_matrix(shape: Tuple[int, int], dtype: np.dtype | str) -> np.ndarray:
+    """Return an empty disk-backed (memory-mapped) matrix.
+
+    The file is created in spill_dir, and is deleted when the matrix is no longer used.
+    """
+    if 0 in shape:
+        return np.empty(shape=shape, dtype=dtype)
+    with tempfile.TemporaryFile(dir=spill_dir(), suffix=".signals") as file:
+        return np.memmap(file, dtype=dtype, mode="w+", shape=shape)
+
+
+def new_matrix(
+    shape: Tuple[int, int],
+    dtype: str,
+    cache: SignalCache | None = None,
+    mapped: bool = False,
+    shared: bool = False,
+) -> np.ndarray | QuantizedSignals:
+    """Return an empty signal matrix of dtype (one of SIGNAL_DTYPES), in memory,
+    created by the cache, or memory-mapped to a temporary file if mapped (see spill_matrix).
+    If shared, in shared memory files (see shared_matrix), in spill_dir if mapped.
+
+    Int8 matrices are QuantizedSignals, with scales of 1.
+    """
+    if cache is not None:
+        values = cache.create_matrix(shape, dtype=np.dtype(dtype))
+    elif shared:
+        values = shared_matrix(shape, dtype, directory=spill_dir() if mapped else None)
+    elif mapped:
+        values = spill_matrix(shape, dtype=dtype)
+    else:
+        values = np.empty(shape=shape, dtype=dtype)
+
+    if dtype == "int8":
+        if shared and cache is None:
+            scales = shared_matrix(shape[:1], np.float32)
+            scales[:] = 1
+        else:
+            scales = np.ones(shape[0], dtype=np.float32)
+        return QuantizedSignals(values, scales)
+    return values
+
+
+class MemoryPlan:
+    """Estimated peak memory of a (n_files, n_bins) signal matrix, and of the copies made from it.
+
+    n_files: Number of signals.
+    n_bins: Signal length.
+    dtype: Storage dtype, one of SIGNAL_DTYPES. Int8 signals also have a float32 scale per signal.
+    copies: Number of in-memory copies of the whole matrix made after loading,
+        e.g. subsamples and oversampling. Can be fractional.
+    budget: Available memory in bytes, None if unknown (always fits).
+    """
+
+    def __init__(
+        self,
+        n_files: int,
+        n_bins: int,
+        dtype: str,
+        copies: float = 0,
+        budget: int | None = None,
+    ):
+        self.n_files = n_files
+        self.n_bins = n_bins
+        self.dtype = dtype
+        self.copies = copies
+        self.budget = budget
+
+    @property
+    def matrix_bytes(self) -> int:
+        """Return the size of the signal matrix."""
+        row_bytes = self.n_bins * np.dtype(self.dtype).itemsize
+        if self.dtype == "int8":
+            row_bytes += np.dtype(np.float32).itemsize
+        return self.n_files * row_bytes
+
+    def peak_bytes(self, mapped: bool = False) -> int:
+        """Return the estimated peak memory. A memory-mapped matrix is not counted, only its copies."""
+        return int(self.matrix_bytes * (self.copies + (0 if mapped else 1)))
+
+    def fits(self, mapped: bool = False) -> bool:
+        """Return True if the peak memory is within the budget."""
+        return self.budget is None or self.peak_bytes(mapped) <= self.budget
+
+    def needs_mapping(self, policy: str, mapped: bool = False) -> bool:
+        """Return True if the matrix must be memory-mapped to fit in the budget,
+        with the given memory policy (one of MEMORY_POLICIES).
+
+        If mapped, the matrix is already memory-mapped (e.g. cached) and only copies are checked.
+
+        Raises:
+            MemoryError: if the signals do not fit, even memory-mapped if the policy allows it.
+        """
+        if self.fits(mapped):
+            return False
+
+        report = self.report()
+        if not mapped and policy == "mmap" and self.fits(mapped=True):
+            print(f"{report}\nUsing a memory-mapped signal matrix.", file=sys.stderr)
+            return True
+        print(report, file=sys.stderr)
+        raise MemoryError(f"Signals do not fit in memory budget. {report}")
+
+    def report(self) -> str:
+        """Return a readable summary of the estimate."""
+        gib = 2**30
+        budget = "unknown" if self.budget is None else f"{self.budget / gib:.1f} GiB"
+        return (
+            f"Signal matrix of {self.n_files} files x {self.n_bins} bins ({self.dtype}): "
+            f"{self.matrix_bytes / gib:.1f} GiB, {self.copies:.2f} more copies expected.\n"
+            f"Estimated peak memory: {self.peak_bytes() / gib:.1f} GiB in memory, "
+            f"{self.peak_bytes(mapped=True) / gib:.1f} GiB memory-mapped. Budget: {budget}."
+        )
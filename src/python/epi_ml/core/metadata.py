@@ -9,21 +9,188 @@ import marshal
 import os
 import sys
 from collections import Counter, defaultdict
-from collections.abc import ItemsView, KeysView, ValuesView
+from collections.abc import ItemsView, KeysView, Mapping, ValuesView
 from difflib import SequenceMatcher as SM
 from pathlib import Path
-from typing import Dict, Iterable, List, Set, Tuple
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
 
+import numpy as np
 import pandas as pd
 
+from epi_ml.core.metadata_cache import MetadataCache
+
+_MISSING = object()  # label of datasets without a category
+_IMMUTABLE = (str, int, float, bool, type(None), tuple, frozenset)
+
+
+class _SharedDataset(dict):
+    """Dataset dict of a Metadata entry shared with other Metadata copies.
+
+    Holds a shallow copy of the shared dict. The entry of its Metadata is copied
+    on the first write, then every write goes to both, so the other copies never
+    see them. A Metadata hands out one wrapper per dataset (see Metadata._dataset).
+
+    Datasets with mutable values (e.g. lists) are copied when wrapped instead,
+    their values can be modified in place without a write.
+
+    Pickled (and deep copied) as a plain dict.
+    """
+
+    def __init__(self, metadata: Metadata, md5: str):
+        # pylint: disable=protected-access
+        dataset = metadata._metadata[md5]
+        if not all(isinstance(value, _IMMUTABLE) for value in dataset.values()):
+            dataset = metadata._own(md5)
+        super().__init__(dataset)
+        self._owner = metadata
+        self._md5 = md5
+
+    def _entry(self) -> dict:
+        """Return the entry of the Metadata, copied from this dict on the first write."""
+        return self._owner._own(self._md5)  # pylint: disable=protected-access
+
+    def __setitem__(self, key, value):
+        self._entry()[key] = value
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        entry = self._entry()
+        super().__delitem__(key)
+        del entry[key]
+
+    def clear(self):
+        self._entry().clear()
+        super().clear()
+
+    def pop(self, *args):
+        entry = self._entry()
+        value = super().pop(*args)
+        entry.pop(*args)
+        return value
+
+    def popitem(self):
+        entry = self._entry()
+        key, value = super().popitem()
+        del entry[key]
+        return key, value
+
+    def setdefault(self, key, default=None):
+        self._entry().setdefault(key, default)
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        other = dict(*args, **kwargs)
+        self._entry().update(other)
+        super().update(other)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+class _Datasets(Mapping):
+    """md5:dataset mapping of a Metadata, with shared datasets wrapped for copy-on-write."""
+
+    def __init__(self, metadata: Metadata):
+        self._metadata = metadata
+
+    def __getitem__(self, md5):
+        return self._metadata[md5]
+
+    def __iter__(self) -> Iterator:
+        return iter(self._metadata.md5s)
+
+    def __len__(self) -> int:
+        return len(self._metadata)
+
+
+class _MetadataIndex:
+    """Columnar index of a md5:dataset dict, for vectorized counting, grouping and filtering.
+
+    Each indexed category is stored as its distinct labels, in order of first appearance,
+    and the label code of each dataset. Datasets without the category have the _MISSING label.
+    Categories are indexed on first use.
+    """
+
+    def __init__(self, metadata: Dict[str, dict]):
+        self._metadata = metadata
+        self.md5s = np.array(list(metadata), dtype=object)
+        self._sorted_order: np.ndarray | None = None
+        self._positions: Dict[str, int] | None = None
+        self._columns: Dict[str, Tuple[list, np.ndarray]] = {}
+
+    @property
+    def sorted_order(self) -> np.ndarray:
+        """Return the dataset positions sorted by md5."""
+        if self._sorted_order is None:
+            self._sorted_order = np.argsort(self.md5s, kind="stable")
+        return self._sorted_order
+
+    def column(self, category: str) -> Tuple[list, np.ndarray]:
+        """Return the labels of category, and the label code of each dataset."""
+        if category not in self._columns:
+            label_codes = {}
+            codes = np.fromiter(
+                (
+                    label_codes.setdefault(dset.get(category, _MISSING), len(label_codes))
+                    for dset in self._metadata.values()
+                ),
+                dtype=np.int64,
+                count=len(self.md5s),
+            )
+            self._columns[category] = (list(label_codes), codes)
+        return self._columns[category]
+
+    def clear_columns(self) -> None:
+        """Forget indexed categories, e.g. after datasets were modified."""
+        self._columns.clear()
+
+    def check_columns(self, md5s: Iterable[str]) -> None:
+        """Forget indexed categories where a label of given datasets changed,
+        e.g. of datasets handed out, which can be modified in place.
+        """
+        if not self._columns:
+            return
+        if self._positions is None:
+            self._positions = {md5: position for position, md5 in enumerate(self.md5s)}
+        positions = [
+            (self._positions[md5], self._metadata[md5])
+            for md5 in md5s
+            if md5 in self._positions
+        ]
+        for category, (labels, codes) in list(self._columns.items()):
+            for position, dset in positions:
+                label = dset.get(category, _MISSING)
+                indexed = labels[codes[position]]
+                if label is not indexed and label != indexed:
+                    del self._columns[category]
+                    break
+
 
 class Metadata:
     """
     Wrapper around metadata md5:dataset dict.
 
+    Copies made with copy() share the dataset dicts, a dataset is only copied
+    when one of them modifies it (copy-on-write).
+
+    Label counting, grouping and filtering use a columnar index, built on first
+    use and invalidated when the metadata is modified, or hands out all its
+    datasets (datasets, items). Datasets handed out one at a time ([], get) are
+    checked by the next counting/grouping call, a dataset kept and modified after
+    that call is not seen by the index.
+
     path (Path): Path to json file containing metadata for some datasets.
     """
 
+    _shared: Set[str] | None = None  # md5s of datasets shared with other copies
+    _index: _MetadataIndex | None = None
+    _handed_out: Set[str] | None = None  # md5s of datasets to check in the index
+    _wrappers: Dict[str, _SharedDataset] | None = None  # handed out shared datasets
+
     def __init__(self, path: Path):
         self._metadata = self._load_metadata(path)
         self._rest = {}
@@ -64,18 +231,154 @@ class Metadata:
         obj._rest = {}
         return obj
 
+    def copy(self, md5s: Iterable[str] | None = None) -> Metadata:
+        """Return a copy-on-write copy, optionally of the given md5s only.
+
+        Costs O(number of md5s): datasets are shared until either copy modifies one.
+        Unknown md5s are ignored.
+        """
+        if md5s is None:
+            metadata = dict(self._metadata)
+        else:
+            md5s = set(md5s)
+            metadata = {md5: dset for md5, dset in self._metadata.items() if md5 in md5s}
+
+        self._share(metadata)
+        return self._from_shared(metadata, copy.deepcopy(self._rest))
+
+    @classmethod
+    def _from_shared(cls, metadata: Dict[str, dict], rest: Dict) -> Metadata:
+        """Create an object from datasets shared with another object (copy-on-write)."""
+        obj = cls.__new__(cls)
+        obj._metadata = metadata
+        obj._rest = rest
+        obj._shared = set(metadata)
+        return obj
+
+    def _share(self, md5s: Iterable[str]) -> None:
+        """Mark datasets as shared with another copy."""
+        if self._shared is None:
+            self._shared = set()
+        self._shared.update(md5s)
+
+    def _own(self, md5: str) -> dict:
+        """Return the dict of md5, copied first if it is shared (from its wrapper if any)."""
+        self._datasets_changed()
+        if self._shared and md5 in self._shared:
+            wrapper = self._wrappers.get(md5) if self._wrappers else None
+            if wrapper is not None:
+                self._metadata[md5] = dict(wrapper)
+            else:
+                self._metadata[md5] = copy.deepcopy(self._metadata[md5])
+            self._shared.discard(md5)
+        return self._metadata[md5]
+
+    def _writable(self, md5: str) -> dict:
+        """Return the dataset of md5 to modify, its wrapper if one was handed out."""
+        if self._wrappers and md5 in self._wrappers:
+            return self._wrappers[md5]
+        return self._own(md5)
+
+    def _dataset(self, md5: str) -> Dict | _SharedDataset:
+        """Return the dataset of md5, wrapped for copy-on-write if it is shared.
+
+        The same wrapper is returned until the dataset is replaced or removed.
+        """
+        if self._wrappers and md5 in self._wrappers:
+            return self._wrappers[md5]
+        if self._shared and md5 in self._shared:
+            if self._wrappers is None:
+                self._wrappers = {}
+            wrapper = self._wrappers[md5] = _SharedDataset(self, md5)
+            return wrapper
+        if self._index is not None:
+            if self._handed_out is None:
+                self._handed_out = set()
+            self._handed_out.add(md5)
+        return self._metadata[md5]
+
+    def _column(self, category: str, required: bool = False) -> Tuple[list, np.ndarray]:
+        """Return the labels of category, and the label code of each dataset (see _MetadataIndex).
+
+        Raises:
+            KeyError: if required and a dataset does not have the category.
+        """
+        if self._index is None:
+            self._index = _MetadataIndex(self._metadata)
+        if self._handed_out:
+            self._index.check_columns(self._handed_out)
+            self._handed_out.clear()
+        labels, codes = self._index.column(category)
+        if required and _MISSING in labels:
+            raise KeyError(category)
+        return labels, codes
+
+    def _keys_changed(self) -> None:
+        """Invalidate the index after md5s were added or removed."""
+        self._index = None
+        self._handed_out = None
+
+    def _datasets_changed(self) -> None:
+        """Invalidate the indexed categories, datasets may be modified."""
+        if self._index is not None:
+            self._index.clear_columns()
+
+    def _keep(self, mask: np.ndarray) -> None:
+        """Keep only the datasets where mask is True, mask following the index order."""
+        if mask.all():
+            return
+        self._metadata = {md5: self._metadata[md5] for md5 in self._index.md5s[mask]}  # type: ignore
+        self._forget_removed()
+        self._keys_changed()
+
+    def _forget_removed(self) -> None:
+        """Forget the shared md5s and wrappers of removed datasets."""
+        if self._shared:
+            self._shared.intersection_update(self._metadata)
+        if self._wrappers:
+            self._wrappers = {
+                md5: wrapper
+                for md5, wrapper in self._wrappers.items()
+                if md5 in self._metadata
+            }
+
+    def _keep_labels(self, label_category: str, keep) -> None:
+        """Keep only the datasets whose label (None if missing) passes keep(label)."""
+        labels, codes = self._column(label_category)
+        kept = np.array(
+            [keep(None if label is _MISSING else label) for label in labels], dtype=bool
+        )
+        self._keep(kept[codes])
+
     def empty(self):
         """Remove all entries."""
         self._metadata = {}
+        self._shared = None
+        self._wrappers = None
+        self._keys_changed()
 
     def __setitem__(self, md5, value):
+        self._keys_changed()
+        if isinstance(value, _SharedDataset):
+            value = dict(value)
+        if self._shared:
+            self._shared.discard(md5)
+        if self._wrappers:
+            self._wrappers.pop(md5, None)
         self._metadata[md5] = value
 
     def __getitem__(self, md5):
-        return self._metadata[md5]
+        if md5 not in self._metadata:
+            raise KeyError(md5)
+        return self._dataset(md5)
 
     def __delitem__(self, md5):
         del self._metadata[md5]
+        self._keys_changed()
+        if self._shared:
+            self._shared.discard(md5)
+        if self._wrappers:
+            self._wrappers.pop(md5, None)
 
     def __contains__(self, md5):
         return md5 in self._metadata
@@ -88,13 +391,30 @@ class Metadata:
             return self._metadata == other._metadata and self._rest == other._rest
         return False
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_wrappers", None)  # pickled as plain dicts, no longer writing through
+        return state
+
     def get(self, md5, default=None) -> Dict | None:
         """Dict .get"""
-        return self._metadata.get(md5, default)
+        if md5 not in self._metadata:
+            return default
+        return self._dataset(md5)
 
     def update(self, info: Metadata) -> None:
-        """Dict .update equivalent. Info needs to respect {md5sum:dset} format."""
-        self._metadata.update(info.items)
+        """Dict .update equivalent. Info needs to respect {md5sum:dset} format.
+
+        Datasets become shared between both objects (copy-on-write).
+        """
+        # pylint: disable=protected-access
+        self._metadata.update(info._metadata)
+        self._keys_changed()
+        if self._wrappers:
+            for md5 in info._metadata:
+                self._wrappers.pop(md5, None)
+        self._share(info._metadata)
+        info._share(info._metadata)
 
     def save(self, path) -> None:
         """Save the metadata to path, in original epigeec_json format."""
@@ -108,58 +428,88 @@ class Metadata:
     @property
     def datasets(self) -> ValuesView:
         """Return a datasets view (like dict.values())."""
-        return self._metadata.values()
+        self._datasets_changed()
+        if not self._shared:
+            return self._metadata.values()
+        return ValuesView(_Datasets(self))
 
     @property
     def items(self) -> ItemsView:
         """Return a (md5,datasets) view (like dict.items())."""
-        return self._metadata.items()
+        self._datasets_changed()
+        if not self._shared:
+            return self._metadata.items()
+        return ItemsView(_Datasets(self))
 
     def to_df(self):
         """Return a dataframe with one file per row.
         Index is md5sum.
         """
-        df = pd.DataFrame.from_records(list(self.datasets))
+        df = pd.DataFrame.from_records(list(self._metadata.values()))
         df.set_index("md5sum", inplace=True)
         return df
 
     def _load_metadata(self, path):
-        """Return md5:dataset dict."""
-        with open(path, "r", encoding="utf-8") as file:
-            meta_raw = json.load(file)
+        """Return md5:dataset dict.
+
+        Uses the binary cache of the json file when valid, and creates it otherwise (see MetadataCache).
+        """
+        cache = MetadataCache(path) if MetadataCache.enabled() else None
+        if cache is not None:
+            cached = cache.load()
+            if cached is not None:
+                self._rest, metadata = cached
+                return metadata
+
+        with open(path, "rb") as file:
+            content = file.read()
+        meta_raw = json.loads(content.decode("utf-8"))
 
         self._rest = {k: v for k, v in meta_raw.items() if k != "datasets"}
-        return {dset["md5sum"]: dset for dset in meta_raw["datasets"]}
+        metadata = {dset["md5sum"]: dset for dset in meta_raw["datasets"]}
+        if cache is not None:
+            cache.save(content, self._rest, metadata)
+        return metadata
 
     def _save_metadata(self, path):
         """Save the metadata to path, in original epigeec_json format.
 
         Only saves dataset information.
         """
-        to_save = {"datasets": list(self.datasets)}
+        to_save = {"datasets": list(self._metadata.values())}
         to_save.update(self._rest)
         with open(path, "w", encoding="utf-8") as file:
             json.dump(to_save, file)
 
     def apply_filter(self, meta_filter=lambda item: True):
-        """Apply a filter on items (md5:dataset)."""
-        self._metadata = dict(filter(meta_filter, self.items))
+        """Apply a filter on items (md5:dataset). The filter must not modify datasets."""
+        self._metadata = dict(filter(meta_filter, self._metadata.items()))
+        self._forget_removed()
+        self._keys_changed()
 
     def remove_missing_labels(self, label_category: str):
         """Remove datasets where the metadata category is missing."""
-        filt = lambda item: label_category in item[1]
-        self.apply_filter(filt)  # type: ignore
+        labels, codes = self._column(label_category)
+        self._keep(
+            np.array([label is not _MISSING for label in labels], dtype=bool)[codes]
+        )
 
     def md5_per_class(self, label_category: str) -> Dict[str, List[str]]:
         """Return {label/class:md5 list} dict for a given metadata category.
 
         Can fail if remove_missing_labels has not been ran before.
         """
-        sorted_md5 = sorted(self.md5s)
+        labels, codes = self._column(label_category, required=True)
+        sorted_order = self._index.sorted_order  # type: ignore
+        sorted_codes = codes[sorted_order]
+        grouped = sorted_order[np.argsort(sorted_codes, kind="stable")]
+        groups = np.split(grouped, np.cumsum(np.bincount(sorted_codes))[:-1])
+
+        # classes in order of their first sorted md5
+        _, first_positions = np.unique(sorted_codes, return_index=True)
         data = defaultdict(list)
-        for md5 in sorted_md5:
-            label = self[md5][label_category]
-            data[label].append(md5)
+        for code in np.argsort(first_positions, kind="stable"):
+            data[labels[code]] = self._index.md5s[groups[code]].tolist()  # type: ignore
         return data
 
     def remove_small_classes(
@@ -170,15 +520,17 @@ class Metadata:
 
         Returns string of class ratio left if verbose.
         """
-        data = self.md5_per_class(label_category)
-        nb_class = len(data)
-
-        nb_removed_class = 0
-        for label, size in self.label_counter(label_category).most_common():
-            if size < min_class_size:
-                nb_removed_class += 1
-                for md5 in data[label]:
-                    del self[md5]
+        labels, codes = self._column(label_category, required=True)
+        nb_class = len(labels)
+
+        # missing labels (None) are not counted as a class, so never removed
+        sizes = self.label_counter(label_category)
+        small = np.array(
+            [label is not None and sizes[label] < min_class_size for label in labels],
+            dtype=bool,
+        )
+        nb_removed_class = int(small.sum())
+        self._keep(~small[codes])
 
         if verbose:
             remaining = nb_class - nb_removed_class
@@ -213,8 +565,8 @@ class Metadata:
         if isinstance(labels, str):
             labels = [labels]
         self._check_label_category(label_category)
-        filt = lambda item: item[1].get(label_category) in set(labels)
-        self.apply_filter(filt)  # type: ignore
+        labels = set(labels)
+        self._keep_labels(label_category, lambda label: label in labels)
 
     def remove_category_subsets(self, label_category: str, labels: Iterable[str]):
         """Remove datasets which possess the given labels
@@ -225,14 +577,19 @@ class Metadata:
         if isinstance(labels, str):
             labels = [labels]
         self._check_label_category(label_category)
-        filt = lambda item: item[1].get(label_category) not in set(labels)
-        self.apply_filter(filt)  # type: ignore
+        labels = set(labels)
+        self._keep_labels(label_category, lambda label: label not in labels)
 
     def label_counter(self, label_category: str, verbose=True) -> Counter[str]:
         """Return a Counter() with label count from the given category.
         Ignores missing labels.
         """
-        counter = Counter([dset.get(label_category) for dset in self.datasets])
+        labels, codes = self._column(label_category)
+        counter = Counter()
+        for label, count in zip(
+            labels, np.bincount(codes, minlength=len(labels)).tolist()
+        ):
+            counter[None if label is _MISSING else label] += count
 
         if verbose:
             print(f"{counter[None]} labels missing and ignored from count")
@@ -242,22 +599,24 @@ class Metadata:
 
     def unique_classes(self, label_category: str) -> List[str]:
         """Return sorted list of unique classes currently existing for the given category."""
-        sorted_md5 = sorted(self.md5s)
-        uniq = set()
-        for md5 in sorted_md5:
-            val = self[md5].get(label_category)
-
-            # Everything should be a string, this was added because there was a bug with a nan object treated as a float
-            if not isinstance(val, str):
-                print(
-                    f"md5: {md5} has non-string label of type {type(val)}: {val}",
-                    file=sys.stderr,
-                )
-                raise ValueError(f"Non-string label for {label_category} at {md5}.")
+        labels, codes = self._column(label_category)
+
+        # Everything should be a string, this was added because there was a bug with a nan object treated as a float
+        non_string = np.array(
+            [not isinstance(label, str) for label in labels], dtype=bool
+        )
+        if non_string.any():
+            sorted_order = self._index.sorted_order  # type: ignore
+            position = sorted_order[non_string[codes[sorted_order]]][0]
+            md5 = self._index.md5s[position]  # type: ignore
+            val = self._metadata[md5].get(label_category)
+            print(
+                f"md5: {md5} has non-string label of type {type(val)}: {val}",
+                file=sys.stderr,
+            )
+            raise ValueError(f"Non-string label for {label_category} at {md5}.")
 
-            uniq.add(self[md5].get(label_category))
-        uniq.discard(None)
-        return sorted(list(uniq))
+        return sorted(labels)
 
     def display_labels(self, label_category: str):
         """Print number of examples for each label in given category."""
@@ -271,7 +630,7 @@ class Metadata:
 
     def get_categories(self) -> list[str]:
         """Return a list of all metadata categories sorted by lowercase."""
-        categories = {key for dset in self.datasets for key in dset.keys()}
+        categories = {key for dset in self._metadata.values() for key in dset.keys()}
         return sorted(categories, key=str.lower)
 
     def convert_classes(self, category: str, converter: Dict[str, str]):
@@ -279,10 +638,12 @@ class Metadata:
 
         Can be used to merge classes.
         """
-        for dataset in self.datasets:
-            label = dataset.get(category, None)
-            if label in converter:
-                dataset[category] = converter[label]
+        labels, codes = self._column(category)
+        labels = [None if label is _MISSING else label for label in labels]
+        converted = np.array([label in converter for label in labels], dtype=bool)
+        md5s = self._index.md5s  # type: ignore
+        for position in np.flatnonzero(converted[codes]):
+            self._writable(md5s[position])[category] = converter[labels[codes[position]]]
 
     def save_marshal(self, path: Path | str) -> None:
         """Save the metadata to path, in marshal format. Only saves dataset information."""
@@ -315,7 +676,7 @@ class UUIDMetadata(Metadata):
     @classmethod
     def from_metadata(cls, metadata: Metadata) -> UUIDMetadata:
         """Create UUIDMetadata from Metadata."""
-        meta = dict(metadata.items)
+        meta = dict(metadata._metadata)  # pylint: disable=protected-access
         return cls.from_dict(meta)
 
     @classmethod
@@ -345,17 +706,30 @@ class UUIDMetadata(Metadata):
 
         Can fail if remove_missing_labels has not been ran before.
         """
-        uuid_dict = defaultdict(set)
-        for md5 in self._metadata:
-            track_type = self._metadata[md5]["track_type"]
-            label = self._metadata[md5][label_category]
-            uuid = self._metadata[md5]["uuid"]
-
-            # Special case for ctl_raw, same uuid as other tracks, but counts as unique experiment
-            if track_type == "ctl_raw":
-                uuid += "_ctl"
+        tracks, track_codes = self._column("track_type", required=True)
+        labels, codes = self._column(label_category, required=True)
+        uuids, uuid_codes = self._column("uuid", required=True)
+
+        # Special case for ctl_raw, same uuid as other tracks, but counts as unique experiment
+        is_ctl = np.array([track == "ctl_raw" for track in tracks], dtype=bool)[
+            track_codes
+        ]
+        nb_experiments = 2 * len(uuids) or 1
+        experiments = 2 * uuid_codes + is_ctl
+        pair_codes, pair_experiments = np.divmod(
+            np.unique(codes * nb_experiments + experiments), nb_experiments
+        )
+        names = np.array(uuids + [None], dtype=object)[pair_experiments // 2]
+        is_ctl_pair = pair_experiments % 2 == 1
+        names[is_ctl_pair] = names[is_ctl_pair] + "_ctl"
 
-            uuid_dict[label].add(uuid)
+        uuid_dict = defaultdict(set)
+        bounds = np.flatnonzero(np.diff(pair_codes)) + 1
+        for label_codes, label_uuids in zip(
+            np.split(pair_codes, bounds), np.split(names, bounds)
+        ):
+            if len(label_codes):
+                uuid_dict[labels[label_codes[0]]] = set(label_uuids.tolist())
         return uuid_dict
 
     def uuid_counter(self, label_category: str, verbose=True) -> Counter[str]:
@@ -386,10 +760,15 @@ class UUIDMetadata(Metadata):
 
     def uuid_to_md5(self) -> Dict[str, Dict[str, str]]:
         """Return uuid to {track_type:md5} mapping { uuid : {track_type1:md5sum, track_type2:md5sum, ...} }"""
+        uuids, uuid_codes = self._column("uuid", required=True)
+        tracks, track_codes = self._column("track_type", required=True)
+        md5s, md5_codes = self._column("md5sum", required=True)
+
         uuid_to_md5s = defaultdict(dict)
-        for dset in self.datasets:
-            uuid = dset["uuid"]
-            uuid_to_md5s[uuid].update({dset["track_type"]: dset["md5sum"]})
+        for uuid, track_type, md5 in zip(
+            uuid_codes.tolist(), track_codes.tolist(), md5_codes.tolist()
+        ):
+            uuid_to_md5s[uuids[uuid]][tracks[track_type]] = md5s[md5]
         return uuid_to_md5s
 
     def remove_small_classes(
@@ -402,25 +781,25 @@ class UUIDMetadata(Metadata):
         """Remove classes with less than min_class_size examples
         for a given metadata category.
 
-        Counts unique uuids if using_uuid=True, else counts md5s.
+        Counts unique uuids if using_uuid=True (see uuid_per_class), else counts md5s.
+        With uuids, all tracks of each uuid of a small class are removed, also tracks
+        with another label. Control experiments (uuid_ctl) do not remove tracks.
 
         Returns string of class ratio left if verbose.
         """
         nb_class_init = len(self.unique_classes(label_category))
 
         if not using_uuid:
-            md5_per_class = self.md5_per_class(label_category)
-            for label, size in self.label_counter(label_category).most_common():
-                if size < min_class_size:
-                    for md5 in md5_per_class[label]:
-                        del self[md5]
+            super().remove_small_classes(min_class_size, label_category, verbose=False)
         else:
-            uuid_to_md5s = self.uuid_to_md5()
-            for label, uuids in self.uuid_per_class(label_category).items():
+            # removes every track of the experiments of small classes
+            small_uuids = set()
+            for uuids in self.uuid_per_class(label_category).values():
                 if len(uuids) < min_class_size:
-                    for uuid in uuids:
-                        for md5 in uuid_to_md5s[uuid].values():
-                            del self[md5]
+                    small_uuids.update(uuids)
+            uuids, uuid_codes = self._column("uuid")
+            removed = np.array([uuid in small_uuids for uuid in uuids], dtype=bool)
+            self._keep(~removed[uuid_codes])
 
         if verbose:
             remaining = len(self.unique_classes(label_category))
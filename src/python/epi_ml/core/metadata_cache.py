@@ -0,0 +1,136 @@
+"""Module for the binary sidecar cache of epigeec json metadata files."""
+from __future__ import annotations
+
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Tuple
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".marshal"
+
+
+class MetadataCache:
+    """Parsed content of a json metadata file, saved in marshal format.
+
+    The cache file holds a header with the size, mtime and sha256 of the json
+    file it was made from, followed by the metadata. It is valid when size and
+    mtime match, or when only the mtime changed (e.g. a copied file) and the
+    hash matches.
+
+    The cache is next to the json file, or in $METADATA_CACHE_DIR if set.
+    Set $METADATA_CACHE=0 to disable it.
+
+    path: json metadata file.
+    cache_dir: Directory of the cache file, see above if None.
+    """
+
+    def __init__(self, path: Path | str, cache_dir: Path | str | None = None):
+        self._source = Path(path)
+        if cache_dir is None:
+            cache_dir = os.getenv("METADATA_CACHE_DIR")
+        if cache_dir is None:
+            self._path = self._source.with_name(self._source.name + CACHE_SUFFIX)
+        else:
+            # shared directory, json files can have the same name
+            path_hash = hashlib.sha256(str(self._source.resolve()).encode("utf-8"))
+            name = f"{self._source.name}.{path_hash.hexdigest()[:8]}{CACHE_SUFFIX}"
+            self._path = Path(cache_dir) / name
+
+    @property
+    def path(self) -> Path:
+        """Return the path of the cache file."""
+        return self._path
+
+    @staticmethod
+    def enabled() -> bool:
+        """Return False if caching is disabled by $METADATA_CACHE=0."""
+        return os.getenv("METADATA_CACHE", "1") != "0"
+
+    @staticmethod
+    def _header(content: bytes, mtime_ns: int) -> Dict:
+        """Return the cache header describing given json content."""
+        return {
+            "version": CACHE_VERSION,
+            "python": list(sys.version_info[:2]),
+            "size": len(content),
+            "mtime_ns": mtime_ns,
+            "sha256": hashlib.sha256(content).hexdigest(),
+        }
+
+    def load(self) -> Tuple[Dict, Dict[str, dict]] | None:
+        """Return (rest, datasets) of the json file if the cache is valid, else None.
+
+        rest holds the json top-level entries other than datasets,
+        datasets is the {md5sum:dataset} dict.
+        """
+        try:
+            stat = self._source.stat()
+            with open(self._path, "rb") as file:
+                header = marshal.load(file)
+                if (
+                    header.get("version") != CACHE_VERSION
+                    or header.get("python") != list(sys.version_info[:2])
+                    or header.get("size") != stat.st_size
+                ):
+                    return None
+
+                refreshed = None
+                if header.get("mtime_ns") != stat.st_mtime_ns:
+                    content = self._source.read_bytes()
+                    refreshed = self._header(content, stat.st_mtime_ns)
+                    if refreshed["sha256"] != header.get("sha256"):
+                        return None
+
+                rest, datasets = marshal.loads(file.read())  # faster than load(file)
+        except (OSError, EOFError, ValueError, TypeError, AttributeError):
+            return None
+
+        if refreshed is not None:
+            self._write(refreshed, rest, datasets)
+        return rest, datasets
+
+    def save(self, content: bytes, rest: Dict, datasets: Dict[str, dict]) -> None:
+        """Cache the parsed json content. Does nothing if the json file changed since it was read.
+
+        Errors are printed, not raised: the cache is optional.
+        """
+        try:
+            stat = self._source.stat()
+        except OSError:
+            return
+        if stat.st_size != len(content):
+            return
+        self._share_strings(datasets)
+        self._write(self._header(content, stat.st_mtime_ns), rest, datasets)
+
+    @staticmethod
+    def _share_strings(datasets: Dict[str, dict]) -> None:
+        """Make equal string values the same object, so marshal stores
+        them once and loads them faster.
+        """
+        strings = {}
+        for dataset in datasets.values():
+            for key, value in dataset.items():
+                if isinstance(value, str):
+                    dataset[key] = strings.setdefault(value, value)
+
+    def _write(self, header: Dict, rest: Dict, datasets: Dict[str, dict]) -> None:
+        """Atomically write the cache file."""
+        tmp_path = None
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                mode="wb", dir=self._path.parent, suffix=".tmp", delete=False
+            ) as file:
+                tmp_path = file.name
+                marshal.dump(header, file)
+                marshal.dump((rest, datasets), file)
+            os.replace(tmp_path, self._path)
+        except (OSError, ValueError) as err:
+            print(f"Could not write metadata cache {self._path}: {err}", file=sys.stderr)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,157 @@
+"""Module for reduced precision signal matrices."""
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+
+SIGNAL_DTYPES = frozenset(["float32", "float16", "int8"])
+INT8_MAX = 127
+
+
+class QuantizedSignals:
+    """(n_samples, n_bins) signals stored as int8 values, with a float32 scale
+    per sample (row): signal = value * scale. A quarter of the float32 size.
+
+    Indexing rows (e.g. signals[i], signals[start:end], signals[indexes]) returns
+    float32 rows, so values are only widened for the rows used, e.g. at batch time.
+    np.take gives a QuantizedSignals of the selected rows, and np.asarray widens all rows.
+    Assigning float rows quantizes them (see quantize).
+
+    values: (n_samples, n_bins) int8 array, can be memory-mapped.
+    scales: (n_samples,) float32 array.
+    """
+
+    def __init__(self, values: np.ndarray, scales: np.ndarray):
+        if values.ndim != 2 or scales.shape != values.shape[:1]:
+            raise ValueError(
+                f"Expected 2D values and one scale per row. Got {values.shape} and {scales.shape}."
+            )
+        self._values = values
+        self._scales = scales
+
+    @classmethod
+    def from_float(cls, signals: np.ndarray) -> QuantizedSignals:
+        """Return quantized float signals matrix."""
+        return cls(*quantize(np.asarray(signals)))
+
+    @property
+    def values(self) -> np.ndarray:
+        """Return the int8 values matrix."""
+        return self._values
+
+    @property
+    def scales(self) -> np.ndarray:
+        """Return the scale of each row."""
+        return self._scales
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """Return the matrix shape."""
+        return self._values.shape
+
+    @property
+    def size(self) -> int:
+        """Return the number of values of the matrix."""
+        return self._values.size
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Return the dtype of widened rows."""
+        return np.dtype(np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        """Return the number of bytes used by values and scales."""
+        return self._values.nbytes + self._scales.nbytes
+
+    def __len__(self) -> int:
+        return self._values.shape[0]
+
+    def __getitem__(self, rows) -> np.ndarray:
+        values = self._values[rows].astype(np.float32)
+        scales = self._scales[rows]
+        if values.ndim == 2:
+            scales = scales[:, np.newaxis]
+        values *= scales
+        return values
+
+    def __setitem__(self, rows, signals) -> None:
+        values, scales = quantize(np.asarray(signals, dtype=np.float32))
+        self._values[rows] = values
+        self._scales[rows] = scales
+
+    def take(self, indices, axis=0, out=None, mode="raise") -> QuantizedSignals:
+        """Return a QuantizedSignals of the rows at given indices. Called by np.take.
+
+        Raises:
+            ValueError: if axis is not 0 or out is given.
+        """
+        if axis != 0 or out is not None:
+            raise ValueError(
+                "QuantizedSignals only supports taking rows, without output array."
+            )
+        return QuantizedSignals(
+            np.take(self._values, indices, axis=0, mode=mode),
+            np.take(self._scales, indices, axis=0, mode=mode),
+        )
+
+    def __array__(self, dtype=None, copy=None):  # pylint: disable=unused-argument
+        signals = self[:]
+        if dtype is not None:
+            return signals.astype(dtype, copy=False)
+        return signals
+
+
+def quantize(signals: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (int8 values, float32 scales) of a signal, or of each row of a signals matrix.
+
+    Scales map the largest absolute value of each signal to 127. Signals of zeros have a scale of 1.
+    """
+    max_values = np.max(np.abs(signals), axis=-1, initial=0)
+    scales = np.asarray(max_values / INT8_MAX, dtype=np.float32)
+    scales[scales == 0] = 1
+    if signals.ndim == 2:
+        values = signals / scales[:, np.newaxis]
+    else:
+        values = signals / scales
+    values = np.rint(values, out=values).astype(np.int8)
+    return values, scales
+
+
+def reduce_precision(signals: np.ndarray, dtype: str) -> np.ndarray | QuantizedSignals:
+    """Return a float signals matrix in given SIGNAL_DTYPES dtype."""
+    if dtype == "int8":
+        return QuantizedSignals.from_float(signals)
+    return np.asarray(signals, dtype=dtype)
+
+
+def first_rows(
+    matrix: np.ndarray | QuantizedSignals, n_rows: int
+) -> np.ndarray | QuantizedSignals:
+    """Return the first rows of matrix, a view for arrays, or matrix if it has n_rows.
+    Int8 rows are not widened.
+    """
+    if len(matrix) == n_rows:
+        return matrix
+    if isinstance(matrix, QuantizedSignals):
+        return QuantizedSignals(matrix.values[:n_rows], matrix.scales[:n_rows])
+    return matrix[:n_rows]
+
+
+def to_float32(signals) -> np.ndarray:
+    """Return signals as a float32 array. Reduced precision signals are widened,
+    float32 arrays are returned as is.
+    """
+    return np.asarray(signals, dtype=np.float32)
+
+
+def max_errors(signals: np.ndarray, reduced: np.ndarray | QuantizedSignals) -> np.ndarray:
+    """Return the maximum absolute difference of each row between
+    float signals and their reduced precision version.
+    """
+    signals = np.atleast_2d(signals)
+    errors = np.empty(len(signals), dtype=np.float64)
+    for i, signal in enumerate(signals):
+        errors[i] = np.max(np.abs(to_float32(reduced[i]) - signal), initial=0)
+    return errors
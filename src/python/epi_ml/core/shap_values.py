@@ -20,6 +20,7 @@ from sklearn.pipeline import Pipeline
 
 from epi_ml.core.estimators import EstimatorAnalyzer
 from epi_ml.core.model_pytorch import LightningDenseClassifier
+from epi_ml.core.quantization import to_float32
 from epi_ml.core.types import SomeData
 from epi_ml.utils.time import time_now_str
 
@@ -99,7 +100,7 @@ class NN_SHAP_Handler:
         Returns explainer and shap values (as a list of matrix per class)
         """
         explainer = shap.DeepExplainer(
-            model=self.model, data=torch.from_numpy(background_dset.signals).float()
+            model=self.model, data=torch.from_numpy(to_float32(background_dset.signals))
         )
         if save:
             self.saver.save_to_npz(
@@ -109,7 +110,7 @@ class NN_SHAP_Handler:
                 classes=self.model_classes,
             )
 
-        signals = torch.from_numpy(evaluation_dset.signals).float()
+        signals = torch.from_numpy(to_float32(evaluation_dset.signals))
         shap_values = NN_SHAP_Handler._compute_shap_values_parallel(
             explainer, signals, num_workers
         )
@@ -295,7 +296,7 @@ class SHAP_Analyzer:
             )
 
         # Compute the model's output probabilities for the samples
-        signals = torch.from_numpy(dset.signals).float()
+        signals = torch.from_numpy(to_float32(dset.signals))
         model_output_logits = self.model(signals).detach()
         probs = F.softmax(model_output_logits, dim=1).detach().numpy()
         shap_to_prob = (
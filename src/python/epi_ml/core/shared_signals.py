@@ -0,0 +1,180 @@
+"""Module for signal matrices shared with worker processes through memory-mapped files."""
+from __future__ import annotations
+
+import contextlib
+import os
+import tempfile
+import weakref
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from epi_ml.core.quantization import QuantizedSignals
+from epi_ml.core.signal_view import SignalView
+
+SHM_DIR = "/dev/shm"
+CHUNK_ROWS = 256  # rows copied at a time into shared matrices
+
+
+def shared_dir() -> str | None:
+    """Return the directory of shared matrix files: $SHARED_SIGNALS_DIR if set,
+    else /dev/shm if it exists (memory backed), else the default temporary directory.
+    """
+    directory = os.getenv("SHARED_SIGNALS_DIR")
+    if directory is None and os.path.isdir(SHM_DIR):
+        directory = SHM_DIR
+    return directory
+
+
+class SharedMatrix(np.memmap):
+    """Memory-mapped matrix pickled as its file path, so that worker processes
+    (e.g. of a multiprocessing Pool) map the same memory instead of receiving a copy.
+
+    Arrays derived from it (slices, np.take) are pickled as regular arrays.
+    Unpickled matrices are read-only.
+
+    See share_signals, which removes the files when done, and shared_matrix.
+    """
+
+    _shared_path: str | None = None
+
+    @classmethod
+    def empty(
+        cls, shape: Tuple[int, ...], dtype, directory: str | None = None
+    ) -> SharedMatrix:
+        """Return an uninitialized matrix in a new file of directory (see shared_dir if None).
+
+        Raises:
+            ValueError: if shape is empty, empty files cannot be mapped.
+        """
+        if 0 in shape:
+            raise ValueError(f"Cannot share an empty array. Got shape {shape}.")
+        if directory is None:
+            directory = shared_dir()
+        fd, path = tempfile.mkstemp(dir=directory, suffix=".signals")
+        os.close(fd)
+        try:
+            matrix = cls(path, dtype=np.dtype(dtype), mode="r+", shape=tuple(shape))
+        except (OSError, ValueError):
+            os.remove(path)
+            raise
+        matrix._shared_path = path
+        return matrix
+
+    @classmethod
+    def create(cls, array: np.ndarray, directory: str | None = None) -> SharedMatrix:
+        """Return a copy of array in a new file of directory (see shared_dir if None).
+
+        Raises:
+            ValueError: if array is empty, empty files cannot be mapped.
+        """
+        matrix = cls.empty(array.shape, array.dtype, directory)
+        matrix[...] = array
+        return matrix
+
+    @classmethod
+    def open(cls, path: str, dtype: str, shape) -> SharedMatrix:
+        """Return the read-only matrix of a file made by create."""
+        matrix = cls(path, dtype=np.dtype(dtype), mode="r", shape=tuple(shape))
+        matrix._shared_path = path
+        return matrix
+
+    @property
+    def shared_path(self) -> str | None:
+        """Return the matrix file, None for derived arrays."""
+        return self._shared_path
+
+    def __array_finalize__(self, obj):
+        super().__array_finalize__(obj)
+        self._shared_path = None
+
+    def __reduce__(self):
+        if self._shared_path is None:
+            return self.view(np.ndarray).__reduce__()
+        return (SharedMatrix.open, (self._shared_path, self.dtype.str, self.shape))
+
+    def __reduce_ex__(self, protocol):
+        if self._shared_path is None:
+            return self.view(np.ndarray).__reduce_ex__(protocol)
+        return self.__reduce__()
+
+
+def shared_matrix(
+    shape: Tuple[int, ...], dtype, directory: str | None = None
+) -> np.ndarray:
+    """Return an uninitialized SharedMatrix (see SharedMatrix.empty), e.g. to load
+    signals into, so that they are shared with worker processes without a copy.
+
+    Its file is removed once the matrix and the arrays derived from it are no longer
+    used by this process, or at exit. Empty shapes give a regular array.
+    """
+    if 0 in shape:
+        return np.empty(shape, dtype=dtype)
+    matrix = SharedMatrix.empty(shape, dtype, directory)
+    weakref.finalize(matrix, _remove, matrix.shared_path)
+    return matrix
+
+
+def is_shared(signals: np.ndarray | QuantizedSignals | SignalView) -> bool:
+    """Return True if the matrix of signals is backed by SharedMatrix files."""
+    if isinstance(signals, SignalView):
+        signals = signals.matrix
+    if isinstance(signals, QuantizedSignals):
+        return is_shared(signals.values) and is_shared(signals.scales)
+    return isinstance(signals, SharedMatrix) and signals.shared_path is not None
+
+
+def _remove(path: str) -> None:
+    """Remove a matrix file, if still there."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+@contextlib.contextmanager
+def share_signals(
+    signals: np.ndarray | QuantizedSignals | SignalView, directory: str | None = None
+) -> Iterator[np.ndarray | QuantizedSignals | SignalView]:
+    """Yield signals backed by SharedMatrix files. Copies are removed on exit.
+
+    Signals already shared (see shared_matrix) are yielded as is. Only the distinct
+    rows of index views are copied, CHUNK_ROWS at a time, and the view rows renumbered.
+    Worker processes using the signals must be done before exiting.
+
+    signals: Signal matrix, QuantizedSignals or SignalView.
+    directory: Directory of the files, see shared_dir if None.
+    """
+    paths: List[str] = []
+
+    def share(array: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        array = np.asarray(array)
+        shape = array.shape if rows is None else (len(rows), *array.shape[1:])
+        if 0 in shape:
+            return np.empty(shape, dtype=array.dtype)
+        matrix = SharedMatrix.empty(shape, array.dtype, directory)
+        paths.append(matrix.shared_path)  # type: ignore
+        for start in range(0, shape[0], CHUNK_ROWS):
+            chunk = slice(start, start + CHUNK_ROWS)
+            matrix[chunk] = array[chunk] if rows is None else array[rows[chunk]]
+        return matrix
+
+    def share_matrix(matrix, rows: np.ndarray | None = None):
+        if isinstance(matrix, QuantizedSignals):
+            return QuantizedSignals(
+                share(matrix.values, rows), share(matrix.scales, rows)
+            )
+        return share(matrix, rows)
+
+    try:
+        if is_shared(signals):
+            yield signals
+        elif isinstance(signals, SignalView):
+            used_rows, rows = np.unique(signals.rows, return_inverse=True)
+            if len(used_rows) == len(signals.matrix):  # all rows, in order
+                yield SignalView(share_matrix(signals.matrix), signals.rows)
+            else:
+                yield SignalView(share_matrix(signals.matrix, used_rows), rows)
+        else:
+            yield share_matrix(signals)
+    finally:
+        for path in paths:
+            _remove(path)
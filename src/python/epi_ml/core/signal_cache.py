@@ -0,0 +1,292 @@
+"""Module for the on-disk consolidated signal cache used by Hdf5Loader."""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from epi_ml.core.quantization import QuantizedSignals
+
+CACHE_VERSION = 1
+MATRIX_NAME = "signals.npy"
+SCALES_NAME = "scales.npy"
+MANIFEST_NAME = "manifest.json"
+
+FileFingerprint = List  # [file name, size in bytes, mtime in ns]
+
+
+class SignalCache:
+    """Consolidated signal matrix of an hdf5 list, saved as a .npy file
+    next to a json manifest.
+
+    The manifest holds the md5 of each matrix row, and the fingerprint
+    (name, size, mtime) of every file the matrix was built from, so a
+    changed hdf5 list or hdf5 file can be detected.
+
+    The matrix can have any dtype. Int8 signals (QuantizedSignals) keep
+    their row scales in a second .npy file.
+
+    cache_dir: Parent directory of all caches.
+    name: Readable part of the cache directory name, e.g. the hdf5 list name.
+    key: Hash of everything else that defines the signals (see make_key).
+        Different keys give different cache directories.
+    """
+
+    def __init__(self, cache_dir: Path | str, name: str, key: str):
+        self._key = key
+        self._dir = Path(cache_dir) / f"{name}-{key[:16]}"
+
+    @property
+    def directory(self) -> Path:
+        """Return the directory holding the cache files."""
+        return self._dir
+
+    @property
+    def matrix_path(self) -> Path:
+        """Return the path of the signal matrix .npy file."""
+        return self._dir / MATRIX_NAME
+
+    @property
+    def scales_path(self) -> Path:
+        """Return the path of the row scales .npy file of int8 signals."""
+        return self._dir / SCALES_NAME
+
+    @property
+    def manifest_path(self) -> Path:
+        """Return the path of the manifest json file."""
+        return self._dir / MANIFEST_NAME
+
+    @staticmethod
+    def make_key(**params) -> str:
+        """Return a hash of given json serializable parameters."""
+        content = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def fingerprint(files: Dict[str, Path]) -> Dict[str, FileFingerprint]:
+        """Return {md5:[name, size, mtime_ns]} for given {md5:path} files.
+
+        Size and mtime are None for files that cannot be accessed.
+        """
+        fingerprints = {}
+        for md5, path in files.items():
+            path = Path(path)
+            try:
+                stat = path.stat()
+                fingerprints[md5] = [path.name, stat.st_size, stat.st_mtime_ns]
+            except OSError:
+                fingerprints[md5] = [path.name, None, None]
+        return fingerprints
+
+    def read_manifest(self) -> Dict | None:
+        """Return the manifest content, or None if there is no valid manifest for this key."""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if manifest.get("version") != CACHE_VERSION or manifest.get("key") != self._key:
+            return None
+        return manifest
+
+    def load(
+        self, fingerprints: Dict[str, FileFingerprint]
+    ) -> Tuple[np.ndarray | QuantizedSignals, List[str]] | None:
+        """Return (matrix, md5s) if the cache was built from exactly
+        the given files, else None. md5s give the md5 of each matrix row.
+
+        The matrix is memory-mapped copy-on-write: changing it does not
+        change the cache.
+        """
+        manifest = self.read_manifest()
+        if manifest is None or manifest["files"] != fingerprints:
+            return None
+
+        matrix = self.open_matrix(manifest, mode="c")
+        if matrix is None:
+            return None
+        return matrix, manifest["md5s"]
+
+    def open_matrix(
+        self, manifest: Dict, mode: str = "r"
+    ) -> np.ndarray | QuantizedSignals | None:
+        """Return the memory-mapped matrix described by given manifest,
+        or None if it cannot be opened.
+        """
+        try:
+            matrix = np.load(self.matrix_path, mmap_mode=mode)  # type: ignore
+            scales = None
+            if matrix.dtype == np.int8:
+                scales = np.load(self.scales_path)
+        except (OSError, ValueError):
+            return None
+
+        # The files can hold rows appended after the manifest was written.
+        n_rows = len(manifest["md5s"])
+        if matrix.ndim != 2 or matrix.shape[0] < n_rows:
+            return None
+        if scales is None:
+            return matrix[:n_rows]
+        if scales.shape[0] < n_rows:
+            return None
+        return QuantizedSignals(matrix[:n_rows], scales[:n_rows])
+
+    def create_matrix(self, shape: Tuple[int, int], dtype=np.float32) -> np.memmap:
+        """Return a new writable memory-mapped matrix, to be filled then given to save."""
+        self._dir.mkdir(parents=True, exist_ok=True)
+        path = self._dir / f"{MATRIX_NAME}.{os.getpid()}.tmp"
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+    def save(
+        self,
+        matrix: np.memmap | QuantizedSignals,
+        md5s: List[str],
+        fingerprints: Dict[str, FileFingerprint],
+    ) -> np.ndarray | QuantizedSignals:
+        """Save a matrix from create_matrix as the cache content.
+        Int8 signals are given as QuantizedSignals of a create_matrix matrix.
+
+        Only the first len(md5s) rows are kept. Files of fingerprints that
+        are not in md5s are recorded as failed.
+
+        Return the saved matrix, memory-mapped like in load.
+        """
+        scales = None
+        if isinstance(matrix, QuantizedSignals):
+            matrix, scales = matrix.values, matrix.scales[: len(md5s)]
+
+        tmp_path = Path(matrix.filename)  # type: ignore
+        if matrix.shape[0] != len(md5s):
+            shrunk_path = self._dir / f"{MATRIX_NAME}.{os.getpid()}.shrunk.tmp"
+            shrunk = np.lib.format.open_memmap(
+                shrunk_path,
+                mode="w+",
+                dtype=matrix.dtype,
+                shape=(len(md5s), matrix.shape[1]),
+            )
+            shrunk[:] = matrix[: len(md5s)]
+            shrunk.flush()
+            del shrunk
+            os.replace(shrunk_path, tmp_path)
+        else:
+            matrix.flush()
+        del matrix
+
+        # Manifest written last, so an interrupted save is seen as a stale cache.
+        self.manifest_path.unlink(missing_ok=True)
+        os.replace(tmp_path, self.matrix_path)
+        if scales is not None:
+            self._write_scales(scales)
+        self._write_manifest(md5s, fingerprints)
+
+        matrix = np.load(self.matrix_path, mmap_mode="c")
+        if scales is None:
+            return matrix
+        return QuantizedSignals(matrix, np.load(self.scales_path))
+
+    def append(
+        self,
+        rows: np.ndarray | QuantizedSignals,
+        md5s: List[str],
+        fingerprints: Dict[str, FileFingerprint],
+    ) -> bool:
+        """Append rows at the end of the saved matrix, in place, and update the manifest.
+
+        md5s are the md5 of all rows, previous ones first. Readers of the
+        previous manifest are not affected, they only see the previous rows.
+
+        Return False, with the cache unchanged, if the matrix header cannot be
+        rewritten in place. Use save with a complete matrix instead.
+        """
+        n_rows = len(md5s)
+        n_previous = n_rows - rows.shape[0]
+
+        scales = None
+        if isinstance(rows, QuantizedSignals):
+            try:
+                previous_scales = np.load(self.scales_path)[:n_previous]
+            except (OSError, ValueError):
+                return False
+            if previous_scales.shape[0] != n_previous:
+                return False
+            scales = np.concatenate([previous_scales, rows.scales])
+            rows = rows.values
+
+        with open(self.matrix_path, "r+b") as file:
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                read_header = np.lib.format.read_array_header_1_0
+                write_header = np.lib.format.write_array_header_1_0
+            elif version == (2, 0):
+                read_header = np.lib.format.read_array_header_2_0
+                write_header = np.lib.format.write_array_header_2_0
+            else:
+                return False
+
+            shape, fortran_order, dtype = read_header(file)
+            offset = file.tell()
+            if (
+                fortran_order
+                or dtype != rows.dtype
+                or shape[1:] != rows.shape[1:]
+                or shape[0] < n_previous
+            ):
+                return False
+
+            # numpy pads headers so that the number of rows can usually grow in place.
+            header = io.BytesIO()
+            header_data = {
+                "descr": np.lib.format.dtype_to_descr(dtype),
+                "fortran_order": False,
+                "shape": (n_rows,) + tuple(shape[1:]),
+            }
+            write_header(header, header_data)
+            if len(header.getvalue()) != offset:
+                return False
+
+            # Rows are written before the header, which always describes valid rows.
+            row_nbytes = int(np.prod(shape[1:])) * dtype.itemsize
+            file.seek(offset + n_previous * row_nbytes)
+            file.write(np.ascontiguousarray(rows).tobytes())
+            file.truncate()
+            if scales is not None:
+                self._write_scales(scales)
+            file.seek(0)
+            file.write(header.getvalue())
+
+        self._write_manifest(md5s, fingerprints)
+        return True
+
+    def _write_scales(self, scales: np.ndarray) -> None:
+        """Atomically write the row scales of int8 signals."""
+        tmp_scales = self._dir / f"{SCALES_NAME}.{os.getpid()}.tmp.npy"
+        np.save(tmp_scales, scales)
+        os.replace(tmp_scales, self.scales_path)
+
+    def _write_manifest(
+        self, md5s: List[str], fingerprints: Dict[str, FileFingerprint]
+    ) -> None:
+        """Atomically write the manifest of the saved matrix.
+
+        Files of fingerprints that are not in md5s are recorded as failed.
+        """
+        loaded = set(md5s)
+        manifest = {
+            "version": CACHE_VERSION,
+            "key": self._key,
+            "md5s": md5s,
+            "failed": [md5 for md5 in fingerprints if md5 not in loaded],
+            "files": fingerprints,
+        }
+
+        self._dir.mkdir(parents=True, exist_ok=True)
+        tmp_manifest = self._dir / f"{MANIFEST_NAME}.{os.getpid()}.tmp"
+        with open(tmp_manifest, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(tmp_manifest, self.manifest_path)
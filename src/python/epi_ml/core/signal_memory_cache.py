@@ -0,0 +1,177 @@
+"""Module for the in-process LRU cache of loaded signals, shared by Hdf5Loader instances."""
+from __future__ import annotations
+
+import collections
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Hashable, List, OrderedDict, Set, Tuple
+
+import numpy as np
+
+from epi_ml.core.quantization import QuantizedSignals
+
+SIZE_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+def parse_size(size: str | int) -> int:
+    """Return the number of bytes of a size like 1024, "512M" or "4G" (powers of 1024).
+
+    Raises:
+        ValueError: if size is not a positive number with an optional K/M/G/T unit.
+    """
+    if isinstance(size, int):
+        n_bytes = size
+    else:
+        text = size.strip().upper()
+        if text.endswith("B"):
+            text = text[:-1]
+        unit = text[-1:] if text[-1:] in SIZE_UNITS else ""
+        try:
+            n_bytes = int(float(text[: len(text) - len(unit)]) * SIZE_UNITS[unit])
+        except ValueError as err:
+            raise ValueError(f"Invalid size: {size}.") from err
+    if n_bytes < 0:
+        raise ValueError(f"Size must be >= 0. Got {size}.")
+    return n_bytes
+
+
+class SignalMemoryCache:
+    """Least recently used signals, up to a total size in bytes.
+
+    Cached signals are read-only, they are shared by every load that hits them.
+    Signals larger than the whole budget are not cached. A budget of 0 disables the cache.
+    Thread-safe.
+
+    max_bytes: Maximum total size of the cached signals.
+    """
+
+    def __init__(self, max_bytes: int | str):
+        self._max_bytes = parse_size(max_bytes)
+        self._signals: OrderedDict[Hashable, np.ndarray] = collections.OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        """Return the size budget in bytes."""
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes: int | str) -> None:
+        """Change the size budget, evicting signals if needed."""
+        with self._lock:
+            self._max_bytes = parse_size(max_bytes)
+            self._evict(0)
+
+    @property
+    def nbytes(self) -> int:
+        """Return the total size of cached signals."""
+        return self._nbytes
+
+    @property
+    def enabled(self) -> bool:
+        """Return True if the cache can hold signals."""
+        return self._max_bytes > 0
+
+    def __len__(self) -> int:
+        return len(self._signals)
+
+    def get(self, key: Hashable) -> np.ndarray | None:
+        """Return the cached signal of key and mark it as recently used, or None."""
+        with self._lock:
+            signal = self._signals.get(key)
+            if signal is not None:
+                self._signals.move_to_end(key)
+            return signal
+
+    def put(self, key: Hashable, signal: np.ndarray) -> np.ndarray:
+        """Cache a signal under key, evicting the least recently used ones to fit.
+
+        The signal becomes read-only. Return it.
+        """
+        signal.flags.writeable = False
+        if signal.nbytes > self._max_bytes:
+            return signal
+        with self._lock:
+            previous = self._signals.pop(key, None)
+            if previous is not None:
+                self._nbytes -= previous.nbytes
+            self._evict(signal.nbytes)
+            self._signals[key] = signal
+            self._nbytes += signal.nbytes
+        return signal
+
+    def lookup(
+        self, files: Dict[str, Path], params_key: str
+    ) -> Tuple[Dict[str, np.ndarray], Dict[str, Tuple | None]]:
+        """Return ({md5:signal} of files found in the cache, {md5:key} of all files),
+        for loader settings of params_key (see memory_key).
+        """
+        signals: Dict[str, np.ndarray] = {}
+        keys: Dict[str, Tuple | None] = {}
+        for md5, file in files.items():
+            keys[md5] = memory_key(md5, file, params_key)
+            signal = self.get(keys[md5])
+            if signal is not None:
+                signals[md5] = signal
+        return signals, keys
+
+    def clear(self) -> None:
+        """Remove all cached signals."""
+        with self._lock:
+            self._signals.clear()
+            self._nbytes = 0
+
+    def _evict(self, n_bytes: int) -> None:
+        """Remove least recently used signals until n_bytes more fit in the budget."""
+        while self._signals and self._nbytes + n_bytes > self._max_bytes:
+            _, signal = self._signals.popitem(last=False)
+            self._nbytes -= signal.nbytes
+
+
+def memory_key(md5: str, file: Path, params_key: str) -> Tuple | None:
+    """Return the cache key of a file signal, for loader settings of params_key.
+    The signal is read again if the file size or mtime changes.
+
+    Return None if the file cannot be accessed.
+    """
+    try:
+        stat = file.stat()
+    except OSError:
+        return None
+    return (str(file.resolve()), md5, stat.st_size, stat.st_mtime_ns, params_key)
+
+
+def merge_rows(
+    matrix: np.ndarray | QuantizedSignals,
+    md5_index: List[str],
+    loaded_md5s: Set[str],
+    signals: Dict[str, np.ndarray],
+) -> None:
+    """Place the signals of md5_index in matrix rows, in that order. The first matrix rows
+    hold the loaded_md5s signals (in md5_index order), the others are cached signals.
+    """
+    # Move loaded rows down to their place (never above it), then copy cached rows.
+    loaded_rows = [i for i, md5 in enumerate(md5_index) if md5 in loaded_md5s]
+    for i in reversed(range(len(loaded_rows))):
+        if loaded_rows[i] != i:
+            matrix[loaded_rows[i]] = matrix[i]
+    for i, md5 in enumerate(md5_index):
+        if md5 in signals:
+            matrix[i] = signals[md5]
+
+
+_SHARED_CACHE: SignalMemoryCache | None = None
+
+
+def shared_memory_cache() -> SignalMemoryCache:
+    """Return the process-wide signal cache, used by default by Hdf5Loader.
+
+    Its budget is $HDF5_MEMORY_CACHE (e.g. "8G"), or 0 (disabled).
+    Change it with shared_memory_cache().max_bytes = size.
+    """
+    global _SHARED_CACHE  # pylint: disable=global-statement
+    if _SHARED_CACHE is None:
+        _SHARED_CACHE = SignalMemoryCache(parse_size(os.getenv("HDF5_MEMORY_CACHE", "0")))
+    return _SHARED_CACHE
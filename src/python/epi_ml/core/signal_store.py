@@ -0,0 +1,115 @@
+"""Module for lazily loaded signals."""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Tuple
+
+import numpy as np
+
+from epi_ml.core.signal_view import SignalView
+
+if TYPE_CHECKING:
+    from epi_ml.core.hdf5_loader import Hdf5Loader
+    from epi_ml.core.quantization import QuantizedSignals
+
+
+class SignalStore:
+    """Signals of hdf5 files, only read when needed.
+
+    Behaves like a (n_md5s, n_bins) matrix for len, shape and np.take along
+    the first axis. np.take gives a new SignalStore over the selected rows, without
+    reading anything. Signals are read with materialize, or np.asarray, or load_rows
+    to keep repeated rows (e.g. oversampled) as an index view.
+
+    Signals are loaded with the given loader, which can use a signal cache (see Hdf5Loader).
+
+    loader: Loader used to read the signals.
+    data_file: hdf5 paths list file.
+    md5s: md5 of each row, can be repeated.
+    n_bins: Signal length.
+    hdf5_dir: See Hdf5Loader.load_hdf5s.
+    """
+
+    def __init__(
+        self,
+        loader: Hdf5Loader,
+        data_file: Path,
+        md5s: List[str],
+        n_bins: int,
+        hdf5_dir: Path | None = None,
+    ):
+        self._loader = loader
+        self._data_file = data_file
+        self._md5s = list(md5s)
+        self._n_bins = n_bins
+        self._hdf5_dir = hdf5_dir
+
+    def __len__(self) -> int:
+        return len(self._md5s)
+
+    @property
+    def md5s(self) -> List[str]:
+        """Return the md5 of each row."""
+        return self._md5s
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """Return the shape of the materialized matrix."""
+        return len(self._md5s), self._n_bins
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Return the dtype of the materialized matrix (of its rows for int8 signals)."""
+        if self._loader.dtype == "int8":
+            return np.dtype(np.float32)
+        return np.dtype(self._loader.dtype)
+
+    def take(self, indices, axis=0, out=None, mode="raise") -> SignalStore:
+        """Return a SignalStore of the rows at given indices. Called by np.take.
+
+        Raises:
+            ValueError: if axis is not 0 or out is given.
+        """
+        if axis != 0 or out is not None:
+            raise ValueError(
+                "SignalStore only supports taking rows, without output array."
+            )
+        md5s = np.take(np.array(self._md5s, dtype=object), indices, axis=0, mode=mode)
+        return SignalStore(
+            self._loader, self._data_file, list(md5s), self._n_bins, self._hdf5_dir
+        )
+
+    def materialize(self) -> np.ndarray | QuantizedSignals:
+        """Read and return the signals matrix. Each file is read once, even if repeated.
+
+        Raises:
+            OSError: if a file cannot be loaded.
+        """
+        signals = self.load_rows()
+        if isinstance(signals, SignalView):
+            return signals.materialize()
+        return signals
+
+    def load_rows(self) -> np.ndarray | QuantizedSignals | SignalView:
+        """Read and return the signals, without copying repeated rows: the matrix
+        if no md5 is repeated, else a SignalView over the matrix of distinct md5s.
+
+        Raises:
+            OSError: if a file cannot be loaded.
+        """
+        unique_md5s = list(dict.fromkeys(self._md5s))
+        matrix, md5s = self._loader.load_hdf5s_matrix(
+            self._data_file,
+            md5s=unique_md5s,
+            verbose=False,
+            strict=True,
+            hdf5_dir=self._hdf5_dir,
+        )
+        if md5s == self._md5s:
+            return matrix
+
+        rows = {md5: i for i, md5 in enumerate(md5s)}
+        return SignalView(matrix, [rows[md5] for md5 in self._md5s])
+
+    def __array__(self, dtype=None, copy=None):  # pylint: disable=unused-argument
+        return np.asarray(self.materialize(), dtype=dtype)
@@ -0,0 +1,93 @@
+"""Module for index views over a shared signal matrix."""
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+
+from epi_ml.core.quantization import QuantizedSignals
+
+
+class SignalView:
+    """Rows of a shared signal matrix, selected by index, without copying them.
+
+    Behaves like a (n_rows, n_bins) matrix for len, shape and np.take along
+    the first axis. np.take gives a new SignalView over the same matrix.
+    Indexing rows (e.g. view[i], view[start:end], view[indexes]) only gathers those rows,
+    e.g. one batch at a time. The contiguous matrix is made with materialize, or np.asarray.
+
+    Rows can be reordered in place (see rows), without moving the signals.
+
+    matrix: Shared (n_signals, n_bins) matrix, can be memory-mapped or a QuantizedSignals.
+    rows: Row of the matrix of each view row, can be repeated.
+
+    Raises:
+        IndexError: if a row is outside of the matrix.
+    """
+
+    def __init__(self, matrix: np.ndarray | QuantizedSignals, rows):
+        rows = np.array(rows, dtype=np.int64).reshape(-1)
+        n_rows = len(matrix)
+        out_of_bounds = (rows >= n_rows) | (rows < -n_rows)
+        if np.any(out_of_bounds):
+            raise IndexError(
+                f"index {rows[out_of_bounds][0]} is out of bounds for axis 0 with size {n_rows}"
+            )
+        rows[rows < 0] += n_rows
+        self._matrix = matrix
+        self._rows = rows
+
+    @classmethod
+    def of(cls, signals, rows) -> SignalView:
+        """Return a view of given rows of a signal matrix, or of another view."""
+        if isinstance(signals, SignalView):
+            return signals.take(rows)
+        return cls(signals, rows)
+
+    def __len__(self) -> int:
+        return self._rows.shape[0]
+
+    @property
+    def matrix(self) -> np.ndarray | QuantizedSignals:
+        """Return the shared matrix."""
+        return self._matrix
+
+    @property
+    def rows(self) -> np.ndarray:
+        """Return the matrix row of each view row. Shuffling it shuffles the view."""
+        return self._rows
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """Return the shape of the materialized matrix."""
+        return len(self), self._matrix.shape[1]
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Return the dtype of the materialized matrix (of its rows for int8 signals)."""
+        return self._matrix.dtype
+
+    def __getitem__(self, rows) -> np.ndarray:
+        selected = self._rows[rows]
+        if isinstance(self._matrix, QuantizedSignals) or selected.ndim == 0:
+            return self._matrix[selected]
+        return np.take(self._matrix, selected, axis=0)
+
+    def take(self, indices, axis=0, out=None, mode="raise") -> SignalView:
+        """Return a SignalView of the rows at given indices. Called by np.take.
+
+        Raises:
+            ValueError: if axis is not 0 or out is given.
+        """
+        if axis != 0 or out is not None:
+            raise ValueError(
+                "SignalView only supports taking rows, without output array."
+            )
+        return SignalView(self._matrix, np.take(self._rows, indices, axis=0, mode=mode))
+
+    def materialize(self) -> np.ndarray | QuantizedSignals:
+        """Return the contiguous matrix of the view rows. Int8 rows are not widened."""
+        return np.take(self._matrix, self._rows, axis=0)
+
+    def __array__(self, dtype=None, copy=None):  # pylint: disable=unused-argument
+        return np.asarray(self.materialize(), dtype=dtype)
@@ -0,0 +1,83 @@
+"""Module to split the available cpus between concurrent workers and their threads."""
+from __future__ import annotations
+
+import os
+import sys
+
+from threadpoolctl import threadpool_limits
+
+# Read by OpenMP, BLAS and numexpr when they start, e.g. in subprocesses.
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+
+def available_cpus() -> int:
+    """Return the number of cpus to use: $CPU_BUDGET if set, else the cpus this process can run on.
+
+    Raises:
+        ValueError: if $CPU_BUDGET is not a positive integer.
+    """
+    budget = os.getenv("CPU_BUDGET")
+    if budget:
+        n_cpus = int(budget)
+        if n_cpus < 1:
+            raise ValueError(f"CPU_BUDGET must be >= 1. Got {budget}.")
+        return n_cpus
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on all platforms
+        return os.cpu_count() or 1
+
+
+class ThreadBudget:
+    """Split of the cpus between n_workers concurrent workers (e.g. the processes
+    of a multiprocessing Pool, one task per fold), each using n_threads threads.
+
+    Without limits, each worker would use as many threads as there are cpus in each
+    of its libraries (OpenMP, BLAS, torch), oversubscribing the cpus.
+    Workers call apply to set their limits.
+
+    n_tasks: Number of tasks to run, there are not more workers than tasks.
+    n_cpus: Number of cpus to split, see available_cpus if None.
+    max_workers: Maximum number of concurrent workers, e.g. to limit memory use. No limit if None.
+
+    Raises:
+        ValueError: if a number is smaller than 1.
+    """
+
+    def __init__(
+        self, n_tasks: int, n_cpus: int | None = None, max_workers: int | None = None
+    ):
+        if n_cpus is None:
+            n_cpus = available_cpus()
+        for name, value in [
+            ("n_tasks", n_tasks),
+            ("n_cpus", n_cpus),
+            ("max_workers", max_workers),
+        ]:
+            if value is not None and value < 1:
+                raise ValueError(f"{name} must be >= 1. Got {value}.")
+
+        self.n_cpus = n_cpus
+        self.n_workers = min(n_tasks, n_cpus, max_workers or n_cpus)
+        self.n_threads = n_cpus // self.n_workers
+
+    def __repr__(self) -> str:
+        return f"ThreadBudget(n_workers={self.n_workers}, n_threads={self.n_threads})"
+
+    def apply(self) -> None:
+        """Limit the threads of this process to n_threads.
+
+        Sets the thread pools already loaded (see threadpoolctl), the environment variables
+        read by libraries loaded later, and torch intra-op threads if torch is imported.
+        """
+        for var in THREAD_ENV_VARS:
+            os.environ[var] = str(self.n_threads)
+        threadpool_limits(limits=self.n_threads)
+        if "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(self.n_threads)
@@ -5,11 +5,13 @@ from __future__ import annotations
 
 import argparse
 import json
+import multiprocessing as mp
 import os
 import sys
 import warnings
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List
 
 warnings.simplefilter("ignore", category=FutureWarning)
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -26,7 +28,10 @@ from epi_ml.core import analysis, metadata
 from epi_ml.core.data import DataSet, create_torch_datasets
 from epi_ml.core.data_source import EpiDataSource
 from epi_ml.core.epiatlas_treatment import EpiAtlasFoldFactory
+from epi_ml.core.fold_manifest import MANIFEST_NAME
+from epi_ml.core.memory_planner import max_workers, memory_budget
 from epi_ml.core.model_pytorch import LightningDenseClassifier
+from epi_ml.core.thread_budget import ThreadBudget
 from epi_ml.core.trainer import MyTrainer, define_callbacks
 from epi_ml.utils import modify_metadata
 from epi_ml.utils.check_dir import create_dirs
@@ -155,6 +160,21 @@ def main():
     restore_model = cli.restore
     n_fold = hparams.get("n_fold", 10)
 
+    min_split = int(os.getenv("MIN_SPLIT", "0"))
+    max_split = int(os.getenv("MAX_SPLIT", "42"))
+    split_nbs = list(range(min_split, min(max_split, n_fold - 1) + 1))
+
+    # On CPU, PARALLEL_SPLITS splits are trained at a time, sharing the cpus
+    parallel_splits = int(os.getenv("PARALLEL_SPLITS", "1"))
+    on_cpu = not torch.cuda.device_count()
+    budget = ThreadBudget(
+        n_tasks=max(len(split_nbs), 1), max_workers=parallel_splits if on_cpu else 1
+    )
+    if on_cpu:
+        budget.apply()
+
+    # Only read signals of the split being trained when there is only one,
+    # and load them in shared memory for concurrent splits
     ea_handler = EpiAtlasFoldFactory.from_datasource(
         my_datasource,
         category,
@@ -164,7 +184,22 @@ def main():
         min_class_size=min_class_size,
         force_filter=True,
         metadata=my_metadata,
+        lazy_signals=min_split == max_split,
+        shared_memory=budget.n_workers > 1,
     )
+    if budget.n_workers > 1:
+        # training batches are gathered from the shared signals, but each split
+        # gathers its validation rows as one batch, copied again when pinned
+        _, valid_bytes = ea_handler.fold_bytes()
+        max_splits = max_workers(
+            worker_bytes=2 * valid_bytes,
+            shared_bytes=ea_handler.signal_bytes(),
+            budget=memory_budget(),
+        )
+        if max_splits is not None and max_splits < budget.n_workers:
+            print(f"PARALLEL_SPLITS={parallel_splits} does not fit in memory.")
+            budget = ThreadBudget(n_tasks=max(len(split_nbs), 1), max_workers=max_splits)
+            budget.apply()
     loading_time = time_now() - loading_begin
 
     to_log = {
@@ -173,48 +208,103 @@ def main():
         "category": category,
     }
 
-    min_split = int(os.getenv("MIN_SPLIT", "0"))
-    max_split = int(os.getenv("MAX_SPLIT", "42"))
-
-    time_before_split = time_now()
     oversample = hparams.get("oversample", hparams.get("oversampling", True))
-    for i, my_data in enumerate(ea_handler.yield_split(oversample=oversample)):
-        # Skip if not in inclusive range
-        if not (min_split <= i <= max_split):  # pylint: disable=superfluous-parens
-            continue
 
-        split_time = time_now() - time_before_split
-        to_log.update({"split_time": split_time.total_seconds()})
+    # Folds are computed once and saved, other split jobs read them
+    train_splits(
+        ea_handler,
+        split_nbs,
+        partial(train_split, cli=cli, hparams=hparams, restore=restore_model),
+        to_log,
+        budget,
+        oversample=oversample,
+        manifest=cli.logdir / MANIFEST_NAME,
+    )
 
-        # --- Startup LOGGER ---
-        # api key in config file
-        IsOffline = cli.offline  # additional logging fails with True
 
-        logdir = Path(cli.logdir / f"split{i}")
-        create_dirs(logdir)
+def train_splits(
+    ea_handler: EpiAtlasFoldFactory,
+    split_nbs: List[int],
+    train_func: Callable,
+    to_log: Dict,
+    budget: ThreadBudget,
+    **split_kwargs,
+) -> None:
+    """Train each split of split_nbs (see get_split for split_kwargs) with
+    train_func(split_nb, my_data, to_log), budget.n_workers splits at a time.
+
+    Concurrent splits are trained in spawned worker processes, which map the shared
+    signals (see EpiAtlasFoldFactory.shared_signals) and only receive the indexes
+    of their split. Forked workers could deadlock on the torch/OpenMP thread pools
+    of this process.
+    """
+    if budget.n_workers == 1:
+        time_before_split = time_now()
+        for i in split_nbs:
+            my_data = ea_handler.get_split(i, **split_kwargs)
 
-        exp_name = "-".join(cli.logdir.parts[-3:]) + f"-split{i}"
-        comet_logger = pl_loggers.CometLogger(
-            project_name="EpiLaP",
-            experiment_name=exp_name,
-            save_dir=logdir,  # type: ignore
-            offline=IsOffline,
-            auto_metric_logging=False,
-        )
+            split_time = time_now() - time_before_split
+            to_log.update({"split_time": split_time.total_seconds()})
+            train_func(i, my_data, to_log=to_log)
 
-        comet_logger.experiment.add_tag("EpiAtlas")
-        log_pre_training(logger=comet_logger, to_log=to_log, step=i)
+            time_before_split = time_now()
+        return
 
-        # Everything happens in there
-        do_one_experiment(
-            split_nb=i,
-            my_data=my_data,
-            hparams=hparams,
-            logger=comet_logger,
-            restore=restore_model,
-        )
+    print(
+        f"Training {budget.n_workers} splits at a time, {budget.n_threads} threads each."
+    )
+    with ea_handler.shared_signals():
+        items = []
+        for i in split_nbs:
+            time_before_split = time_now()
+            my_data = ea_handler.get_split(i, **split_kwargs)
+            split_time = time_now() - time_before_split
+            items.append(
+                (i, my_data, {**to_log, "split_time": split_time.total_seconds()})
+            )
 
-        time_before_split = time_now()
+        with mp.get_context("spawn").Pool(
+            processes=budget.n_workers, initializer=budget.apply, maxtasksperchild=1
+        ) as pool:
+            pool.starmap(train_func, items)
+
+
+def train_split(
+    split_nb: int,
+    my_data: DataSet,
+    to_log: Dict,
+    cli: argparse.Namespace,
+    hparams: Dict,
+    restore: bool,
+) -> None:
+    """Create the logger and log directory of one split (logdir/split{split_nb}), and train it."""
+    # --- Startup LOGGER ---
+    # api key in config file
+    IsOffline = cli.offline  # additional logging fails with True
+
+    logdir = Path(cli.logdir / f"split{split_nb}")
+    create_dirs(logdir)
+
+    exp_name = "-".join(cli.logdir.parts[-3:]) + f"-split{split_nb}"
+    comet_logger = pl_loggers.CometLogger(
+        project_name="EpiLaP",
+        experiment_name=exp_name,
+        save_dir=logdir,  # type: ignore
+        offline=IsOffline,
+        auto_metric_logging=False,
+    )
+
+    comet_logger.experiment.add_tag("EpiAtlas")
+    log_pre_training(logger=comet_logger, to_log=to_log, step=split_nb)
+
+    # Everything happens in there
+    do_one_experiment(
+        split_nb=split_nb,
+        my_data=my_data,
+        hparams=hparams,
+        logger=comet_logger,
+        restore=restore,
+    )
 
 
 def do_one_experiment(
@@ -250,7 +340,7 @@ def do_one_experiment(
         logger.experiment.log_asset(mapping_file)
 
         #  DEFINE sizes for input and output LAYERS of the network
-        input_size = my_data.train.signals[0].size  # type: ignore
+        input_size = my_data.train.get_signal(0).size  # type: ignore
         output_size = len(my_data.classes)
         hl_units = int(os.getenv("LAYER_SIZE", default="3000"))
         nb_layers = int(os.getenv("NB_LAYER", default="1"))
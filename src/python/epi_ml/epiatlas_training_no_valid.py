@@ -27,6 +27,7 @@ from epi_ml.core.data import DataSet, create_torch_datasets
 from epi_ml.core.data_source import EpiDataSource
 from epi_ml.core.epiatlas_treatment import EpiAtlasFoldFactory
 from epi_ml.core.model_pytorch import LightningDenseClassifier
+from epi_ml.core.thread_budget import ThreadBudget
 from epi_ml.core.trainer import MyTrainer, define_callbacks
 from epi_ml.utils import modify_metadata
 from epi_ml.utils.check_dir import create_dirs
@@ -186,6 +187,10 @@ def main():
     comet_logger.experiment.add_tag("EpiAtlas")
     log_pre_training(logger=comet_logger, to_log=to_log, step=None)
 
+    # A single model is trained, on CPU it uses all the cpus of the job
+    if not torch.cuda.device_count():
+        ThreadBudget(n_tasks=1).apply()
+
     oversample = hparams.get("oversample", hparams.get("oversampling", True))
     my_data = ea_handler.create_total_data(oversample=oversample)
     my_dataset = DataSet.empty_collection()
@@ -229,7 +234,7 @@ def train_without_valid(
         logger.experiment.log_asset(mapping_file)
 
         #  DEFINE sizes for input and output LAYERS of the network
-        input_size = my_data.train.signals[0].size  # type: ignore
+        input_size = my_data.train.get_signal(0).size  # type: ignore
         output_size = len(my_data.classes)
         hl_units = int(os.getenv("LAYER_SIZE", default="3000"))
         nb_layers = int(os.getenv("NB_LAYER", default="1"))
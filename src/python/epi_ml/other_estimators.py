@@ -198,7 +198,7 @@ def main():
             print("No parameters found for selected models {models}, finishing now.")
             sys.exit()
 
-        # Load hdf5s
+        # Load hdf5s, shared with the workers of run_predictions
         ea_handler = EpiAtlasFoldFactory.from_datasource(
             my_datasource,
             category,
@@ -208,6 +208,7 @@ def main():
             min_class_size=min_class_size,
             md5_list=list(my_metadata.md5s),
             force_filter=True,
+            shared_memory=True,
         )
         loading_time = time_now() - loading_begin
         print(f"Initial hdf5 loading time: {loading_time}")
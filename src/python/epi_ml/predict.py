@@ -18,6 +18,7 @@ from epi_ml.core import analysis
 from epi_ml.core.data import DataSet, UnknownData
 from epi_ml.core.hdf5_loader import Hdf5Loader
 from epi_ml.core.model_pytorch import LightningDenseClassifier
+from epi_ml.core.quantization import to_float32
 from epi_ml.utils.time import time_now
 
 
@@ -82,16 +83,11 @@ def main():
     hdf5_loader = Hdf5Loader(chrom_file=cli.chromsize, normalization=True)
 
     if cli.hdf5_dir is not None:
-        hdf5_loader.load_hdf5s(data_file=cli.hdf5, hdf5_dir=cli.hdf5_dir)
+        signals, md5s = hdf5_loader.load_hdf5s_matrix(
+            data_file=cli.hdf5, hdf5_dir=cli.hdf5_dir
+        )
     else:
-        hdf5_loader.load_hdf5s(data_file=cli.hdf5)
-    files = hdf5_loader.signals
-
-    md5s = []
-    signals = []
-    for md5, signal in files.items():
-        md5s.append(md5)
-        signals.append(signal)
+        signals, md5s = hdf5_loader.load_hdf5s_matrix(data_file=cli.hdf5)
 
     y = [0 for _ in md5s]
     y_str = ["No label available" for _ in y]
@@ -105,7 +101,7 @@ def main():
     datasets.set_test(test_set)
 
     test_dataset = TensorDataset(
-        torch.from_numpy(test_set.signals).float(), torch.tensor(y, dtype=torch.int)
+        torch.from_numpy(to_float32(test_set.signals)), torch.tensor(y, dtype=torch.int)
     )
 
     # --- RESTORE model ---
@@ -1,6 +1,5 @@
 """Analyze metadata content."""
 # pylint: disable=import-error,import-outside-toplevel
-import copy
 from pathlib import Path
 
 import pandas as pd
@@ -27,7 +26,7 @@ def two_step_long_analysis(my_metadata: Metadata, category1: str, category2: str
     labels = my_metadata.label_counter(category1).keys()
     for label in sorted(labels):
         print(f"--{label}--")
-        temp_metadata = copy.deepcopy(my_metadata)
+        temp_metadata = my_metadata.copy()
         temp_metadata.select_category_subsets(label, [category1])
         temp_metadata.remove_small_classes(10, category2)
         if len(temp_metadata.label_counter(category2).most_common()) > 1:
@@ -52,7 +51,7 @@ def two_step_table_analysis(my_metadata: Metadata, category1: str, category2: st
         info[label] = {}
         info[label]["total_examples_before_step2_filter"] = counter_cat1[label]
 
-        temp_metadata = copy.deepcopy(my_metadata)
+        temp_metadata = my_metadata.copy()
         temp_metadata.select_category_subsets(label, [category1])
 
         info[label]["total_classes_before_step2_filter"] = len(
@@ -108,7 +107,7 @@ def compute_coherence_on_all(meta: Metadata):
 
 def create_json_from_md5_list(md5_list: Path, metadata: Metadata):
     """Save json with metadata from selected signals."""
-    metadata = copy.deepcopy(metadata)
+    metadata = metadata.copy()
     with open(md5_list, "r", encoding="utf8") as f:
         md5_set = set(md5.strip() for md5 in f.readlines())
 
@@ -0,0 +1,110 @@
+"""
+Benchmark the uuid to sample index mapping of EpiAtlasFoldFactory fold creation.
+
+Compares the per-uuid scans (np.where(uuids_inverse == idx) for each uuid)
+with UUIDGroups (one argsort + group offsets), on random uuids with about
+3 tracks per uuid. Both give the same indexes, the times are printed as a tsv table.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Callable, List
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold
+
+from epi_ml.argparseutils.DefaultHelpParser import DefaultHelpParser as ArgumentParser
+from epi_ml.core.epiatlas_treatment import UUIDGroups
+
+TRACKS_PER_UUID = 3
+
+
+def parse_arguments() -> argparse.Namespace:
+    """argument parser for command line"""
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 4000, 16000, 64000],
+        help="Numbers of samples to benchmark.",
+    )
+    arg_parser.add_argument(
+        "--n-fold", type=int, default=10, help="Number of cross-validation folds."
+    )
+    arg_parser.add_argument(
+        "--n-classes", type=int, default=20, help="Number of uuid labels."
+    )
+    return arg_parser.parse_args()
+
+
+def scan_folds(labels: np.ndarray, uuids_inverse: np.ndarray, n_fold: int) -> List:
+    """Return the (train, valid) sample indexes of each fold, scanning all samples for each uuid."""
+    labels_unique = [
+        labels[uuids_inverse == idx][0] for idx in range(uuids_inverse.max() + 1)
+    ]
+    skf = StratifiedKFold(n_splits=n_fold, shuffle=True, random_state=42)
+    folds = []
+    for train_idxs, valid_idxs in skf.split(
+        np.empty((len(labels_unique), 0)), labels_unique
+    ):
+        folds.append(
+            (
+                np.concatenate([np.where(uuids_inverse == idx)[0] for idx in train_idxs]),
+                np.concatenate([np.where(uuids_inverse == idx)[0] for idx in valid_idxs]),
+            )
+        )
+    return folds
+
+
+def grouped_folds(labels: np.ndarray, uuids_inverse: np.ndarray, n_fold: int) -> List:
+    """Return the (train, valid) sample indexes of each fold, using UUIDGroups."""
+    uuid_groups = UUIDGroups(uuids_inverse)
+    labels_unique = labels[uuid_groups.first_samples()]
+    skf = StratifiedKFold(n_splits=n_fold, shuffle=True, random_state=42)
+    return [
+        (uuid_groups.samples(train_idxs), uuid_groups.samples(valid_idxs))
+        for train_idxs, valid_idxs in skf.split(
+            np.empty((len(labels_unique), 0)), labels_unique
+        )
+    ]
+
+
+def timed(func: Callable, *args) -> tuple:
+    """Return (result, seconds) of func(*args)."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark(sizes: List[int], n_fold: int = 10, n_classes: int = 20) -> None:
+    """Print the fold creation time of both methods for each number of samples."""
+    rng = np.random.default_rng(42)
+    print("n_samples\tn_uuids\tscan_seconds\tgrouped_seconds\tspeedup")
+    for n_samples in sizes:
+        n_uuids = max(n_samples // TRACKS_PER_UUID, n_fold)
+        uuid_labels = rng.integers(n_classes, size=n_uuids)
+        uuids_inverse = rng.permutation(np.arange(n_samples) % n_uuids)
+        labels = uuid_labels[uuids_inverse]
+
+        scan, scan_time = timed(scan_folds, labels, uuids_inverse, n_fold)
+        grouped, grouped_time = timed(grouped_folds, labels, uuids_inverse, n_fold)
+        for (train1, valid1), (train2, valid2) in zip(scan, grouped):
+            if not (np.array_equal(train1, train2) and np.array_equal(valid1, valid2)):
+                raise AssertionError(f"Different folds for {n_samples} samples.")
+
+        print(
+            f"{n_samples}\t{n_uuids}\t{scan_time:.3f}\t{grouped_time:.3f}\t"
+            f"{scan_time / grouped_time:.0f}x"
+        )
+
+
+def main():
+    """Main function. Print the fold creation times for the given numbers of samples."""
+    cli = parse_arguments()
+    benchmark(cli.sizes, cli.n_fold, cli.n_classes)
+
+
+if __name__ == "__main__":
+    main()
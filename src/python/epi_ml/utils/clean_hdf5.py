@@ -20,6 +20,9 @@ The module primarily consists of the following functions:
 main() -> None:
 The main driver function that organizes the entire process of reading, filtering and writing the HDF5 files.
 
+To train on blacklisted signals without writing cleaned copies, give the BED file to
+Hdf5Loader instead (mask argument), which zeroes the same bins while loading.
+
 This module also defines the following type aliases:
 
     BEDInterval = Tuple[str, int, int]: Represents a single genomic interval from a BED file.
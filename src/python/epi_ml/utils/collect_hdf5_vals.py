@@ -100,21 +100,19 @@ def main() -> None:
         feature_list_name = "all"
         feature_list = []
 
-    hdf5_loader = Hdf5Loader(chrom_file=chromsize_path, normalization=normalize_hdf5)
-    hdf5_loader.load_hdf5s(data_file=hdf5_list_path, verbose=False, strict=True)
-
-    selected_values = {}
-    for md5sum, signal in hdf5_loader.signals.items():
-        if feature_list:
-            feature_values = signal[feature_list]
-        else:
-            feature_values = signal  # Get all data
-
-        selected_values[md5sum] = feature_values
+    # Only selected bins are read from the hdf5s
+    hdf5_loader = Hdf5Loader(
+        chrom_file=chromsize_path,
+        normalization=normalize_hdf5,
+        bin_indexes=feature_list if feature_list else None,
+    )
+    signals, md5sums = hdf5_loader.load_hdf5s_matrix(
+        data_file=hdf5_list_path, verbose=False, strict=True
+    )
 
     df_columns = feature_list if feature_list else None
 
-    df = pd.DataFrame.from_dict(selected_values, orient="index", columns=df_columns)
+    df = pd.DataFrame(signals, index=md5sums, columns=df_columns)
 
     output_name = f"hdf5_values_{hdf5_list_path.stem}_{feature_list_name}"
     if save_hdf:
@@ -7,13 +7,15 @@ import os
 import warnings
 from importlib import metadata
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Tuple
 
 import numpy as np
 import skops.io as skio
 from sklearn.decomposition import IncrementalPCA
+from sklearn.utils import gen_batches
 
 from epi_ml.core.hdf5_loader import Hdf5Loader
+from epi_ml.core.quantization import QuantizedSignals, to_float32
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -58,6 +60,17 @@ def find_rows_with_same_values(arr, atol=1e-5) -> List[int]:
     return problematic_rows
 
 
+def iter_blocks(
+    data: np.ndarray | QuantizedSignals, batch_size: int, min_batch_size: int = 0
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield (first row, rows) of consecutive row blocks of data, as float32.
+
+    Reduced precision signals (see Hdf5Loader dtype) are widened one block at a time.
+    """
+    for batch in gen_batches(len(data), batch_size, min_batch_size=min_batch_size):
+        yield batch.start, to_float32(data[batch])
+
+
 def main():
     """Run the main function."""
     cli = parse_arguments()
@@ -98,37 +111,44 @@ def main():
     try:
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore", message="Cannot read file directly with")
-            hdf5_dict = hdf5_loader.load_hdf5s(
+            data, file_names = hdf5_loader.load_hdf5s_matrix(
                 data_file=hdf5_paths_list_path,
                 verbose=True,
                 strict=False,
-            ).signals
+            )
     except Exception as e:
         raise RuntimeError(f"Error loading HDF5 files: {str(e)}") from e
 
-    if not hdf5_dict:
+    if not file_names:
         raise ValueError("No valid data loaded from HDF5 files")
 
-    print(f"Loaded {len(hdf5_dict)}/{total_files} files.")
-
-    # Extract data and free memory
-    file_names = list(hdf5_dict.keys())
-    try:
-        # Stack all arrays into a single 2D array
-        data = np.array(list(hdf5_dict.values()), dtype=np.float32)
-        print(f"Dataset shape: {data.shape}")
-    except Exception as e:
-        raise RuntimeError(f"Error converting data to numpy array: {str(e)}") from e
-    finally:
-        del hdf5_dict  # Free memory immediately
+    print(f"Loaded {len(file_names)}/{total_files} files.")
+    print(f"Dataset shape: {data.shape}")
 
     if data.size == 0:
         raise ValueError("Empty dataset after conversion")
 
-    # Find rows containing NaN or Inf values
-    problematic_rows = (~np.isfinite(data)).any(axis=1)
-    if np.any(problematic_rows):
-        row_indices = np.where(problematic_rows)[0]
+    N_files = len(file_names)
+
+    # Validate batch size against dataset size
+    if cli.batch_size > N_files:
+        print(
+            f"Warning: batch_size ({cli.batch_size}) is larger than dataset size ({N_files})"
+        )
+        batch_size = N_files
+    else:
+        batch_size = cli.batch_size
+
+    # Find rows containing NaN or Inf values, or all identical values
+    row_indices = []
+    problematic_rows_idx = []
+    for start, block in iter_blocks(data, batch_size):
+        row_indices.extend(
+            (start + np.flatnonzero((~np.isfinite(block)).any(axis=1))).tolist()
+        )
+        problematic_rows_idx.extend(start + i for i in find_rows_with_same_values(block))
+
+    if row_indices:
         print(f"Problematic rows (indices): {row_indices}")
 
         affected_files = [file_names[i] for i in row_indices]
@@ -136,7 +156,6 @@ def main():
 
         raise ValueError("Dataset contains inf or NaN values")
 
-    problematic_rows_idx = find_rows_with_same_values(data)
     if problematic_rows_idx:
         print(f"Problematic rows (indices): {problematic_rows_idx}")
         affected_files = [file_names[i] for i in problematic_rows_idx]
@@ -145,24 +164,17 @@ def main():
             "Dataset contains rows with all identical values. Check preprocessing steps."
         )
 
-    N_files = len(file_names)
-
-    # Validate batch size against dataset size
-    if cli.batch_size > N_files:
-        print(
-            f"Warning: batch_size ({cli.batch_size}) is larger than dataset size ({N_files})"
-        )
-        batch_size = N_files
-    else:
-        batch_size = cli.batch_size
-
-    # PCA computation
+    # PCA computation, by row blocks (same batches as IncrementalPCA.fit)
     print("Computing PCA")
     n_components = min(3, N_files)  # Ensure n_components doesn't exceed dataset size
     ipca = IncrementalPCA(n_components=n_components, batch_size=batch_size)
 
     try:
-        X_ipca = ipca.fit_transform(data)
+        for _, block in iter_blocks(data, batch_size, min_batch_size=n_components):
+            ipca.partial_fit(block)
+        X_ipca = np.concatenate(
+            [ipca.transform(block) for _, block in iter_blocks(data, batch_size)]
+        )
     except Exception as e:
         raise RuntimeError(f"PCA computation failed: {str(e)}") from e
     finally:
@@ -11,7 +11,6 @@ import warnings
 from importlib import metadata
 from pathlib import Path
 
-import numpy as np
 import umap
 from umap.umap_ import nearest_neighbors
 
@@ -73,7 +72,10 @@ def main():
         if not path.exists():
             raise FileNotFoundError(f"Could not find {path}.")
 
-    hdf5_loader = Hdf5Loader(chrom_file=chromsize_path, normalization=True)
+    # UMAP needs the whole matrix as floats, reduced precision ($HDF5_LOADER_DTYPE) is not supported
+    hdf5_loader = Hdf5Loader(
+        chrom_file=chromsize_path, normalization=True, dtype="float32"
+    )
 
     # Get all paths
     hdf5_input_dir = Path(os.environ.get("SLURM_TMPDIR", "/tmp"))
@@ -98,16 +100,13 @@ def main():
     # Load relevant files
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", message="Cannot read file directly with")
-        hdf5_dict = hdf5_loader.load_hdf5s(
+        data, file_names = hdf5_loader.load_hdf5s_matrix(
             data_file=hdf5_paths_list_path,
             verbose=True,
             strict=False,
-        ).signals
+        )
 
-    print(f"Loaded {len(hdf5_dict)}/{len(all_paths)} files.")
-    file_names = list(hdf5_dict.keys())
-    data = np.array(list(hdf5_dict.values()), dtype=np.float32)
-    del hdf5_dict
+    print(f"Loaded {len(file_names)}/{len(all_paths)} files.")
 
     # UMAP parameters
     nn_default = 15
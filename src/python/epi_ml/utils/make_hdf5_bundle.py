@@ -0,0 +1,138 @@
+"""
+Consolidate the hdf5 files of an hdf5 list into one hdf5 bundle (see epi_ml.core.hdf5_bundle).
+
+A bundle is a single chunked and compressed file, that can be given instead of
+the hdf5 list to Hdf5Loader and EpiDataSource. Copying one file to $SLURM_TMPDIR/hdf5s
+(see Hdf5Loader.adapt_to_environment) is much lighter on the file system than copying
+thousands of small hdf5s.
+
+Raw signals are stored (no normalization), as float32, with their original resolution.
+Files that cannot be loaded are reported and left out.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+from typing import List
+
+import h5py
+import numpy as np
+
+from epi_ml.argparseutils.hdf5_list_parser import hdf5_list_parser
+from epi_ml.core.data_source import EpiDataSource
+from epi_ml.core.hdf5_bundle import BUNDLE_FORMAT, BUNDLE_VERSION, CHUNK_BINS, COMPRESSION
+from epi_ml.core.hdf5_loader import Hdf5Loader
+
+
+def parse_arguments() -> argparse.Namespace:
+    """argument parser for command line"""
+    arg_parser = hdf5_list_parser(output_help="Path of the bundle to write.")
+    return arg_parser.parse_args()
+
+
+def get_resolution(hdf5_file: Path) -> int:
+    """Return the resolution of an hdf5 file, from its attributes or its name."""
+    try:
+        return EpiDataSource.get_file_hdf5_resolution(hdf5_file)
+    except KeyError:
+        return EpiDataSource.get_resolution_from_filename(hdf5_file)
+
+
+def make_bundle(
+    hdf5_list: Path,
+    chromsize: Path,
+    output: Path,
+    batch_size: int = 256,
+    n_jobs: int | None = None,
+) -> Path:
+    """Write the raw signals of all loadable files of hdf5_list into an hdf5 bundle.
+
+    Files are loaded by batches with Hdf5Loader, n_jobs files at a time (default $HDF5_LOADER_JOBS).
+    Return the output path.
+
+    Raises:
+        ValueError: if files do not all have the same chromosome lengths.
+    """
+    # raw float32 values, whatever $HDF5_LOADER_DTYPE, and no signal cache ($HDF5_CACHE_DIR)
+    hdf5_loader = Hdf5Loader(
+        chromsize, normalization=False, n_jobs=n_jobs, dtype="float32", cache_dir=""
+    )
+    chroms = hdf5_loader.load_chroms(chromsize)
+    files = hdf5_loader.read_list(hdf5_list)
+    all_md5s = list(files.keys())
+
+    tmp_output = output.with_name(output.name + ".tmp")
+    with h5py.File(tmp_output, "w") as bundle:
+        bundle.attrs["format"] = BUNDLE_FORMAT
+        bundle.attrs["version"] = BUNDLE_VERSION
+
+        signals = None
+        chrom_lengths: List[int] = []
+        md5s, resolutions, means, stds = [], [], [], []
+        for start in range(0, len(all_md5s), batch_size):
+            matrix, batch_md5s = hdf5_loader.load_hdf5s_matrix(
+                hdf5_list, md5s=all_md5s[start : start + batch_size], verbose=False
+            )
+            if not batch_md5s:
+                continue
+
+            if signals is None:
+                chunk_bins = max(1, min(matrix.shape[1], CHUNK_BINS))
+                signals = bundle.create_dataset(
+                    "signals",
+                    shape=(0, matrix.shape[1]),
+                    maxshape=(None, matrix.shape[1]),
+                    dtype=np.float32,
+                    chunks=(1, chunk_bins),
+                    compression=COMPRESSION,
+                    shuffle=True,
+                )
+                with h5py.File(hdf5_loader.loaded_files[batch_md5s[0]], "r") as f:
+                    hdf5_data = f[list(f.keys())[0]]
+                    chrom_lengths = [hdf5_data[chrom].shape[0] for chrom in chroms]  # type: ignore
+            elif matrix.shape[1] != signals.shape[1]:
+                raise ValueError(
+                    f"Signals of size {matrix.shape[1]}, expected {signals.shape[1]} bins."
+                )
+
+            n_rows = signals.shape[0]
+            signals.resize(n_rows + len(batch_md5s), axis=0)
+            signals[n_rows:] = matrix
+
+            md5s.extend(batch_md5s)
+            resolutions.extend(
+                get_resolution(hdf5_loader.loaded_files[md5]) for md5 in batch_md5s
+            )
+            means.extend(matrix.mean(axis=1, dtype=np.float64))
+            stds.extend(matrix.std(axis=1, dtype=np.float64))
+            print(f"{len(md5s)}/{len(all_md5s)} files consolidated.")
+
+        if signals is None:
+            raise ValueError(f"No file of {hdf5_list} could be loaded.")
+
+        string_dtype = h5py.string_dtype()
+        bundle.create_dataset("md5s", data=md5s, dtype=string_dtype)
+        bundle.create_dataset(
+            "files", data=[files[md5].name for md5 in md5s], dtype=string_dtype
+        )
+        bundle.create_dataset("resolution", data=np.array(resolutions, dtype=np.int64))
+        bundle.create_dataset("mean", data=np.array(means, dtype=np.float64))
+        bundle.create_dataset("std", data=np.array(stds, dtype=np.float64))
+        bundle.create_dataset("chroms", data=chroms, dtype=string_dtype)
+        bundle.create_dataset(
+            "chrom_lengths", data=np.array(chrom_lengths, dtype=np.int64)
+        )
+
+    os.replace(tmp_output, output)
+    return output
+
+
+def main():
+    """Main function. Write the hdf5 bundle of given hdf5 list."""
+    cli = parse_arguments()
+    make_bundle(cli.hdf5_list, cli.chromsize, cli.output, batch_size=cli.batch_size)
+
+
+if __name__ == "__main__":
+    main()
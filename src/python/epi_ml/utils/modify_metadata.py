@@ -1,7 +1,6 @@
 """Functions to perform more complex operations on the metadata."""
 
 import collections
-import copy
 import datetime
 import random
 from typing import TypeVar
@@ -90,17 +89,16 @@ def keep_major_cell_types_alt(my_metadata: Metadata):
     """Return a filtered metadata with certain assays. Datasets which are
     not part of a cell_type which has at least 10 signals are removed.
     """
-    my_meta = copy.deepcopy(my_metadata)
+    my_meta = my_metadata.copy()
 
     # remove useless assays and cell_types
     my_meta.select_category_subsets("assay", DP_ASSAYS)
     my_meta.remove_small_classes(10, "cell_type")
     my_meta.convert_classes("tissue_type", merge_fetal_tissues)
 
-    new_meta = copy.deepcopy(my_meta)
-    new_meta.empty()
+    new_meta = my_meta.copy(md5s=[])
     for assay in DP_ASSAYS:
-        temp_meta = copy.deepcopy(my_meta)
+        temp_meta = my_meta.copy()
         temp_meta.select_category_subsets("assay", [assay])
         temp_meta.remove_small_classes(10, "cell_type")
         for md5 in temp_meta.md5s:
@@ -136,14 +134,14 @@ def filter_by_pairs(
     1) Remove (assay_cat, cat2) pairs that have less than 'min_per_pair' signals.
     2) Only keep cat2 that have at least 'nb_pairs' different pairings still non-zero.
     """
-    my_metadata = copy.deepcopy(my_metadata)
+    my_metadata = my_metadata.copy()
     print("Applying metadata filter function 'filter_by_pairs'.")
     to_ignore = ["other", "--", "", "na"]
     for cat in assay_cat, cat2:
         my_metadata.remove_missing_labels(cat)
         my_metadata.remove_category_subsets(cat, to_ignore)
 
-    full_metadata = copy.deepcopy(my_metadata)
+    full_metadata = my_metadata.copy()
 
     nb_assay = len(full_metadata.label_counter(assay_cat, verbose=False))
     if nb_assay < nb_pairs:
@@ -204,7 +202,7 @@ def special_case(my_metadata):
     my_metadata = five_cell_types_selection(my_metadata)
 
     # get some thyroid examples md5s, there are none in rna_seq
-    temp_meta = copy.deepcopy(my_metadata)
+    temp_meta = my_metadata.copy()
     temp_meta.select_category_subsets("assay", ["h3k9me3"])
     md5s = temp_meta.md5_per_class("cell_type")["thyroid"][0:3]
 
@@ -229,7 +227,7 @@ def special_case_2(my_metadata):
     cell_types = my_metadata.md5_per_class("cell_type").keys()
     to_del = []
     for cell_type in cell_types:
-        temp_meta = copy.deepcopy(my_metadata)
+        temp_meta = my_metadata.copy()
         temp_meta.select_category_subsets("cell_type", [cell_type])
         for md5s in temp_meta.md5_per_class("assay").values():
             to_del.extend(md5s[0:2])
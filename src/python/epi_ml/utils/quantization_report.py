@@ -0,0 +1,103 @@
+"""
+Report the maximum error of reduced precision signals (see Hdf5Loader dtype), for each hdf5 file.
+
+Signals are loaded in float32 (normalized or not), reduced to float16 and int8,
+and compared to the float32 values. Files with a maximum absolute error above
+the given threshold are logged as warnings, like the casting check of hdf5_to_float32.py.
+
+Written as a tsv file with columns: md5, dtype, max_abs_error, max_rel_error,
+where the relative error is over the largest absolute value of the signal.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from epi_ml.argparseutils.hdf5_list_parser import hdf5_list_parser
+from epi_ml.core.hdf5_loader import Hdf5Loader
+from epi_ml.core.quantization import max_errors, reduce_precision
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+REDUCED_DTYPES = ["float16", "int8"]
+
+
+def parse_arguments() -> argparse.Namespace:
+    """argument parser for command line"""
+    arg_parser = hdf5_list_parser(output_help="Path of the tsv report to write.")
+    arg_parser.add_argument(
+        "--normalization",
+        default=None,
+        help="Normalization applied before reducing precision (see Hdf5Loader). Default: raw signals.",
+    )
+    arg_parser.add_argument(
+        "--max-error",
+        type=float,
+        default=1e-2,
+        help="Maximum absolute error before a file is reported.",
+    )
+    return arg_parser.parse_args()
+
+
+def quantization_report(
+    hdf5_list: Path,
+    chromsize: Path,
+    output: Path,
+    normalization: str | None = None,
+    max_error: float = 1e-2,
+    batch_size: int = 256,
+) -> Path:
+    """Write the tsv report of the maximum reduced precision error of each file of hdf5_list.
+
+    Return the output path.
+    """
+    hdf5_loader = Hdf5Loader(chromsize, normalization=normalization, dtype="float32")
+    all_md5s = list(hdf5_loader.read_list(hdf5_list).keys())
+
+    with open(output, "w", encoding="utf-8") as report:
+        report.write("md5\tdtype\tmax_abs_error\tmax_rel_error\n")
+        for start in range(0, len(all_md5s), batch_size):
+            signals, md5s = hdf5_loader.load_hdf5s_matrix(
+                hdf5_list, md5s=all_md5s[start : start + batch_size], verbose=False
+            )
+            max_values = np.max(np.abs(signals), axis=1, initial=0)
+            max_values[max_values == 0] = 1
+            for dtype in REDUCED_DTYPES:
+                errors = max_errors(signals, reduce_precision(signals, dtype))
+                for md5, error, max_value in zip(md5s, errors, max_values):
+                    if error > max_error:
+                        logging.warning(
+                            "%s max(diff)=%.5f > %.5f: %s", dtype, error, max_error, md5
+                        )
+                    report.write(
+                        f"{md5}\t{dtype}\t{error:.6g}\t{error / max_value:.6g}\n"
+                    )
+            logging.info(
+                "%s/%s files checked.",
+                min(start + batch_size, len(all_md5s)),
+                len(all_md5s),
+            )
+
+    return output
+
+
+def main():
+    """Main function. Write the reduced precision error report of given hdf5 list."""
+    cli = parse_arguments()
+    quantization_report(
+        cli.hdf5_list,
+        cli.chromsize,
+        cli.output,
+        normalization=cli.normalization,
+        max_error=cli.max_error,
+        batch_size=cli.batch_size,
+    )
+
+
+if __name__ == "__main__":
+    main()
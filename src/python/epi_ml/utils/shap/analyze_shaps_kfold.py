@@ -15,7 +15,6 @@ The following analyses are performed:
 from __future__ import annotations
 
 import argparse
-import copy
 import itertools
 import json
 import multiprocessing
@@ -81,7 +80,7 @@ def analyze_shap_fold(
     shap_matrices, eval_md5s, classes = extract_shap_values_and_info_output
 
     if copy_metadata:
-        meta = copy.deepcopy(metadata)
+        meta = metadata.copy()
     else:
         meta = metadata
 
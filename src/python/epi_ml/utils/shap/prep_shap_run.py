@@ -3,7 +3,6 @@
 from __future__ import annotations
 
 import argparse
-import copy
 import itertools
 import os
 import random
@@ -83,11 +82,7 @@ def evaluate_background_ratios(
     - List[str]: List of md5 hashes representing the best background datasets based on minimal ratio difference.
     - int: Sampling size used to select the best background datasets.
     """
-    training_metadata = copy.deepcopy(metadata)
-    training_md5s_set = set(training_md5s)
-    for md5 in list(training_metadata.md5s):
-        if md5 not in training_md5s_set:
-            del training_metadata[md5]
+    training_metadata = metadata.copy(md5s=training_md5s)
 
     trios_md5_dict = defaultdict(list)
     for dset in training_metadata.datasets:
@@ -103,15 +98,12 @@ def evaluate_background_ratios(
     best_diff = float("inf")
     best_n_per_trio = 666
     for n_per_trio in n_samples_list:
-        meta = copy.deepcopy(training_metadata)
         background_md5s = set()
         for _, md5s in trios_md5_dict.items():
             background_md5s.update(md5s[0:n_per_trio])
 
-        # Remove md5s not in the background from meta
-        for md5 in list(meta.md5s):
-            if md5 not in background_md5s:
-                del meta[md5]
+        # Only keep md5s in the background
+        meta = training_metadata.copy(md5s=background_md5s)
 
         if verbose:
             print(f"\nn_per_trio: {n_per_trio}")
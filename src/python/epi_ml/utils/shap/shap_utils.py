@@ -2,7 +2,6 @@
 # pylint: disable=use-dict-literal
 from __future__ import annotations
 
-import copy
 from pathlib import Path
 from typing import Dict, List, Tuple
 
@@ -140,7 +139,7 @@ def subsample_md5s(
         list: A list of indices corresponding to the selected md5s.
     """
     if copy_metadata:
-        meta = copy.deepcopy(metadata)
+        meta = metadata.copy()
     else:
         meta = metadata
 
@@ -186,7 +185,7 @@ def get_shap_matrix(
         IndexError: If the `class_idx` is out of bounds for the `shap_matrices`.
     """
     if copy_meta:
-        my_meta = copy.deepcopy(meta)
+        my_meta = meta.copy()
     else:
         my_meta = meta
 
@@ -7,6 +7,7 @@ import numpy as np
 import pytest
 
 from epi_ml.core import data, metadata
+from epi_ml.core.signal_view import SignalView
 
 
 class TestData:
@@ -94,3 +95,32 @@ class TestData:
             assert ids[position] == f"id{nb}"
             assert list(signals[position]) == TestData.mock_signal(nb)
             assert targets[position] == nb % 2
+
+    def test_subsample_view(self, some_data: data.KnownData):
+        """Test that subsamples share the signals matrix, also when shuffled."""
+        matrix = some_data.signals
+        subsample = some_data.subsample([4, 9, 9, 12]).subsample([3, 1, 0])
+
+        rows = subsample.signal_rows
+        assert isinstance(rows, SignalView)
+        assert rows.matrix is matrix
+        assert np.array_equal(rows[[0, 2]], matrix[[12, 4]])
+
+        subsample.shuffle(seed=True)
+        some_data.shuffle(seed=True)
+        assert np.array_equal(matrix[4], TestData.mock_signal(4))
+        for sig_id, signal in zip(subsample.ids, subsample.signals):
+            assert list(signal) == TestData.mock_signal(int(sig_id[2:]))
+
+    def test_weighted_signals(self, some_data: data.KnownData):
+        """Test that repeated examples are given once, weighted by their repetitions."""
+        signals, labels, weights = some_data.weighted_signals()
+        assert weights is None
+        assert np.array_equal(signals, some_data.signals)
+
+        subsample = some_data.subsample([4, 9, 9, 12, 4, 9])
+        signals, labels, weights = subsample.weighted_signals()
+        assert np.array_equal(signals, some_data.signals[[4, 9, 12]])
+        assert np.array_equal(labels, some_data.encoded_labels[[4, 9, 12]])
+        assert list(weights) == [2, 3, 1]
+        assert isinstance(subsample.signal_rows, SignalView)
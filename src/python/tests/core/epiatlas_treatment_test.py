@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import copy
+import pickle
 from collections import Counter
 from pathlib import Path
 from typing import List
@@ -16,8 +17,10 @@ from epi_ml.core.epiatlas_treatment import (
     LEADER_TRACKS,
     OTHER_TRACKS,
     EpiAtlasFoldFactory,
+    UUIDGroups,
 )
 from epi_ml.core.metadata import Metadata
+from epi_ml.core.signal_view import SignalView
 from epi_ml.utils.general_utility import write_md5s_to_file
 from epi_ml.utils.metadata_utils import count_labels_from_dset
 from tests.epilap_test_data import FIXTURES_DIR, EpiAtlasTreatmentTestData
@@ -200,10 +203,88 @@ class TestEpiAtlasFoldFactory:
 
         assert valid_raw_sum == total_raw_count
 
+    def test_lazy_signals(self, test_datasource, test_metadata):
+        """Make sure lazy signals give the same splits as loaded signals."""
+        ea_handlers = [
+            EpiAtlasFoldFactory.from_datasource(
+                test_datasource,
+                label_category="biomaterial_type",
+                min_class_size=2,
+                n_fold=3,
+                md5_list=list(test_metadata.md5s),
+                force_filter=True,
+                lazy_signals=lazy_signals,
+            )
+            for lazy_signals in [False, True]
+        ]
+
+        for dset, lazy_dset in zip(*[handler.yield_split() for handler in ea_handlers]):
+            for split, lazy_split in [
+                (dset.train, lazy_dset.train),
+                (dset.validation, lazy_dset.validation),
+            ]:
+                assert np.array_equal(split.ids, lazy_split.ids)
+                assert np.array_equal(split.signals, lazy_split.signals)
+
+    def test_lazy_signals_oversampled(self, test_datasource, test_metadata):
+        """Make sure oversampled lazy training signals are read and kept once."""
+        ea_handler = EpiAtlasFoldFactory.from_datasource(
+            test_datasource,
+            label_category="biomaterial_type",
+            min_class_size=2,
+            n_fold=3,
+            md5_list=list(test_metadata.md5s),
+            force_filter=True,
+            lazy_signals=True,
+        )
+
+        for dset in ea_handler.yield_split(oversample=True):
+            n_unique = len(set(dset.train.ids))
+            assert n_unique < dset.train.num_examples
+
+            signals = dset.train.signal_rows
+            assert isinstance(signals, SignalView)
+            assert len(signals.matrix) == n_unique
+
+            unique_signals, _, weights = dset.train.weighted_signals()
+            assert len(unique_signals) == n_unique
+            assert weights.sum() == dset.train.num_examples
+
     def test_split_by_track_type(self):
         """Test that track types are distributed correctly but same uuid stay together."""
         raise NotImplementedError
 
+    def test_get_split_manifest(self, test_data: EpiAtlasFoldFactory, tmp_path):
+        """Test that get_split gives the yield_split splits, with or without fold manifest."""
+        manifest = tmp_path / "folds_manifest.json"
+        for i, dset in enumerate(test_data.yield_split()):
+            for split in [
+                test_data.get_split(i),
+                test_data.get_split(i, manifest=manifest),
+                EpiAtlasFoldFactory(
+                    test_data.epiatlas_dataset, test_data.n_fold
+                ).get_split(i, manifest=manifest),
+            ]:
+                assert list(split.train.ids) == list(dset.train.ids)
+                assert list(split.validation.ids) == list(dset.validation.ids)
+        assert manifest.exists()
+
+        with pytest.raises(IndexError):
+            test_data.get_split(test_data.n_fold)
+
+    def test_shared_signals(self, test_data: EpiAtlasFoldFactory):
+        """Test that splits in shared_signals are the same, and pickled without signals."""
+        train_val = test_data.train_val_dset
+        dsets = list(test_data.yield_split())
+        with test_data.shared_signals():
+            assert test_data.train_val_dset is not train_val
+            for dset, shared in zip(dsets, test_data.yield_split()):
+                restored = pickle.loads(pickle.dumps(shared))
+                assert len(pickle.dumps(shared)) < len(pickle.dumps(dset))
+                assert np.array_equal(restored.train.signals, dset.train.signals)
+                assert list(restored.validation.ids) == list(dset.validation.ids)
+        assert test_data.train_val_dset is train_val
+
     def test_create_total_data_without_oversampling(self, test_data: EpiAtlasFoldFactory):
         """Test create_total_data without oversampling."""
         result = test_data.create_total_data(oversample=False)
@@ -267,3 +348,20 @@ def test_StratifiedKFold_sanity():
         train2, valid2 = elem2
         assert np.array_equal(train1, train2)
         assert np.array_equal(valid1, valid2)
+
+
+def test_uuid_groups():
+    """Test that UUIDGroups maps uuid indexes to the same sample indexes as np.where."""
+    rng = np.random.default_rng(42)
+    uuids = rng.choice([f"uuid{i}" for i in range(50)], size=300)
+    uuids_unique, uuids_inverse = np.unique(uuids, return_inverse=True)
+    n_uuids = len(uuids_unique)
+    uuid_groups = UUIDGroups(uuids_inverse)
+
+    first_samples = [np.where(uuids_inverse == idx)[0][0] for idx in range(n_uuids)]
+    assert np.array_equal(uuid_groups.first_samples(), first_samples)
+
+    uuid_idxs = rng.choice(n_uuids, size=80)  # repeated, as in oversampling
+    expected = np.concatenate([np.where(uuids_inverse == idx)[0] for idx in uuid_idxs])
+    assert np.array_equal(uuid_groups.samples(uuid_idxs), expected)
+    assert len(uuid_groups.samples([])) == 0
@@ -0,0 +1,35 @@
+"""Test module for FoldManifest."""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from epi_ml.core.fold_manifest import FoldManifest
+
+
+def test_save_load(tmp_path: Path):
+    """Test that folds are loaded back only with the same key."""
+    ids = [f"md5{i}" for i in range(6)]
+    folds = [
+        (np.array([0, 1, 2, 0, 1]), np.array([3, 4, 5])),
+        (np.array([3, 4, 5]), np.array([0, 1, 2])),
+    ]
+    key = FoldManifest.make_key(ids, ["a"] * 6, ["uuid"] * 6, n_fold=2)
+    manifest = FoldManifest(tmp_path / "folds.json")
+    assert manifest.load(key) is None
+
+    manifest.save(key, ids, folds, {"n_fold": 2})
+    loaded = manifest.load(key)
+    assert loaded is not None
+    for (train, valid), (loaded_train, loaded_valid) in zip(folds, loaded):
+        assert np.array_equal(train, loaded_train)
+        assert np.array_equal(valid, loaded_valid)
+
+    content = json.loads(manifest.path.read_text(encoding="utf-8"))
+    assert content["folds"][0]["train"] == ["md50", "md51", "md52"]
+    assert content["folds"][0]["valid"] == ["md53", "md54", "md55"]
+
+    other_key = FoldManifest.make_key(ids, ["a"] * 5 + ["b"], ["uuid"] * 6, n_fold=2)
+    assert manifest.load(other_key) is None
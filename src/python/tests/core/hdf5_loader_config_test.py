@@ -0,0 +1,73 @@
+"""Test module for hdf5_loader_config."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from epi_ml.core.hdf5_loader import Hdf5Loader
+from epi_ml.core.hdf5_loader_config import ENV_OPTIONS, Hdf5LoaderConfig
+
+
+@pytest.fixture(autouse=True)
+def clean_environment(monkeypatch):
+    """Remove the loader environment variables."""
+    for variable, _ in ENV_OPTIONS.values():
+        monkeypatch.delenv(variable, raising=False)
+    monkeypatch.delenv("HDF5_MEMORY_BUDGET", raising=False)
+    monkeypatch.delenv("SLURM_MEM_PER_NODE", raising=False)
+    monkeypatch.delenv("SLURM_MEM_PER_CPU", raising=False)
+
+
+def test_defaults():
+    """Verify the defaults of options without environment variables."""
+    config = Hdf5LoaderConfig()
+    assert config.n_jobs == 1
+    assert config.pool == "process"
+    assert config.dtype == "float32"
+    assert config.chrom_jobs == 1
+    assert config.memory_policy == "mmap"
+    assert config.cache_dir is None
+    assert config.stage_dir is None
+    assert config.stage_archive is None
+    assert config.memory_budget is None
+
+
+def test_environment(monkeypatch, tmp_path: Path):
+    """Verify that options not given come from their environment variable."""
+    monkeypatch.setenv("HDF5_LOADER_JOBS", "3")
+    monkeypatch.setenv("HDF5_LOADER_DTYPE", "int8")
+    monkeypatch.setenv("HDF5_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("HDF5_MEMORY_BUDGET", "2G")
+
+    config = Hdf5LoaderConfig(dtype="float16", cache_dir="")
+    assert config.n_jobs == 3
+    assert config.dtype == "float16"
+    assert config.cache_dir is None
+    assert config.memory_budget == 2 * 2**30
+    assert Hdf5LoaderConfig().cache_dir == tmp_path
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{"n_jobs": 0}, {"pool": "gpu"}, {"dtype": "int4"}, {"memory_policy": "swap"}],
+)
+def test_invalid_options(options: dict):
+    """Verify that invalid options are rejected."""
+    with pytest.raises(ValueError):
+        Hdf5LoaderConfig(**options)
+
+
+def test_loader_options(tmp_path: Path):
+    """Verify that loader options create its config, unless a config is given."""
+    chroms_file = tmp_path / "chroms.sizes"
+    chroms_file.write_text("chr1\t1000\n")
+
+    hdf5_loader = Hdf5Loader(chroms_file, True, n_jobs=2, dtype="float16")
+    assert hdf5_loader.config.n_jobs == 2
+    assert hdf5_loader.dtype == "float16"
+
+    config = Hdf5LoaderConfig(chrom_jobs=4)
+    assert Hdf5Loader(chroms_file, True, config=config).config is config
+    with pytest.raises(ValueError):
+        Hdf5Loader(chroms_file, True, config=config, n_jobs=2)
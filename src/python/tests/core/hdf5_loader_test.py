@@ -1,15 +1,23 @@
 """Test module for hdf5_loader file."""
 from __future__ import annotations
 
+import multiprocessing as mp
 import os
+import pickle
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import h5py  # pylint: disable=unused-import # import to avoid weirdness
+import numpy as np
 import pytest
 
 from epi_ml.core.epiatlas_treatment import EpiAtlasDataset
 from epi_ml.core.hdf5_loader import Hdf5Loader
+from epi_ml.core.quantization import max_errors
+from epi_ml.core.shared_signals import is_shared
+from epi_ml.core.signal_memory_cache import SignalMemoryCache
 from tests.epilap_test_data import EpiAtlasTreatmentTestData
 
 
@@ -31,6 +39,451 @@ class Test_Hdf5Loader:
         hdf5_loader = Hdf5Loader(test_data.datasource.chromsize_file, True)
         hdf5_loader.load_hdf5s(test_data.datasource.hdf5_file, strict=True)
 
+    @pytest.mark.parametrize("pool", ["thread", "process"])
+    def test_load_hdf5s_parallel(self, test_data: EpiAtlasDataset, pool: str):
+        """Verify that parallel loading gives the same signals, in the same order, as serial loading."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        serial = Hdf5Loader(chroms_file, True, n_jobs=1).load_hdf5s(hdf5_list).signals
+        parallel = (
+            Hdf5Loader(chroms_file, True, n_jobs=3, pool=pool)
+            .load_hdf5s(hdf5_list)
+            .signals
+        )
+
+        assert list(serial.keys()) == list(parallel.keys())
+        for md5, signal in serial.items():
+            assert np.array_equal(signal, parallel[md5])
+
+    @pytest.mark.parametrize(
+        "n_jobs,pool", [(1, "process"), (3, "thread"), (3, "process")]
+    )
+    def test_load_hdf5s_matrix(self, test_data: EpiAtlasDataset, n_jobs: int, pool: str):
+        """Verify that the signal matrix rows match the signals loaded one by one."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        signals = Hdf5Loader(chroms_file, True).load_hdf5s(hdf5_list).signals
+
+        hdf5_loader = Hdf5Loader(chroms_file, True, n_jobs=n_jobs, pool=pool)
+        matrix, md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+
+        assert matrix.dtype == np.float32
+        assert md5s == list(signals.keys())
+        for md5, row in zip(md5s, matrix):
+            assert np.allclose(row, signals[md5])
+            assert np.shares_memory(hdf5_loader.signals[md5], matrix)
+
+    @pytest.mark.parametrize("method", ["fork", "spawn"])
+    def test_process_pool_loader_sent_once(
+        self, test_data: EpiAtlasDataset, method: str, monkeypatch
+    ):
+        """Verify that process pool workers receive the loader once, not with each file."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+        signals = Hdf5Loader(chroms_file, True).load_hdf5s(hdf5_list).signals
+
+        sent = []
+        getstate = Hdf5Loader.__getstate__
+
+        def counted_getstate(self):
+            sent.append(self)
+            return getstate(self)
+
+        monkeypatch.setattr(Hdf5Loader, "__getstate__", counted_getstate)
+        monkeypatch.setattr(
+            "epi_ml.core.hdf5_file_pool.ProcessPoolExecutor",
+            partial(ProcessPoolExecutor, mp_context=mp.get_context(method)),
+        )
+        hdf5_loader = Hdf5Loader(chroms_file, True, n_jobs=2, pool="process")
+        loaded = hdf5_loader.load_hdf5s(hdf5_list, strict=True).signals
+
+        assert len(signals) > 2
+        assert len(sent) <= 2
+        for md5, signal in signals.items():
+            assert np.array_equal(loaded[md5], signal)
+
+    def test_load_hdf5s_matrix_cache(self, test_data: EpiAtlasDataset, tmp_path: Path):
+        """Verify that cached signals are the loaded signals, and are memory-mapped on reuse."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        matrix, md5s = Hdf5Loader(chroms_file, True).load_hdf5s_matrix(hdf5_list)
+
+        for _ in range(2):
+            hdf5_loader = Hdf5Loader(chroms_file, True, cache_dir=tmp_path)
+            cached_matrix, cached_md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+            assert cached_md5s == md5s
+            assert np.array_equal(cached_matrix, matrix)
+        assert isinstance(cached_matrix, np.memmap)
+
+        subset = md5s[1:3]
+        sub_matrix, sub_md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list, md5s=subset)
+        assert sub_md5s == subset
+        assert np.array_equal(sub_matrix, matrix[1:3])
+
+    def test_load_hdf5s_matrix_cache_update(
+        self, test_data: EpiAtlasDataset, tmp_path: Path
+    ):
+        """Verify that a cache follows files added to and removed from the hdf5 list."""
+        chroms_file = test_data.datasource.chromsize_file
+        paths = (
+            test_data.datasource.hdf5_file.read_text(encoding="utf-8")
+            .strip()
+            .splitlines()
+        )
+        hdf5_list = tmp_path / "hdf5s.list"
+
+        for selected_paths in [paths[:-2], paths, paths[1:]]:
+            hdf5_list.write_text("\n".join(selected_paths) + "\n", encoding="utf-8")
+
+            matrix, md5s = Hdf5Loader(chroms_file, True).load_hdf5s_matrix(hdf5_list)
+            hdf5_loader = Hdf5Loader(chroms_file, True, cache_dir=tmp_path / "cache")
+            cached_matrix, cached_md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+
+            assert cached_md5s == md5s
+            assert np.array_equal(cached_matrix, matrix)
+
+    @pytest.mark.parametrize("normalization", [True, False])
+    def test_load_hdf5s_bin_indexes(
+        self, test_data: EpiAtlasDataset, normalization: bool
+    ):
+        """Verify that selected bins are the same values as in the whole signals."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        signals = Hdf5Loader(chroms_file, normalization).load_hdf5s(hdf5_list).signals
+        signal_size = next(iter(signals.values())).size
+        bin_indexes = [signal_size - 1, 0, 3, 3, signal_size // 2]
+
+        hdf5_loader = Hdf5Loader(chroms_file, normalization, bin_indexes=bin_indexes)
+        matrix, md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+
+        assert matrix.shape == (len(signals), len(bin_indexes))
+        for md5, row in zip(md5s, matrix):
+            assert np.allclose(row, signals[md5][bin_indexes])
+
+    @pytest.mark.parametrize("mask_mode", ["zero", "drop"])
+    def test_load_hdf5s_mask(self, test_data: EpiAtlasDataset, mask_mode: str):
+        """Verify that masked bins are zeroed or dropped before normalization."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        raw_signals = Hdf5Loader(chroms_file, False).load_hdf5s(hdf5_list).signals
+        signal_size = next(iter(raw_signals.values())).size
+        mask = np.zeros(signal_size, dtype=bool)
+        mask[::3] = True
+
+        hdf5_loader = Hdf5Loader(chroms_file, True, mask=mask, mask_mode=mask_mode)
+        matrix, md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+
+        for md5, row in zip(md5s, matrix):
+            expected = raw_signals[md5].astype(np.float64)
+            if mask_mode == "zero":
+                expected[mask] = 0
+            else:
+                expected = expected[~mask]
+            expected = (expected - expected.mean()) / expected.std()
+            assert np.allclose(row, expected, atol=1e-5)
+
+    @pytest.mark.parametrize("downsampling", ["mean", "sum", "max"])
+    def test_load_hdf5s_resolution(self, test_data: EpiAtlasDataset, downsampling: str):
+        """Verify that chromosomes are reduced by blocks of bins, with partial last blocks."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+        resolution = test_data.datasource.hdf5_resolution()
+        factor = 3
+
+        hdf5_loader = Hdf5Loader(
+            chroms_file, False, resolution=resolution * factor, downsampling=downsampling
+        )
+        matrix, md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+
+        chroms = Hdf5Loader.load_chroms(chroms_file)
+        files = Hdf5Loader.read_list(hdf5_list)
+        reduce = getattr(np, downsampling)
+        for md5, row in zip(md5s, matrix):
+            with h5py.File(files[md5], "r") as f:
+                hdf5_data = f[list(f.keys())[0]]
+                expected = [
+                    reduce(signal[i : i + factor])
+                    for signal in (hdf5_data[chrom][...] for chrom in chroms)
+                    for i in range(0, signal.shape[0], factor)
+                ]
+            assert np.allclose(row, expected)
+
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_load_hdf5s_matrix_dtype(
+        self, test_data: EpiAtlasDataset, dtype: str, tmp_path: Path
+    ):
+        """Verify that reduced precision signals are close to float32 signals, also when cached."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        matrix, md5s = Hdf5Loader(chroms_file, True).load_hdf5s_matrix(hdf5_list)
+        max_values = np.abs(matrix).max(axis=1)
+
+        for cache_dir in [None, tmp_path, tmp_path]:
+            hdf5_loader = Hdf5Loader(chroms_file, True, cache_dir=cache_dir, dtype=dtype)
+            reduced, reduced_md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+
+            assert reduced_md5s == md5s
+            errors = max_errors(matrix, reduced)
+            assert np.all(errors <= max_values * (1e-3 if dtype == "float16" else 4e-3))
+
+            # the signals dict is always float32
+            signals = hdf5_loader.load_hdf5s(hdf5_list).signals
+            assert all(signal.dtype == np.float32 for signal in signals.values())
+
+    @pytest.mark.parametrize("factor", [None, 3])
+    def test_load_hdf5s_chrom_jobs(self, test_data: EpiAtlasDataset, factor: int | None):
+        """Verify that reading chromosomes concurrently gives the same signals."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+        resolution = None
+        if factor is not None:
+            resolution = test_data.datasource.hdf5_resolution() * factor
+
+        hdf5_loader = Hdf5Loader(chroms_file, True, resolution=resolution)
+        matrix, md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+
+        hdf5_loader = Hdf5Loader(chroms_file, True, resolution=resolution, chrom_jobs=4)
+        concurrent_matrix, concurrent_md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+        signals = hdf5_loader.load_hdf5s(hdf5_list).signals
+
+        assert concurrent_md5s == md5s
+        assert np.array_equal(concurrent_matrix, matrix)
+        for i, md5 in enumerate(md5s):
+            assert np.array_equal(signals[md5], matrix[i])
+
+    @pytest.mark.parametrize("chrom_jobs", [1, 3])
+    def test_load_hdf5s_contiguous_float32(
+        self, tmp_path: Path, chrom_jobs: int, monkeypatch
+    ):
+        """Verify that contiguous float32 datasets give the signals read by h5py,
+        and that only concurrent reads use their file offsets."""
+        chroms = {"chr1": 3000, "chr2": 2000, "chr3": 1000}
+        chroms_file = tmp_path / "chroms.sizes"
+        chroms_file.write_text(
+            "".join(f"{chrom}\t{size}\n" for chrom, size in chroms.items())
+        )
+
+        rng = np.random.default_rng(42)
+        hdf5_files = []
+        for i in range(3):
+            md5 = f"{i:032x}"
+            hdf5_file = tmp_path / f"{md5}_1kb_all_none_value.hdf5"
+            with h5py.File(hdf5_file, "w") as file:
+                file.attrs["bin"] = [1000]
+                group = file.create_group(md5)
+                for chrom, size in chroms.items():
+                    group.create_dataset(
+                        chrom, data=rng.random(size // 100, dtype=np.float32)
+                    )
+            hdf5_files.append(hdf5_file)
+        hdf5_list = tmp_path / "hdf5s.list"
+        hdf5_list.write_text("".join(f"{hdf5_file}\n" for hdf5_file in hdf5_files))
+
+        if chrom_jobs == 1:
+            monkeypatch.setattr("epi_ml.core.hdf5_chroms.read_direct", None)
+
+        hdf5_loader = Hdf5Loader(chroms_file, False, chrom_jobs=chrom_jobs)
+        signals = hdf5_loader.load_hdf5s(hdf5_list, strict=True).signals
+
+        for i, hdf5_file in enumerate(hdf5_files):
+            md5 = f"{i:032x}"
+            with h5py.File(hdf5_file, "r") as file:
+                assert file[md5]["chr1"].chunks is None
+                expected = np.concatenate([file[md5][chrom][:] for chrom in chroms])
+            assert signals[md5].dtype == np.float32
+            assert np.array_equal(signals[md5], expected)
+
+    def test_load_hdf5s_memory_cache(self, test_data: EpiAtlasDataset):
+        """Verify that signals loaded again come from the memory cache."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        signals = Hdf5Loader(chroms_file, True).load_hdf5s(hdf5_list).signals
+        md5s = list(signals.keys())
+
+        memory_cache = SignalMemoryCache("1G")
+        first = (
+            Hdf5Loader(chroms_file, True, memory_cache=memory_cache)
+            .load_hdf5s(hdf5_list)
+            .signals
+        )
+        second = (
+            Hdf5Loader(chroms_file, True, memory_cache=memory_cache)
+            .load_hdf5s(hdf5_list, md5s=md5s[::2][::-1])
+            .signals
+        )
+
+        assert list(first.keys()) == md5s
+        assert list(second.keys()) == md5s[::2]
+        for md5, signal in second.items():
+            assert signal is first[md5]
+            assert np.array_equal(signal, signals[md5])
+        assert len(memory_cache) == len(md5s)
+
+        raw = (
+            Hdf5Loader(chroms_file, False, memory_cache=memory_cache)
+            .load_hdf5s(hdf5_list)
+            .signals
+        )
+        assert not np.array_equal(raw[md5s[0]], signals[md5s[0]])
+
+    @pytest.mark.parametrize("dtype", ["float32", "float16"])
+    def test_load_hdf5s_matrix_memory_cache(
+        self, test_data: EpiAtlasDataset, dtype: str, monkeypatch
+    ):
+        """Verify that matrix rows are copied from the memory cache, and fill it."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        matrix, md5s = Hdf5Loader(chroms_file, True, dtype=dtype).load_hdf5s_matrix(
+            hdf5_list
+        )
+        other_dtype = "int8" if dtype == "float32" else "float32"
+        other_matrix, _ = Hdf5Loader(
+            chroms_file, True, dtype=other_dtype
+        ).load_hdf5s_matrix(hdf5_list)
+
+        memory_cache = SignalMemoryCache("1G")
+        hdf5_loader = Hdf5Loader(
+            chroms_file, True, dtype=dtype, memory_cache=memory_cache
+        )
+        some, some_md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list, md5s=md5s[1::2])
+        assert some_md5s == md5s[1::2]
+        assert np.array_equal(some, matrix[1::2])
+        assert len(memory_cache) == len(some_md5s)
+
+        # cached rows are interleaved with loaded rows, in list order
+        all_rows, all_md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+        assert all_md5s == md5s
+        assert np.array_equal(all_rows, matrix)
+        assert len(memory_cache) == len(md5s)
+
+        def fail(*args):
+            raise AssertionError("Signal read instead of taken from memory cache.")
+
+        monkeypatch.setattr(Hdf5Loader, "_read_into", fail)
+        monkeypatch.setattr(Hdf5Loader, "_load_file", fail)
+        cached, cached_md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list, strict=True)
+        assert cached_md5s == md5s
+        assert np.array_equal(cached, matrix)
+
+        # float32 signals are cached once, for every dtype
+        other, _ = Hdf5Loader(
+            chroms_file, True, dtype=other_dtype, memory_cache=memory_cache
+        ).load_hdf5s_matrix(hdf5_list, strict=True)
+        assert np.array_equal(np.asarray(other), np.asarray(other_matrix))
+        assert len(memory_cache) == len(md5s)
+
+    @pytest.mark.parametrize("dtype", ["float32", "int8"])
+    def test_load_hdf5s_matrix_shared(self, test_data: EpiAtlasDataset, dtype: str):
+        """Verify that signals loaded in shared memory are pickled without their values."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        hdf5_loader = Hdf5Loader(chroms_file, True, dtype=dtype)
+        matrix, md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+        shared, shared_md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list, shared=True)
+
+        assert shared_md5s == md5s
+        assert is_shared(shared)
+        assert np.array_equal(shared[:], matrix[:])
+        pickled = pickle.dumps(shared)
+        assert len(pickled) < len(pickle.dumps(matrix)) / 2
+        assert np.array_equal(pickle.loads(pickled)[:], matrix[:])
+
+    def test_load_hdf5s_memory_budget(self, test_data: EpiAtlasDataset):
+        """Verify that signals over the memory budget are memory-mapped, or raise MemoryError."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        matrix, md5s = Hdf5Loader(chroms_file, True).load_hdf5s_matrix(hdf5_list)
+        budget = 2 * matrix.nbytes
+
+        hdf5_loader = Hdf5Loader(chroms_file, True, memory_budget=budget)
+        fitting_matrix, _ = hdf5_loader.load_hdf5s_matrix(hdf5_list, copies=0.5)
+        assert not isinstance(fitting_matrix, np.memmap)
+
+        mapped_matrix, mapped_md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list, copies=1.5)
+        assert isinstance(mapped_matrix, np.memmap)
+        assert mapped_md5s == md5s
+        assert np.array_equal(mapped_matrix, matrix)
+
+        with pytest.raises(MemoryError):
+            hdf5_loader.load_hdf5s_matrix(hdf5_list, copies=3)
+
+        hdf5_loader = Hdf5Loader(
+            chroms_file, True, memory_budget=budget, memory_policy="fail"
+        )
+        with pytest.raises(MemoryError):
+            hdf5_loader.load_hdf5s(hdf5_list, copies=1.5)
+
+    @pytest.mark.parametrize("n_jobs", [1, 3])
+    def test_load_hdf5s_matrix_staged(
+        self, test_data: EpiAtlasDataset, n_jobs: int, tmp_path: Path
+    ):
+        """Verify that staged files give the same signals, and are left in the stage directory."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        matrix, md5s = Hdf5Loader(chroms_file, True).load_hdf5s_matrix(hdf5_list)
+
+        hdf5_loader = Hdf5Loader(chroms_file, True, n_jobs=n_jobs, stage_dir=tmp_path)
+        staged, staged_md5s = hdf5_loader.load_hdf5s_matrix(hdf5_list)
+
+        assert staged_md5s == md5s
+        assert np.array_equal(staged, matrix)
+        for md5 in md5s:
+            assert (tmp_path / hdf5_loader.loaded_files[md5].name).is_file()
+
+    def test_load_hdf5s_staged_twice(
+        self, test_data: EpiAtlasDataset, tmp_path: Path, monkeypatch
+    ):
+        """Verify that files staged in $SLURM_TMPDIR/hdf5s by a first load
+        are not taken as the sources of the next loads."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        signals = Hdf5Loader(chroms_file, True).load_hdf5s(hdf5_list).signals
+        md5s = list(signals.keys())
+
+        monkeypatch.setenv("SLURM_TMPDIR", str(tmp_path))
+        hdf5_loader = Hdf5Loader(chroms_file, True, stage_dir=tmp_path / "hdf5s")
+        for some_md5s in [md5s[:3], md5s[3:]]:
+            staged = hdf5_loader.load_hdf5s(
+                hdf5_list, md5s=some_md5s, strict=True
+            ).signals
+            assert list(staged.keys()) == some_md5s
+            for md5 in some_md5s:
+                assert np.array_equal(staged[md5], signals[md5])
+
+    @pytest.mark.parametrize("normalization", ["zscore", "log1p_zscore", "robust"])
+    def test_normalizations(self, test_data: EpiAtlasDataset, normalization: str):
+        """Verify that in place normalizations match their definition."""
+        chroms_file = test_data.datasource.chromsize_file
+        hdf5_list = test_data.datasource.hdf5_file
+
+        raw_signals = Hdf5Loader(chroms_file, False).load_hdf5s(hdf5_list).signals
+        signals = Hdf5Loader(chroms_file, normalization).load_hdf5s(hdf5_list).signals
+
+        for md5, raw_signal in raw_signals.items():
+            expected = raw_signal.astype(np.float64)
+            if normalization == "log1p_zscore":
+                expected = np.log1p(expected)
+            if normalization == "robust":
+                median = np.median(expected)
+                expected = (expected - median) / (
+                    1.4826 * np.median(np.abs(expected - median))
+                )
+            else:
+                expected = (expected - expected.mean()) / expected.std()
+            assert np.allclose(signals[md5], expected, atol=1e-5)
+
     def test_load_hdf5_corrupted(self, test_data: EpiAtlasDataset):
         """Verify that file corruption errors are caught/raised."""
         hdf5_list = Hdf5Loader.read_list(test_data.datasource.hdf5_file)
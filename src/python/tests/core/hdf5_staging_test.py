@@ -0,0 +1,98 @@
+"""Test module for Hdf5Stager."""
+from __future__ import annotations
+
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from epi_ml.core.hdf5_staging import Hdf5Stager
+
+
+@pytest.fixture(name="source_files")
+def fixture_source_files(tmp_path: Path) -> dict:
+    """Return {md5:path} of small source files."""
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    files = {}
+    for i, letter in enumerate("abcde"):
+        path = source_dir / f"md5{letter}_100kb_all_none_value.hdf5"
+        path.write_bytes(bytes([i]) * (1000 * (i + 1)))
+        files[f"md5{letter}"] = path
+    return files
+
+
+def test_stage_copies(source_files: dict, tmp_path: Path):
+    """Verify that files are copied once, with their content."""
+    stage_dir = tmp_path / "stage"
+    with Hdf5Stager(stage_dir, n_jobs=2) as stager:
+        staged = stager.stage({**source_files, "same": source_files["md5a"]})
+        assert staged["same"] is staged["md5a"]
+        for md5, source in source_files.items():
+            assert staged[md5].result().read_bytes() == source.read_bytes()
+
+        mtime = staged["md5a"].result().stat().st_mtime_ns
+        restaged = stager.stage({"md5a": source_files["md5a"]})["md5a"].result()
+        assert restaged.stat().st_mtime_ns == mtime
+
+    assert sorted(path.name for path in stage_dir.iterdir()) == sorted(
+        path.name for path in source_files.values()
+    )
+
+
+def test_stage_archive(source_files: dict, tmp_path: Path):
+    """Verify that files are extracted from an archive, and missing ones raise OSError."""
+    archive = tmp_path / "hdf5s.tar.gz"
+    with tarfile.open(archive, "w:gz") as tar:
+        for path in list(source_files.values())[:-1]:
+            tar.add(path, arcname=f"hdf5s/{path.name}")
+
+    with Hdf5Stager(tmp_path / "stage", archive=archive) as stager:
+        staged = stager.stage(source_files)
+        for md5, source in list(source_files.items())[:-1]:
+            assert staged[md5].result().read_bytes() == source.read_bytes()
+        with pytest.raises(OSError):
+            staged["md5e"].result()
+
+
+def test_stage_changed_source(source_files: dict, tmp_path: Path):
+    """Verify that a staged file is copied again when its source changes, even with the same size."""
+    source = source_files["md5a"]
+    with Hdf5Stager(tmp_path / "stage") as stager:
+        staged = stager.stage({"md5a": source})["md5a"].result()
+        assert staged.stat().st_mtime_ns == source.stat().st_mtime_ns
+
+        source.write_bytes(b"z" * source.stat().st_size)
+        os.utime(source, ns=(0, staged.stat().st_mtime_ns + 10**9))
+        restaged = stager.stage({"md5a": source})["md5a"].result()
+        assert restaged.read_bytes() == source.read_bytes()
+
+
+def test_stage_archive_once(source_files: dict, tmp_path: Path, monkeypatch):
+    """Verify that files are extracted again only when the archive changes."""
+    archive = tmp_path / "hdf5s.tar"
+    source = source_files["md5a"]
+
+    def make_archive(mtime_ns: int) -> None:
+        with tarfile.open(archive, "w") as tar:
+            tar.add(source, arcname=source.name)
+        os.utime(archive, ns=(0, mtime_ns))
+
+    make_archive(10**18)
+    with Hdf5Stager(tmp_path / "stage", archive=archive) as stager:
+        staged = stager.stage({"md5a": source})["md5a"].result()
+
+    def fail(*args):
+        raise AssertionError("File extracted again from an unchanged archive.")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Hdf5Stager, "_extract_member", fail)
+        with Hdf5Stager(tmp_path / "stage", archive=archive) as stager:
+            assert stager.stage({"md5a": source})["md5a"].result() == staged
+
+    source.write_bytes(b"z" * source.stat().st_size)
+    make_archive(2 * 10**18)
+    with Hdf5Stager(tmp_path / "stage", archive=archive) as stager:
+        restaged = stager.stage({"md5a": source})["md5a"].result()
+        assert restaged.read_bytes() == source.read_bytes()
@@ -0,0 +1,82 @@
+"""Test module for memory_planner."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from epi_ml.core.memory_planner import (
+    MEMORY_FRACTION,
+    MemoryPlan,
+    max_workers,
+    memory_budget,
+    oversampling_ratio,
+    spill_matrix,
+)
+
+MEMORY_VARIABLES = [
+    "HDF5_MEMORY_BUDGET",
+    "SLURM_MEM_PER_NODE",
+    "SLURM_MEM_PER_CPU",
+    "SLURM_CPUS_ON_NODE",
+]
+
+
+@pytest.mark.parametrize(
+    "variables,expected",
+    [
+        ({}, None),
+        ({"SLURM_MEM_PER_NODE": "1000"}, int(1000 * 2**20 * MEMORY_FRACTION)),
+        ({"SLURM_MEM_PER_NODE": "0"}, None),
+        (
+            {"SLURM_MEM_PER_CPU": "2G", "SLURM_CPUS_ON_NODE": "4"},
+            int(8 * 2**30 * MEMORY_FRACTION),
+        ),
+        ({"HDF5_MEMORY_BUDGET": "3G", "SLURM_MEM_PER_NODE": "1000"}, 3 * 2**30),
+    ],
+)
+def test_memory_budget(monkeypatch, variables: dict, expected: int | None):
+    """Verify that the budget comes from $HDF5_MEMORY_BUDGET, else from SLURM."""
+    for name in MEMORY_VARIABLES:
+        monkeypatch.delenv(name, raising=False)
+    for name, value in variables.items():
+        monkeypatch.setenv(name, value)
+    assert memory_budget() == expected
+
+
+def test_memory_plan():
+    """Verify peak memory estimates, with and without memory mapping."""
+    plan = MemoryPlan(10, 100, "float32", copies=1.5, budget=3000)
+    assert plan.matrix_bytes == 4000
+    assert plan.peak_bytes() == 10000
+    assert plan.peak_bytes(mapped=True) == 6000
+    assert not plan.fits() and not plan.fits(mapped=True)
+
+    int8_plan = MemoryPlan(10, 100, "int8", budget=2000)
+    assert int8_plan.matrix_bytes == 1040
+    assert int8_plan.fits()
+    assert MemoryPlan(10, 100, "float32").fits()
+
+
+def test_max_workers():
+    """Verify that workers fit in the budget left by shared memory, at least one."""
+    assert max_workers(100, shared_bytes=200, budget=1000) == 8
+    assert max_workers(100, budget=1050) == 10
+    assert max_workers(2000, shared_bytes=200, budget=1000) == 1
+    assert max_workers(100, shared_bytes=2000, budget=1000) == 1
+    assert max_workers(100) is None
+
+
+def test_oversampling_ratio():
+    """Verify that the ratio gives the size of a dataset with balanced labels."""
+    assert oversampling_ratio(["a", "a", "a", "b"]) == 1.5
+    assert oversampling_ratio([]) == 1.0
+
+
+def test_spill_matrix(monkeypatch, tmp_path):
+    """Verify that spilled matrices are memory-mapped, without leaving files."""
+    monkeypatch.setenv("HDF5_SPILL_DIR", str(tmp_path))
+    matrix = spill_matrix((3, 5), np.float16)
+    matrix[:] = 2
+    assert isinstance(matrix, np.memmap)
+    assert matrix.dtype == np.float16 and np.all(matrix == 2)
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,73 @@
+"""Test module for MetadataCache."""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from epi_ml.core.metadata import Metadata
+from epi_ml.core.metadata_cache import MetadataCache
+
+
+@pytest.fixture(name="json_path")
+def fixture_json_path(tmp_path: Path, monkeypatch) -> Path:
+    """Return the path of a small epigeec json metadata file."""
+    monkeypatch.delenv("METADATA_CACHE", raising=False)
+    monkeypatch.delenv("METADATA_CACHE_DIR", raising=False)
+    datasets = [
+        {"md5sum": f"{i:032d}", "assay": ["h3k4me3", "h3k27ac"][i % 2]} for i in range(4)
+    ]
+    path = tmp_path / "metadata.json"
+    path.write_text(json.dumps({"datasets": datasets, "version": 1}), encoding="utf-8")
+    return path
+
+
+def test_cache_created_and_used(json_path: Path):
+    """Test that the cache is created on first load and gives the same metadata."""
+    cache = MetadataCache(json_path)
+    assert not cache.path.exists()
+
+    meta = Metadata(json_path)
+    assert cache.path.exists()
+    assert cache.load() == (
+        {"version": 1},
+        meta._metadata,
+    )  # pylint: disable=protected-access
+
+    cached_meta = Metadata(json_path)
+    assert cached_meta == meta
+
+
+def test_cache_validation(json_path: Path):
+    """Test that a modified json invalidates the cache, but a touched one does not."""
+    Metadata(json_path)
+    cache = MetadataCache(json_path)
+
+    stat = json_path.stat()
+    os.utime(json_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.load() is not None
+
+    content = json.loads(json_path.read_text(encoding="utf-8"))
+    content["datasets"][0]["assay"] = "h3k9me3"
+    json_path.write_text(json.dumps(content), encoding="utf-8")
+    assert cache.load() is None
+    assert Metadata(json_path)["0" * 32]["assay"] == "h3k9me3"
+
+    cache.path.write_bytes(b"not marshal")
+    assert cache.load() is None
+    assert len(Metadata(json_path)) == 4
+
+
+def test_cache_dir(json_path: Path, tmp_path: Path, monkeypatch):
+    """Test the cache directory and disabling through environment variables."""
+    monkeypatch.setenv("METADATA_CACHE_DIR", str(tmp_path / "caches"))
+    Metadata(json_path)
+    assert len(list((tmp_path / "caches").iterdir())) == 1
+    assert not json_path.with_name(json_path.name + ".marshal").exists()
+
+    monkeypatch.setenv("METADATA_CACHE", "0")
+    monkeypatch.setenv("METADATA_CACHE_DIR", str(tmp_path / "other"))
+    Metadata(json_path)
+    assert not (tmp_path / "other").exists()
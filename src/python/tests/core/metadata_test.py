@@ -1,7 +1,11 @@
 """Test module for metadata module."""
 from __future__ import annotations
 
+import copy
+import json
+import marshal
 import os
+import pickle
 import tempfile
 
 import pytest
@@ -85,3 +89,149 @@ def test_save_load_marshal(test_meta: UUIDMetadata):
         assert len(meta) == len(test_meta)
 
     os.remove(meta_save_file.name)
+
+
+@pytest.fixture(name="small_meta")
+def fixture_small_meta() -> UUIDMetadata:
+    """Return a small metadata with two assays."""
+    datasets = {}
+    for i in range(6):
+        md5 = f"{i:032d}"
+        datasets[md5] = {
+            "md5sum": md5,
+            "uuid": f"uuid{i // 2}",
+            "track_type": "raw",
+            ASSAY: ["h3k4me3", "h3k27ac"][i % 2],
+            DONOR_SEX: "female",
+        }
+    return UUIDMetadata.from_dict(datasets)
+
+
+def test_copy_on_write(small_meta: UUIDMetadata):
+    """Test that copies share datasets until one of them modifies a dataset."""
+    md5s = sorted(small_meta.md5s)
+    view = small_meta.copy(md5s=md5s[:4] + ["unknown"])
+    assert isinstance(view, UUIDMetadata)
+    assert list(view.md5s) == md5s[:4]
+    assert view[md5s[0]] == small_meta[md5s[0]]
+
+    view[md5s[0]][DONOR_SEX] = "male"
+    view.convert_classes(ASSAY, {"h3k27ac": "h3k27ac_merged"})
+    assert view[md5s[0]][DONOR_SEX] == "male"
+    assert view.label_counter(ASSAY)["h3k27ac_merged"] == 2
+    assert small_meta[md5s[0]][DONOR_SEX] == "female"
+    assert small_meta.label_counter(ASSAY)["h3k27ac"] == 3
+
+    small_meta[md5s[2]][DONOR_SEX] = "male"
+    assert view[md5s[2]][DONOR_SEX] == "female"
+
+    view.select_category_subsets(ASSAY, ["h3k4me3"])
+    assert len(view) == 2
+    assert len(small_meta) == 6
+
+
+def test_copy_datasets_are_dicts(small_meta: UUIDMetadata):
+    """Test that datasets of copies are plain dicts for callers, also once written."""
+    md5s = sorted(small_meta.md5s)
+    view = small_meta.copy()
+
+    dataset = view[md5s[0]]
+    assert isinstance(dataset, dict)
+    assert all(isinstance(dset, dict) for dset in view.datasets)
+    assert json.loads(json.dumps(dataset)) == small_meta[md5s[0]]
+    # marshal only takes plain dicts
+    assert marshal.loads(marshal.dumps(pickle.loads(pickle.dumps(dataset)))) == dataset
+    copied = copy.deepcopy(dict(view.items))
+    assert marshal.loads(marshal.dumps(copied)) == dict(small_meta.items)
+
+    dataset.update({DONOR_SEX: "male"})
+    dataset.pop("track_type")
+    assert view[md5s[0]] == dataset
+    assert small_meta[md5s[0]][DONOR_SEX] == "female"
+    assert "track_type" in small_meta[md5s[0]]
+
+    view[md5s[1]] = small_meta.copy()[md5s[1]]
+    view[md5s[1]][DONOR_SEX] = "male"
+    assert small_meta[md5s[1]][DONOR_SEX] == "female"
+
+
+def test_copy_write_handles(small_meta: UUIDMetadata):
+    """Test that writes through two handles of a shared dataset are all kept,
+    and that nested values are not shared between copies."""
+    md5s = sorted(small_meta.md5s)
+    small_meta[md5s[1]]["tags"] = ["a"]
+    view = small_meta.copy()
+
+    first, second = view[md5s[0]], view[md5s[0]]
+    first[DONOR_SEX] = "male"
+    second["age"] = "adult"
+    first.pop("track_type")
+    view.convert_classes(ASSAY, {"h3k4me3": "h3k4me3_merged"})
+    for dataset in (first, second, view[md5s[0]], view.copy()[md5s[0]]):
+        assert dataset[DONOR_SEX] == "male" and dataset["age"] == "adult"
+        assert dataset[ASSAY] == "h3k4me3_merged" and "track_type" not in dataset
+    assert small_meta[md5s[0]][DONOR_SEX] == "female"
+    assert "age" not in small_meta[md5s[0]]
+
+    view[md5s[1]]["tags"].append("b")
+    assert view[md5s[1]]["tags"] == ["a", "b"]
+    assert small_meta[md5s[1]]["tags"] == ["a"]
+
+
+def test_remove_small_classes_uuid(small_meta: UUIDMetadata):
+    """Test that all tracks of the uuids of small classes are removed,
+    also tracks of other classes and tracks of the same type."""
+    md5s = sorted(small_meta.md5s)
+    small_meta[md5s[0]].update({"track_type": "ctl_raw", ASSAY: "input"})
+    small_meta[md5s[3]][ASSAY] = "h3k9me3"  # uuid1 also has a h3k4me3 track
+    small_meta[md5s[4]][ASSAY] = "h3k36me3"  # uuid2 has two raw tracks
+
+    small_meta.remove_small_classes(2, ASSAY, verbose=False)
+    assert sorted(small_meta.md5s) == [md5s[0], md5s[1]]
+    assert small_meta.uuid_per_class(ASSAY) == {
+        "input": {"uuid0_ctl"},
+        "h3k27ac": {"uuid0"},
+    }
+
+
+def test_copy_save(small_meta: UUIDMetadata, tmp_path):
+    """Test that a copy saves the same content as a deep copy."""
+    view = small_meta.copy()
+    view.save(tmp_path / "view.json")
+    small_meta.save(tmp_path / "meta.json")
+    assert (tmp_path / "view.json").read_text() == (tmp_path / "meta.json").read_text()
+    assert view.to_df().equals(small_meta.to_df())
+
+
+def test_index_follows_changes(small_meta: UUIDMetadata):
+    """Test that counting and grouping see changes made after a first count."""
+    assert small_meta.label_counter(ASSAY) == {"h3k4me3": 3, "h3k27ac": 3}
+    md5s = small_meta.md5_per_class(ASSAY)["h3k27ac"]
+    assert md5s == sorted(md5s)
+
+    small_meta[md5s[0]][ASSAY] = "h3k4me3"
+    del small_meta[md5s[1]]
+    assert small_meta.label_counter(ASSAY) == {"h3k4me3": 4, "h3k27ac": 1}
+    assert small_meta.md5_per_class(ASSAY)["h3k27ac"] == md5s[2:]
+    assert small_meta.uuid_per_class(ASSAY) == {
+        "h3k4me3": {"uuid0", "uuid1", "uuid2"},
+        "h3k27ac": {"uuid2"},
+    }
+
+    small_meta.remove_small_classes(2, ASSAY)
+    assert small_meta.unique_classes(ASSAY) == ["h3k4me3"]
+    assert len(small_meta) == 3
+
+
+def test_index_kept_by_reads(small_meta: UUIDMetadata):
+    """Test that reading datasets does not rebuild the index of per-class queries."""
+    # pylint: disable=protected-access
+    md5s = small_meta.md5_per_class(ASSAY)["h3k27ac"]
+    index = small_meta._index
+    codes = small_meta._column(ASSAY)[1]
+
+    assert small_meta[md5s[0]][ASSAY] == "h3k27ac"
+    assert small_meta.get(md5s[1])[DONOR_SEX] == "female"  # type: ignore
+    assert small_meta.md5_per_class(ASSAY)["h3k27ac"] == md5s
+    assert small_meta._index is index
+    assert small_meta._column(ASSAY)[1] is codes
@@ -0,0 +1,44 @@
+"""Test module for quantization file."""
+from __future__ import annotations
+
+import numpy as np
+
+from epi_ml.core.quantization import QuantizedSignals, max_errors, quantize
+
+
+def test_quantize_error():
+    """Verify that int8 values with a scale per row are within half a scale step."""
+    signals = np.random.default_rng(42).normal(size=(5, 1000)).astype(np.float32)
+    signals[2] = 0
+
+    quantized = QuantizedSignals.from_float(signals)
+
+    assert quantized.values.dtype == np.int8
+    assert quantized.scales[2] == 1
+    assert np.all(max_errors(signals, quantized) <= quantized.scales / 2 + 1e-6)
+
+
+def test_quantized_rows():
+    """Verify that indexing widens rows and np.take keeps them quantized."""
+    signals = np.random.default_rng(42).normal(size=(4, 10)).astype(np.float32)
+    quantized = QuantizedSignals.from_float(signals)
+    widened = np.asarray(quantized)
+
+    assert widened.dtype == np.float32
+    assert quantized.size == widened.size
+    assert np.array_equal(quantized[1], widened[1])
+    assert np.array_equal(quantized[[3, 0]], widened[[3, 0]])
+
+    subset = np.take(quantized, [3, 0], axis=0)
+    assert isinstance(subset, QuantizedSignals)
+    assert np.array_equal(np.asarray(subset), widened[[3, 0]])
+
+    quantized[0] = signals[3]
+    assert np.array_equal(quantized[0], widened[3])
+
+
+def test_quantize_one_signal():
+    """Verify that a single signal gets a single scale."""
+    values, scale = quantize(np.array([1.0, -2.0, 0.5], dtype=np.float32))
+    assert values.tolist() == [64, -127, 32]
+    assert np.isclose(scale, 2 / 127)
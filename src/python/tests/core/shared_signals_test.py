@@ -0,0 +1,92 @@
+"""Test shared_signals module."""
+from __future__ import annotations
+
+import gc
+import multiprocessing as mp
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from epi_ml.core.quantization import QuantizedSignals
+from epi_ml.core.shared_signals import SharedMatrix, share_signals, shared_matrix
+from epi_ml.core.signal_view import SignalView
+
+
+def row_sums(view: SignalView) -> np.ndarray:
+    """Return the sum of each row of a view, in a worker process."""
+    return view[:].sum(axis=1)
+
+
+@pytest.fixture(name="matrix")
+def fixture_matrix() -> np.ndarray:
+    """Random float32 signals."""
+    return np.random.default_rng(42).random((20, 100), dtype=np.float32)
+
+
+def test_pickle_by_path(matrix, tmp_path):
+    """Test that shared matrices are pickled by path, derived arrays by value."""
+    with share_signals(matrix, directory=str(tmp_path)) as shared:
+        assert isinstance(shared, SharedMatrix)
+        pickled = pickle.dumps(shared, protocol=pickle.HIGHEST_PROTOCOL)
+        assert len(pickled) < matrix.nbytes / 10
+
+        restored = pickle.loads(pickled)
+        assert np.array_equal(restored, matrix)
+        assert not restored.flags.writeable
+
+        taken = pickle.loads(pickle.dumps(np.take(shared, [3, 1], axis=0)))
+        assert np.array_equal(taken, matrix[[3, 1]])
+        sliced = pickle.loads(pickle.dumps(shared[5:]))
+        assert np.array_equal(sliced, matrix[5:])
+
+    assert not os.listdir(tmp_path)
+
+
+def test_share_views(matrix, tmp_path, monkeypatch):
+    """Test that only the rows of index views are copied, and that int8 signals are shared."""
+    view = SignalView(QuantizedSignals.from_float(matrix), [4, 4, 0])
+    with share_signals(view, directory=str(tmp_path)) as shared:
+        assert isinstance(shared.matrix, QuantizedSignals)
+        assert len(os.listdir(tmp_path)) == 2
+        assert len(shared.matrix) == 2
+        assert np.array_equal(shared[:], view[:])
+        assert np.array_equal(pickle.loads(pickle.dumps(shared))[:], view[:])
+
+    monkeypatch.setattr("epi_ml.core.shared_signals.CHUNK_ROWS", 3)
+    view = SignalView(matrix, np.arange(19, -1, -1))
+    with share_signals(view, directory=str(tmp_path)) as shared:
+        assert shared.matrix.shape == matrix.shape
+        assert np.array_equal(shared[:], view[:])
+
+    with share_signals(np.empty((0, 100), dtype=np.float32)) as shared:
+        assert shared.shape == (0, 100)
+
+
+def test_shared_matrix(matrix, tmp_path):
+    """Test that signals loaded in a shared matrix are shared as is, until no longer used."""
+    loaded = shared_matrix(matrix.shape, matrix.dtype, directory=str(tmp_path))
+    loaded[:] = matrix
+    view = SignalView(loaded, [3, 3, 1])
+    with share_signals(view, directory=str(tmp_path)) as shared:
+        assert shared is view
+        assert len(pickle.dumps(shared)) < matrix.nbytes / 10
+    assert len(os.listdir(tmp_path)) == 1
+
+    del loaded, view, shared
+    gc.collect()
+    assert not os.listdir(tmp_path)
+    assert shared_matrix((0, 100), np.float32).shape == (0, 100)
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_pool_workers(matrix, tmp_path, start_method):
+    """Test that worker processes read the shared signals, forked or spawned."""
+    with share_signals(matrix, directory=str(tmp_path)) as shared:
+        views = [SignalView(shared, rows) for rows in ([0, 1], [19, 2, 2])]
+        with mp.get_context(start_method).Pool(processes=2) as pool:
+            sums = pool.map(row_sums, views)
+
+    assert np.allclose(sums[0], matrix[[0, 1]].sum(axis=1))
+    assert np.allclose(sums[1], matrix[[19, 2, 2]].sum(axis=1))
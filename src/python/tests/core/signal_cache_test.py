@@ -0,0 +1,98 @@
+"""Test module for signal_cache file."""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from epi_ml.core.signal_cache import SignalCache
+
+
+class TestSignalCache:
+    """Test class SignalCache"""
+
+    @pytest.fixture(name="files")
+    def files(self, tmp_path: Path):
+        """Return {md5:path} of small files."""
+        files = {}
+        for i in range(3):
+            path = tmp_path / f"md5{i}_test.hdf5"
+            path.write_text(str(i), encoding="utf-8")
+            files[f"md5{i}"] = path
+        return files
+
+    @pytest.fixture(name="cache")
+    def cache(self, tmp_path: Path) -> SignalCache:
+        """Return an empty cache."""
+        return SignalCache(tmp_path / "cache", name="test", key=SignalCache.make_key(a=1))
+
+    def test_save_load(self, cache: SignalCache, files):
+        """Saved rows are loaded back, failed files are the ones without a row."""
+        fingerprints = SignalCache.fingerprint(files)
+        assert cache.load(fingerprints) is None
+
+        matrix = cache.create_matrix((3, 4))
+        matrix[:2] = np.arange(8).reshape(2, 4)
+        cache.save(matrix, ["md5a", "md5c"], {"md5a": [], "md5b": [], "md5c": []})
+        assert cache.load(fingerprints) is None
+
+        matrix = cache.create_matrix((3, 4))
+        matrix[:2] = np.arange(8).reshape(2, 4)
+        cache.save(matrix, ["md50", "md52"], fingerprints)
+
+        loaded_matrix, md5s = cache.load(fingerprints)  # type: ignore
+        assert np.array_equal(loaded_matrix, np.arange(8).reshape(2, 4))
+        assert md5s == ["md50", "md52"]
+        assert cache.read_manifest()["failed"] == ["md51"]  # type: ignore
+        assert sorted(os.listdir(cache.directory)) == ["manifest.json", "signals.npy"]
+
+    def test_stale(self, cache: SignalCache, files):
+        """A modified file or another key invalidates the cache."""
+        fingerprints = SignalCache.fingerprint(files)
+        matrix = cache.create_matrix((3, 2))
+        cache.save(matrix, list(files), fingerprints)
+        assert cache.load(fingerprints) is not None
+
+        other_key = SignalCache(cache.directory.parent, "test", SignalCache.make_key(a=2))
+        assert other_key.load(fingerprints) is None
+
+        files["md50"].write_text("modified", encoding="utf-8")
+        assert cache.load(SignalCache.fingerprint(files)) is None
+
+    def test_copy_on_write(self, cache: SignalCache, files):
+        """Changing a loaded matrix does not change the cache."""
+        fingerprints = SignalCache.fingerprint(files)
+        matrix = cache.create_matrix((3, 2))
+        matrix[:] = 1
+        loaded_matrix = cache.save(matrix, list(files), fingerprints)
+        loaded_matrix[:] = 2
+
+        loaded_matrix, _ = cache.load(fingerprints)  # type: ignore
+        assert np.all(loaded_matrix == 1)
+
+    def test_append(self, cache: SignalCache, files):
+        """Appended rows are added in place, previous readers keep their rows."""
+        first_files = dict(list(files.items())[:1])
+        matrix = cache.create_matrix((1, 4))
+        matrix[:] = 1
+        previous_matrix = cache.save(
+            matrix, list(first_files), cache.fingerprint(first_files)
+        )
+
+        fingerprints = SignalCache.fingerprint(files)
+        new_rows = np.full((2, 4), 2, dtype=np.float32)
+        assert cache.append(new_rows, list(files), fingerprints)
+
+        loaded_matrix, md5s = cache.load(fingerprints)  # type: ignore
+        assert md5s == list(files)
+        assert np.array_equal(loaded_matrix[0], np.ones(4))
+        assert np.array_equal(loaded_matrix[1:], new_rows)
+        assert previous_matrix.shape == (1, 4)
+        assert np.all(previous_matrix == 1)
+
+        assert not cache.append(
+            np.zeros((1, 3), dtype=np.float32), list(files) + ["md5x"], {}
+        )
+        assert cache.load(fingerprints) is not None
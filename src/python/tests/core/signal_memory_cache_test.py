@@ -0,0 +1,44 @@
+"""Test module for SignalMemoryCache."""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from epi_ml.core.signal_memory_cache import SignalMemoryCache, parse_size
+
+
+@pytest.mark.parametrize(
+    "size,expected", [(10, 10), ("10", 10), ("1.5K", 1536), ("512mb", 512 * 2**20)]
+)
+def test_parse_size(size, expected: int):
+    """Verify that sizes with units are converted to bytes."""
+    assert parse_size(size) == expected
+
+
+@pytest.mark.parametrize("size", ["", "G", "ten", "-1"])
+def test_parse_size_invalid(size: str):
+    """Verify that invalid sizes raise ValueError."""
+    with pytest.raises(ValueError):
+        parse_size(size)
+
+
+def test_least_recently_used_eviction():
+    """Verify that the least recently used signals are evicted to stay in the budget."""
+    signals = {key: np.full(10, i, dtype=np.float32) for i, key in enumerate("abc")}
+    cache = SignalMemoryCache(2 * signals["a"].nbytes)
+
+    cache.put("a", signals["a"])
+    cache.put("b", signals["b"])
+    assert cache.get("a") is signals["a"]
+    cache.put("c", signals["c"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is signals["a"] and cache.get("c") is signals["c"]
+    assert cache.nbytes == 2 * signals["a"].nbytes
+    assert not signals["a"].flags.writeable
+
+    cache.put("too big", np.zeros(100, dtype=np.float32))
+    assert len(cache) == 2
+
+    cache.max_bytes = signals["a"].nbytes
+    assert len(cache) == 1 and cache.get("c") is not None
@@ -0,0 +1,60 @@
+"""Test thread_budget module."""
+from __future__ import annotations
+
+import os
+
+import pytest
+from threadpoolctl import threadpool_info, threadpool_limits
+
+from epi_ml.core.thread_budget import THREAD_ENV_VARS, ThreadBudget, available_cpus
+
+
+@pytest.mark.parametrize(
+    "n_tasks,n_cpus,max_workers,expected",
+    [
+        (10, 48, None, (10, 4)),
+        (10, 8, None, (8, 1)),
+        (3, 48, None, (3, 16)),
+        (10, 48, 2, (2, 24)),
+        (1, 1, None, (1, 1)),
+    ],
+)
+def test_split(n_tasks, n_cpus, max_workers, expected):
+    """Test the split of cpus between workers and threads."""
+    budget = ThreadBudget(n_tasks, n_cpus=n_cpus, max_workers=max_workers)
+    assert (budget.n_workers, budget.n_threads) == expected
+    assert budget.n_workers * budget.n_threads <= n_cpus
+
+
+def test_invalid():
+    """Test that numbers smaller than 1 are refused."""
+    with pytest.raises(ValueError):
+        ThreadBudget(0, n_cpus=4)
+    with pytest.raises(ValueError):
+        ThreadBudget(4, n_cpus=4, max_workers=0)
+
+
+def test_available_cpus(monkeypatch):
+    """Test that $CPU_BUDGET overrides the cpus of the process."""
+    monkeypatch.delenv("CPU_BUDGET", raising=False)
+    assert available_cpus() >= 1
+
+    monkeypatch.setenv("CPU_BUDGET", "6")
+    assert available_cpus() == 6
+    assert ThreadBudget(4).n_workers == 4
+
+    monkeypatch.setenv("CPU_BUDGET", "0")
+    with pytest.raises(ValueError):
+        available_cpus()
+
+
+def test_apply(monkeypatch):
+    """Test that apply limits the thread pools and sets the environment variables."""
+    for var in THREAD_ENV_VARS:
+        monkeypatch.delenv(var, raising=False)
+
+    with threadpool_limits(limits=None):  # restores the limits on exit
+        ThreadBudget(4, n_cpus=8).apply()
+        assert all(pool["num_threads"] == 2 for pool in threadpool_info())
+
+    assert all(os.environ[var] == "2" for var in THREAD_ENV_VARS)
@@ -0,0 +1,38 @@
+"""Test module for make_hdf5_bundle."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+
+from epi_ml.core.hdf5_bundle import Hdf5Bundle
+from epi_ml.core.hdf5_loader import Hdf5Loader
+from epi_ml.utils.make_hdf5_bundle import make_bundle
+from tests.epilap_test_data import EpiAtlasTreatmentTestData
+
+
+def test_bundle_replaces_hdf5_list(tmp_path: Path):
+    """Verify that a bundle loads the same signals as its hdf5 list."""
+    datasource = EpiAtlasTreatmentTestData.default_test_data().epiatlas_dataset.datasource
+    chroms_file = datasource.chromsize_file
+    hdf5_list = datasource.hdf5_file
+
+    bundle_path = make_bundle(
+        hdf5_list, chroms_file, tmp_path / "bundle.h5", batch_size=2
+    )
+    assert Hdf5Bundle.is_bundle(bundle_path)
+    assert not Hdf5Bundle.is_bundle(hdf5_list)
+
+    for normalization in [True, False]:
+        matrix, md5s = Hdf5Loader(chroms_file, normalization).load_hdf5s_matrix(hdf5_list)
+        bundle_matrix, bundle_md5s = Hdf5Loader(
+            chroms_file, normalization
+        ).load_hdf5s_matrix(bundle_path)
+
+        assert bundle_md5s == md5s
+        assert np.array_equal(bundle_matrix, matrix)
+
+    bundle = Hdf5Bundle(bundle_path)
+    mean, std = bundle.stats(md5s[0])
+    assert np.isclose(mean, matrix[0].mean(dtype=np.float64))
+    assert np.isclose(std, matrix[0].std(dtype=np.float64))